@@ -4,7 +4,7 @@ from loam.obsimple import obbool, obnil
 from loam.obnum import int8, unt8, int16, unt16, int32, unt32, int64, unt64, float32, float64, int8c, unt8c, int16c, unt16c, int32c, unt32c, int64c, unt64c, float32c, float64c
 from loam.obvect import v2int8, v2unt8, v2int16, v2unt16, v2int32, v2unt32, v2int64, v2unt64, v2float32, v2float64, v2int8c, v2unt8c, v2int16c, v2unt16c, v2int32c, v2unt32c, v2int64c, v2unt64c, v2float32c, v2float64c, v3int8, v3unt8, v3int16, v3unt16, v3int32, v3unt32, v3int64, v3unt64, v3float32, v3float64, v3int8c, v3unt8c, v3int16c, v3unt16c, v3int32c, v3unt32c, v3int64c, v3unt64c, v3float32c, v3float64c, v4int8, v4unt8, v4int16, v4unt16, v4int32, v4unt32, v4int64, v4unt64, v4float32, v4float64, v4int8c, v4unt8c, v4int16c, v4unt16c, v4int32c, v4unt32c, v4int64c, v4unt64c, v4float32c, v4float64c
 from loam.obmv import mv2int8, mv2unt8, mv2int16, mv2unt16, mv2int32, mv2unt32, mv2int64, mv2unt64, mv2float32, mv2float64, mv3int8, mv3unt8, mv3int16, mv3unt16, mv3int32, mv3unt32, mv3int64, mv3unt64, mv3float32, mv3float64, mv4int8, mv4unt8, mv4int16, mv4unt16, mv4int32, mv4unt32, mv4int64, mv4unt64, mv4float32, mv4float64, mv5int8, mv5unt8, mv5int16, mv5unt16, mv5int32, mv5unt32, mv5int64, mv5unt64, mv5float32, mv5float64
-from loam.numarr import numeric_array
-from loam.obstr import obstring
-from loam.obstruct import obcons, oblist, obmap
+from loam.numarr import numeric_array, frozen_numeric_array
+from loam.obstr import obstring, frozen_obstring
+from loam.obstruct import obcons, oblist, obmap, frozen_oblist, frozen_obmap
 from loam.obtime import obtimestamp
@@ -1,12 +1,35 @@
-from loam.util import make_obnumber
+from loam.util import make_obnumber, cached_slaw, freeze
 from loam.obnum import obnumber
+from loam.exceptions import *
 import struct
 
 class numeric_array(list):
+    """
+    A list of loam numbers, all of the same type (obtype).
+
+    If numpy is available, arrays decoded from slaw (or built from a numpy
+    array) keep their values in a numpy array, and are only turned into a
+    list of loam objects once they are used like a list.  Length, indexing
+    and re-encoding work directly on the numpy array.
+    """
 
     def __init__(self, vals, obtype):
-        list.__init__(self, list(None for x in vals))
+        self.__ndarray = None
+        self.__prefix = ''
         self.__obtype = obtype
+        self.is_signed = obtype.is_signed
+        self.is_float = obtype.is_float
+        self.is_complex = obtype.is_complex
+        self.vtype = obtype.vtype
+        self.bits = obtype.bits
+        self.size = obtype.size
+        numpy = loam.numtype.numpy
+        if numpy is not None and isinstance(vals, numpy.ndarray):
+            dtype = loam.numtype.describe(obtype).dtype()
+            self.__ndarray = vals.astype(dtype.base, copy=False).reshape((-1,) + dtype.shape)
+            list.__init__(self)
+            return
+        list.__init__(self, list(None for x in vals))
         for i in range(len(vals)):
             if isinstance(vals[i], obnumber):
                 if type(vals[i]) != self.__obtype:
@@ -14,14 +37,173 @@ class numeric_array(list):
                 self[i] = vals[i]
             else:
                 self[i] = obtype(vals[i])
-        self.is_signed = obtype.is_signed
-        self.is_float = obtype.is_float
-        self.is_complex = obtype.is_complex
-        self.vtype = obtype.vtype
-        self.bits = obtype.bits
-        self.size = obtype.size
+
+    @classmethod
+    def from_buffer(cls, data, obtype, prefix='', copy=True):
+        """
+        Decodes data, the packed values of an array of obtype as found in a
+        slaw, into a numeric_array.  With numpy this is a single
+        frombuffer(), otherwise a single struct.unpack().  With numpy and
+        copy=False, the array is a view of data itself.
+        """
+        desc = loam.numtype.describe(obtype)
+        numpy = loam.numtype.numpy
+        if numpy is None:
+            return cls(desc.decode_array(data, prefix), obtype)
+        self = cls([], obtype)
+        dtype = desc.dtype(prefix)
+        ## copy out of mmaps / memoryviews so we don't pin them (unless
+        ## asked not to)
+        if copy:
+            data = bytes(data)
+        self.__ndarray = numpy.frombuffer(data, dtype.base).reshape((-1,) + dtype.shape)
+        self.__prefix = prefix
+        return self
+
+    def as_ndarray(self):
+        """
+        Returns the values as a numpy array, or None if numpy is not
+        available.  Arrays decoded from slaw are read-only.
+        """
+        numpy = loam.numtype.numpy
+        if numpy is None:
+            return None
+        if self.__ndarray is not None:
+            return self.__ndarray
+        desc = loam.numtype.describe(self.__obtype)
+        dtype = desc.dtype()
+        return numpy.frombuffer(desc.encode_array(self), dtype.base).reshape((-1,) + dtype.shape)
+
+    def __materialize(self):
+        if self.__ndarray is not None:
+            desc = loam.numtype.describe(self.__obtype)
+            values = desc.decode_array(self.__ndarray.tobytes(), self.__prefix)
+            self.__ndarray = None
+            list.extend(self, values)
+
+    def __packed(self):
+        desc = loam.numtype.describe(self.__obtype)
+        if self.__ndarray is not None:
+            return self.__ndarray.astype(desc.dtype().base, copy=False).tobytes()
+        return desc.encode_array(self)
+
+    def __len__(self):
+        if self.__ndarray is not None:
+            return len(self.__ndarray)
+        return list.__len__(self)
+
+    def __getitem__(self, index):
+        if self.__ndarray is not None and not isinstance(index, slice):
+            n = len(self.__ndarray)
+            if index < 0:
+                index += n
+            if index < 0 or index >= n:
+                raise IndexError("list index out of range")
+            ## slice rather than index, numpy scalars come back in native order
+            desc = loam.numtype.describe(self.__obtype)
+            return desc.decode(self.__ndarray[index:index+1].tobytes(), self.__prefix)
+        self.__materialize()
+        return list.__getitem__(self, index)
+
+    def __iter__(self):
+        self.__materialize()
+        return list.__iter__(self)
+
+    def __reversed__(self):
+        self.__materialize()
+        return list.__reversed__(self)
+
+    def __contains__(self, value):
+        self.__materialize()
+        return list.__contains__(self, value)
+
+    def __eq__(self, other):
+        self.__materialize()
+        if isinstance(other, numeric_array):
+            other.__materialize()
+        return list.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        self.__materialize()
+        return list.__repr__(self)
+
+    def __delitem__(self, index):
+        self.__materialize()
+        list.__delitem__(self, index)
+
+    def __add__(self, other):
+        self.__materialize()
+        return list.__add__(self, list(other))
+
+    def __iadd__(self, other):
+        self.extend(other)
+        return self
+
+    def __mul__(self, n):
+        self.__materialize()
+        return list.__mul__(self, n)
+
+    def __rmul__(self, n):
+        self.__materialize()
+        return list.__rmul__(self, n)
+
+    def __imul__(self, n):
+        self.__materialize()
+        return list.__imul__(self, n)
+
+    def copy(self):
+        if self.__ndarray is not None:
+            return numeric_array(self.__ndarray.copy(), self.__obtype)
+        return numeric_array(list.copy(self), self.__obtype)
+
+    __copy__ = copy
+
+    def __reduce_ex__(self, protocol):
+        ## rebuild from the values, the numpy array is not part of the state
+        return (numeric_array, (list(self), self.__obtype))
+
+    def clear(self):
+        self.__ndarray = None
+        list.clear(self)
+
+    def insert(self, index, value):
+        self.__materialize()
+        if isinstance(value, obnumber):
+            if type(value) != self.__obtype:
+                raise ObInadequateClassException("Can't use %s(%s) in %s array" % (type(value).__name__, value, self.__obtype.__name__))
+        else:
+            value = self.__obtype(value)
+        list.insert(self, index, value)
+
+    def pop(self, *args):
+        self.__materialize()
+        return list.pop(self, *args)
+
+    def remove(self, value):
+        self.__materialize()
+        list.remove(self, value)
+
+    def reverse(self):
+        self.__materialize()
+        list.reverse(self)
+
+    def sort(self, *args, **kwargs):
+        self.__materialize()
+        list.sort(self, *args, **kwargs)
+
+    def index(self, *args):
+        self.__materialize()
+        return list.index(self, *args)
+
+    def count(self, value):
+        self.__materialize()
+        return list.count(self, value)
 
     def __setitem__(self, index, value):
+        self.__materialize()
         if isinstance(value, obnumber):
             if type(value) != self.__obtype:
                 raise ObInadequateClassException("Can't use %s(%s) in %s array" % (type(value).__name__, value, self.__obtype.__name__))
@@ -39,6 +221,7 @@ class numeric_array(list):
         list.__setslice__(self, i, j, values)
 
     def append(self, value):
+        self.__materialize()
         if isinstance(value, obnumber):
             if type(value) != self.__obtype:
                 raise ObInadequateClassException("Can't use %s(%s) in %s array" % (type(value).__name__, value, self.__obtype.__name__))
@@ -47,6 +230,7 @@ class numeric_array(list):
         list.append(self, value)
 
     def extend(self, vals):
+        self.__materialize()
         values = list()
         for val in vals:
             if isinstance(val, obnumber):
@@ -65,26 +249,9 @@ class numeric_array(list):
         raise SlawWrongVersionException('Slaw version %d not supported' % version)
 
     def to_slaw_v1(self):
-        f = 0
-        if self.is_float:
-            f = 1
-        c = 0
-        if self.is_complex:
-            c = 1
-        u = 1
-        if self.is_signed:
-            u = 0
-        s = 0
-        if self.bits == 8:
-            s = 1
-        elif self.bits == 16:
-            s = 3
-        elif self.bits == 64:
-            s = 2
-        v = self.vtype
-        b = (self.bits * self.size * (c + 1) / 8) - 1
+        desc = loam.numtype.describe(self.__obtype)
         n = len(self) + 1
-        h = (1 << 27) | (f << 26) | (c << 25) | (u << 24) | (s << 22) | (v << 19) | b
+        h = desc.v1_header
         if n > 0xffffffff:
             h = h | (3 << 17)
             nx = struct.pack('Q', n)
@@ -93,39 +260,22 @@ class numeric_array(list):
             nx = struct.pack('I', n)
         else:
             h = h | (n << 8)
-            nx = ''
-        data = ''.join(x.encode() for x in self)
+            nx = b''
+        data = self.__packed()
         if len(data) % 4:
-            padding = 4 - (len(data) % 4)
-            data += struct.pack('%ds' % padding, '')
-        return struct.pack('Iss', h, nx, data)
+            data += b'\0' * (4 - (len(data) % 4))
+        return struct.pack('I', h) + nx + data
 
     def to_slaw_v2(self):
-        f = 0
-        u = 1
-        if self.is_signed:
-            u = 0
-        if self.bits == 8:
-            s = 0
-        elif self.bits == 16:
-            s = 1
-        elif self.bits == 32:
-            s = 2
-        elif self.bits == 64:
-            s = 3
-        c = 0
-        if self.is_complex:
-            c = 1
-        v = self.vtype
-        b = (self.size * self.bits * (self.is_complex + 1) / 8) - 1
-        first = 0xc0 | (f << 5) | (u << 4) | (s << 2) | (c << 1)
-        l = (first << 24) | (v << 22) | (b << 14)
-        data = ''.join(x.encode() for x in self)
-        padding = 8 - (len(data) % 8)
-        if padding != 8:
-            data += struct.pack('%ds' % padding, '')
-        packed = struct.pack('Q', (l << 32) | len(self)) + data
-        return packed
+        desc = loam.numtype.describe(self.__obtype)
+        data = self.__packed()
+        if len(data) % 8:
+            data += b'\0' * (8 - (len(data) % 8))
+        return struct.pack('Q', desc.v2_array_header | len(self)) + data
+
+    def slaw_v2_size(self):
+        n = loam.numtype.describe(self.__obtype).bytesize * len(self)
+        return 8 + 8 * ((n + 7) // 8)
 
     def to_json(self, degrade=False):
         val = list(x.to_json(True) for x in self)
@@ -140,3 +290,59 @@ class numeric_array(list):
     def to_yaml(self, indent=''):
         return '!array\n%s' % '\n'.join('%s  - %s' % (indent, x.to_yaml('%s  ' % indent)) for x in self)
 
+    def freeze(self):
+        """
+        Returns an immutable, hashable copy of this array (see
+        frozen_numeric_array).
+        """
+        return frozen_numeric_array(self, self.__obtype)
+
+def frozen_error(*args, **kwargs):
+    raise TypeError('frozen loam containers cannot be modified')
+
+class frozen_numeric_array(cached_slaw, numeric_array):
+    """
+    An immutable numeric_array, whose (vector) elements are frozen too, and
+    whose slaw encodings are computed once and then reused.
+    """
+
+    def __init__(self, vals, obtype):
+        self.__frozen = False
+        self.__obtype = obtype
+        numeric_array.__init__(self, list(freeze(x) for x in vals), obtype)
+        self.__frozen = True
+        self.__hash = None
+
+    def __setitem__(self, index, value):
+        if self.__frozen:
+            frozen_error()
+        return numeric_array.__setitem__(self, index, value)
+
+    def __hash__(self):
+        if self.__hash is None:
+            self.__hash = hash(tuple(self))
+        return self.__hash
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce_ex__(self, protocol):
+        return (frozen_numeric_array, (list(self), self.__obtype))
+
+    __delitem__ = frozen_error
+    __setslice__ = frozen_error
+    __iadd__ = frozen_error
+    __imul__ = frozen_error
+    append = frozen_error
+    extend = frozen_error
+    insert = frozen_error
+    pop = frozen_error
+    remove = frozen_error
+    reverse = frozen_error
+    sort = frozen_error
+    clear = frozen_error
+
+import loam.numtype
@@ -0,0 +1,223 @@
+"""
+Precomputed descriptors for the concrete loam numeric types.
+
+Every concrete numeric class (int8 ... float64c, the vectors and the
+multi-vectors) gets one numtype, which knows its struct format and byte
+size, and the numeric header bits used for it in slaw versions 1 and 2.
+Encoders look descriptors up by class, decoders by header bits, so neither
+has to rebuild class names like 'v3float32c' for every number.
+"""
+import struct
+import loam.obnum, loam.obvect, loam.obmv
+
+try:
+    import numpy
+except:
+    numpy = None
+
+PREFIXES = ('', '<', '>')
+QUAD = struct.Struct('Q')
+## whether native headers are big endian
+NATIVE_BIG = struct.pack('>I', 1) == struct.pack('I', 1)
+VTYPES = ['', 'v2', 'v3', 'v4', 'mv2', 'mv3', 'mv4', 'mv5']
+V1_SIZES = { 8: 1, 16: 3, 32: 0, 64: 2 }
+V2_SIZES = { 8: 0, 16: 1, 32: 2, 64: 3 }
+CODES = {
+    ('float', 32): 'f',
+    ('float', 64): 'd',
+    ('int', 8): 'b',
+    ('int', 16): 'h',
+    ('int', 32): 'i',
+    ('int', 64): 'q',
+    ('unt', 8): 'B',
+    ('unt', 16): 'H',
+    ('unt', 32): 'I',
+    ('unt', 64): 'Q',
+}
+
+def wee_offset(bytesize, big=NATIVE_BIG):
+    """
+    Where a wee number's value starts in its 8 byte header.  The value is
+    the header's low bits, which a big endian header keeps at its end.
+    """
+    if big:
+        return 8 - bytesize
+    return 0
+
+class numtype(object):
+    """
+    Describes one concrete loam numeric class.
+    """
+
+    def __init__(self, klass):
+        self.klass = klass
+        self.vtype = klass.vtype
+        self.bits = klass.bits
+        self.is_float = klass.is_float
+        self.is_signed = klass.is_signed
+        self.is_complex = klass.is_complex
+        if klass.is_float:
+            kind = 'float'
+        elif klass.is_signed:
+            kind = 'int'
+        else:
+            kind = 'unt'
+        self.code = CODES[(kind, klass.bits)]
+        if klass.vtype < 4:
+            n = klass.vtype + 1
+        else:
+            n = 2**(klass.vtype - 2)
+        if klass.is_complex:
+            n = n * 2
+        self.count = n
+        """
+        Number of underlying values (real and imaginary parts count
+        separately).
+        """
+        if n == 1:
+            self.format = self.code
+        else:
+            self.format = '%d%s' % (n, self.code)
+        self.structs = dict((p, struct.Struct('%s%s' % (p, self.format))) for p in PREFIXES)
+        self.valuesize = klass.bits // 8
+        self.bytesize = self.valuesize * n
+        f = int(klass.is_float)
+        c = int(klass.is_complex)
+        u = int(not klass.is_signed)
+        v = klass.vtype
+        self.v1_key = (f << 7) | (c << 6) | (u << 5) | (V1_SIZES[klass.bits] << 3) | v
+        """
+        (header >> 19) & 0xff of a version 1 numeric slaw
+        """
+        self.v1_header = (1 << 27) | (self.v1_key << 19) | (self.bytesize - 1)
+        self.v2_key = (f << 15) | (u << 14) | (V2_SIZES[klass.bits] << 12) | (c << 11) | (v << 8) | (self.bytesize - 1)
+        """
+        (header >> 46) & 0xffff of a version 2 number or numeric array
+        """
+        self.v2_header = (2 << 62) | (self.v2_key << 46)
+        self.v2_array_header = (3 << 62) | (self.v2_key << 46)
+        if self.bytesize <= 4:
+            ## wee number: the value sits in the low bits of the header
+            self.v2_size = 8
+            self.v2_struct = None
+            self.v2_wee_offset = wee_offset(self.bytesize)
+        else:
+            pad = (8 - (self.bytesize % 8)) % 8
+            self.v2_size = 8 + self.bytesize + pad
+            self.v2_struct = struct.Struct('=Q%s%dx' % (self.format, pad))
+
+    def __repr__(self):
+        return 'numtype(%s)' % self.klass.__name__
+
+    def dtype(self, prefix=''):
+        """
+        Returns the numpy dtype of one object of this type, or None when
+        numpy is not available.  Complex floats map to numpy's complex
+        types, complex ints to a (real, imag) record, and vectors and
+        multi-vectors to a subarray of their element type.
+        """
+        if numpy is None:
+            return None
+        if self.is_complex and self.is_float:
+            base = numpy.dtype('%sc%d' % (prefix, self.bits // 4))
+        elif self.is_complex:
+            part = numpy.dtype('%s%s' % (prefix, self.code))
+            base = numpy.dtype([('real', part), ('imag', part)])
+        else:
+            base = numpy.dtype('%s%s' % (prefix, self.code))
+        n = self.count // (self.is_complex + 1)
+        if n > 1:
+            return numpy.dtype((base, (n,)))
+        return base
+
+    def values(self, obj):
+        """
+        Flattens obj into the sequence of plain values struct packs.
+        """
+        if self.vtype == 0:
+            if self.is_complex:
+                return (obj.real, obj.imag)
+            return (obj,)
+        if self.is_complex:
+            return list(v for x in obj._items for v in (x.real, x.imag))
+        return obj._items
+
+    def make(self, values):
+        """
+        Builds an instance of the class from a sequence of plain values, as
+        returned by struct.unpack.
+        """
+        if self.vtype > 0 and self.is_complex:
+            ucls = self.klass.underlying_class()
+            values = list(ucls(values[i], values[i+1]) for i in range(0, len(values), 2))
+        return self.klass(*values)
+
+    def encode(self, obj, prefix=''):
+        return self.structs[prefix].pack(*self.values(obj))
+
+    def decode(self, data, prefix=''):
+        return self.make(self.structs[prefix].unpack(data))
+
+    def encode_v2_into(self, obj, buf, offset=0):
+        """
+        Writes obj as a version 2 numeric slaw into buf at offset, and
+        returns the offset just past it.
+        """
+        if self.v2_struct is None:
+            QUAD.pack_into(buf, offset, self.v2_header)
+            self.structs[''].pack_into(buf, offset + self.v2_wee_offset, *self.values(obj))
+        else:
+            self.v2_struct.pack_into(buf, offset, self.v2_header, *self.values(obj))
+        return offset + self.v2_size
+
+    def encode_array(self, objs, prefix=''):
+        """
+        Packs a sequence of objects of this type with a single struct call.
+        """
+        values = list()
+        for x in objs:
+            values.extend(self.values(x))
+        return struct.pack('%s%d%s' % (prefix, len(values), self.code), *values)
+
+    def decode_array(self, data, prefix=''):
+        """
+        Unpacks data holding a whole number of objects of this type with a
+        single struct call, and returns a list of the objects.
+        """
+        values = struct.unpack('%s%d%s' % (prefix, len(data) // self.valuesize, self.code), data)
+        n = self.count
+        if n == 1:
+            klass = self.klass
+            return list(klass(x) for x in values)
+        return list(self.make(values[i:i+n]) for i in range(0, len(values), n))
+
+BY_CLASS = dict()
+V1_TYPES = dict()
+V2_TYPES = dict()
+
+def describe(klass):
+    """
+    Returns the numtype for a concrete loam numeric class.
+    """
+    return BY_CLASS[klass]
+
+def _build_tables():
+    for vtype in VTYPES:
+        if vtype == '':
+            module = loam.obnum
+        elif vtype.startswith('mv'):
+            module = loam.obmv
+        else:
+            module = loam.obvect
+        for kind in ('int', 'unt', 'float'):
+            for bits in (8, 16, 32, 64):
+                for c in ('', 'c'):
+                    klass = getattr(module, '%s%s%d%s' % (vtype, kind, bits, c), None)
+                    if klass is None:
+                        continue
+                    desc = numtype(klass)
+                    BY_CLASS[klass] = desc
+                    V1_TYPES[desc.v1_key] = desc
+                    V2_TYPES[desc.v2_key] = desc
+
+_build_tables()
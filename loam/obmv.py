@@ -1,6 +1,7 @@
 from loam.const import *
 from loam.exceptions import *
 import loam.obnum
+import copy
 ## multi-vectors
 
 class obmvpointer(list):
@@ -42,7 +43,8 @@ class obmv(loam.obnum.obnumber):
             args = loam.util.make_obnumbers(*args)
             kls = 'm%d%s' % (n, type(args[0]).__name__)
             return globals()[kls](*args)
-        return super(obmv, cls).__new__(cls, *args)
+        #return super(obmv, cls).__new__(cls, *args)
+        return super(obmv, cls).__new__(cls)
 
     def __init__(self, *args):
         args = list(args)
@@ -130,12 +132,6 @@ class obmv(loam.obnum.obnumber):
     #            items[i] = klass(args[i])
     #    self._items = items
 
-    def encode(self):
-        data = ''
-        for i in range(2**self.size):
-            data += self._items[i].encode()
-        return data
-
     def __getattribute__(self, key):
         if key.startswith('_'):
             return super(obmv, self).__getattribute__(key)
@@ -174,6 +170,25 @@ class obmv(loam.obnum.obnumber):
             value = self._klass(value)
         self._items[index] = value
 
+    def __hash__(self):
+        """
+        Only frozen multi-vectors (see freeze()) can be hashed.
+        """
+        if not isinstance(self._items, tuple):
+            raise TypeError("unhashable type: '%s' (freeze() it first)" % type(self).__name__)
+        return hash(self._items)
+
+    def freeze(self):
+        """
+        Returns a copy of this multi-vector whose elements can't be
+        changed, and which can therefore be hashed.
+        """
+        if isinstance(self._items, tuple):
+            return self
+        m = copy.copy(self)
+        m._items = tuple(self._items)
+        return m
+
     @classmethod
     def underlying_class(cls):
         if cls.is_float:
@@ -187,9 +202,6 @@ class obmv(loam.obnum.obnumber):
             kls += 'c'
         return getattr(loam.obnum, kls)
 
-    def bytesize(self):
-        return (self.bits / 8) * (2**self.size) * (self.is_complex + 1)
-
     def to_json(self, degrade=False):
         val = list(x.to_json(True) for x in self._items)
         if degrade:
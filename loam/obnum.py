@@ -89,7 +89,7 @@ class obnumber(object):
         Number of bytes needed to represent all of the values contained in
         the object.
         """
-        return self.size * self.bits * (self.is_complex + 1) / 8
+        return loam.numtype.describe(type(self)).bytesize
 
     def encode(self, prefix=''):
         """
@@ -98,8 +98,7 @@ class obnumber(object):
         any information about the object's type and is not suitible for use
         in pools, etc.  See struct.pack()
         """
-        fmt = self.get_format()
-        return struct.pack('%s%s' % (prefix, fmt), self)
+        return loam.numtype.describe(type(self)).encode(self, prefix)
 
     @classmethod
     def get_format(cls):
@@ -107,39 +106,7 @@ class obnumber(object):
         Packing format for encode() and decode().  See struct documentation
         for more info.
         """
-        if cls.is_float:
-            if cls.bits == 32:
-                fmt = 'f'
-            else:
-                fmt = 'd'
-        elif cls.is_signed:
-            if cls.bits == 64:
-                fmt = 'q'
-            elif cls.bits == 32:
-                fmt = 'i'
-            elif cls.bits == 16:
-                fmt = 'h'
-            else:
-                fmt = 'b'
-        else:
-            if cls.bits == 64:
-                fmt = 'Q'
-            elif cls.bits == 32:
-                fmt = 'I'
-            elif cls.bits == 16:
-                fmt = 'H'
-            else:
-                fmt = 'B'
-        n = 1
-        if cls.is_complex:
-            n = n * 2
-        if cls.vtype < 4:
-            n = n * (cls.vtype + 1)
-        else:
-            n = n * (2**(cls.vtype - 2))
-        if n == 1:
-            return fmt
-        return '%d%s' % (n, fmt)
+        return loam.numtype.describe(cls).format
 
     @classmethod
     def decode(cls, data, prefix=''):
@@ -149,15 +116,10 @@ class obnumber(object):
         determined, and only unpacks the raw values from the slaw.  See
         struct.unpack()
         """
-        fmt = cls.get_format()
-        fsize = struct.calcsize(fmt)
-        if len(data) != fsize:
-            raise SlawWrongLengthException('%s expected %d bytes of data, but got %d bytes (%s) (%s)' % (cls, fsize, len(data), ' '.join('%02x' % ord(x) for x in data), fmt))
-        values = struct.unpack('%s%s' % (prefix, fmt), data)
-        if cls.size > 1 and cls.is_complex:
-            ucls = cls.underlying_class()
-            values = list(ucls(values[i], values[i+1]) for i in range(0, len(values), 2))
-        return cls(*values)
+        desc = loam.numtype.describe(cls)
+        if len(data) != desc.bytesize:
+            raise SlawWrongLengthException('%s expected %d bytes of data, but got %d bytes (%s) (%s)' % (cls, desc.bytesize, len(data), ' '.join('%02x' % x for x in bytearray(data)), desc.format))
+        return desc.decode(data, prefix)
 
     def to_slaw(self, version=2):
         """
@@ -170,73 +132,33 @@ class obnumber(object):
         raise SlawWrongVersionException('Slaw version %d not supported' % version)
 
     def to_slaw_v1(self):
-        f = 0
-        if self.is_float:
-            f = 1
-        c = 0
-        if self.is_complex:
-            c = 1
-        u = 1
-        if self.is_signed:
-            u = 0
-        s = 0
-        if self.bits == 8:
-            s = 1
-        elif self.bits == 16:
-            s = 3
-        elif self.bits == 64:
-            s = 2
-        v = self.vtype
-        b = (self.bits * self.size * (c + 1) / 8) - 1
-        h = (1 << 27) | (f << 26) | (c << 25) | (u << 24) | (s << 22) | (v << 19) | b
+        desc = loam.numtype.describe(type(self))
         data = self.encode()
         if len(data) % 4:
-            padding = 4 - (len(data) % 4)
-            data += struct.pack('%ds' % padding, '')
-        return struct.pack('Is', h, data)
+            data += b'\0' * (4 - (len(data) % 4))
+        return struct.pack('I', desc.v1_header) + data
 
     def to_slaw_v2(self):
-        f = 0
-        if self.is_float:
-            f = 1
-        u = 1
-        if self.is_signed:
-            u = 0
-        if self.bits == 8:
-            s = 0
-        elif self.bits == 16:
-            s = 1
-        elif self.bits == 32:
-            s = 2
-        elif self.bits == 64:
-            s = 3
-        c = 0
-        if self.is_complex:
-            c = 1
-        v = self.vtype
-        if v >= 4:
-            xsize = 2**self.size
-        else:
-            xsize = self.size
-        b = (self.bits * xsize * (c + 1) / 8) - 1
-        first = 0x80 | (f << 5) | (u << 4) | (s << 2) | (c << 1)
-        l = (first << 24) | (v << 22) | (b << 14)
-        if b <= 3:
-            e = self.encode()
-            if len(e) % 4:
-                e += '\0' * (4 - (len(e) % 4))
-            (n,) = struct.unpack('I', e)
-            packed = struct.pack('Q', (l << 32) | n)
-        else:
-            data_bytes = self.encode()
-            padding = 8 - (len(data_bytes) % 8)
-            if padding != 8:
-                data_bytes += struct.pack('%ds' % padding, '')
-            packed = struct.pack('Q', l << 32) + data_bytes
-        (h,) = struct.unpack('Q', packed[:8])
-        if len(packed) % 8 > 0:
-            raise SlawWrongLengthException('%s packing not a multiple of 8 bytes (%d): %s' % (type(self).__name__, len(packed), self))
-        return packed
+        desc = loam.numtype.describe(type(self))
+        if desc.v2_struct is None:
+            ## wee number, packed into the low bits of the header
+            buf = bytearray(8)
+            desc.encode_v2_into(self, buf)
+            return bytes(buf)
+        data = self.encode()
+        if len(data) % 8:
+            data += b'\0' * (8 - (len(data) % 8))
+        return struct.pack('Q', desc.v2_header) + data
+
+    def slaw_v2_size(self):
+        return loam.numtype.describe(type(self)).v2_size
+
+    def encode_into(self, buf, offset=0):
+        """
+        Writes this number as version 2 slaw into buf at offset, and
+        returns the offset just past it.
+        """
+        return loam.numtype.describe(type(self)).encode_v2_into(self, buf, offset)
 
     def __abs__(self):
         """
@@ -571,6 +493,19 @@ class obnumber(object):
             return float(self) == float(other)
         return int(self) == int(other)
 
+    def __hash__(self):
+        """
+        x.__hash__() <==> hash(x)
+
+        Consistent with __eq__, so equal numbers hash alike whatever their
+        loam class (and like the equivalent python number).
+        """
+        if self.is_complex:
+            return hash(complex(self.real, self.imag))
+        if self.is_float:
+            return hash(float(self))
+        return hash(int(self))
+
     def __ne__(self, other):
         """
         x.__ne__(y) <==> x != y
@@ -945,7 +880,7 @@ class obcomplex(obnumber):
             (real, imag) = loam.util.make_obnumbers(real, imag)
             kls = '%sc' % type(real).__name__
             return globals()[kls](real, imag)
-        return super(obcomplex, cls).__new__(cls, real, imag)
+        return super(obcomplex, cls).__new__(cls)
 
     def __init__(self, real=0, imag=None):
         if imag is None:
@@ -978,9 +913,6 @@ class obcomplex(obnumber):
         kls += '%d' % cls.bits
         return globals()[kls]
 
-    def encode(self):
-        return self.real.encode() + self.imag.encode()
-
     def to_yaml(self):
         return '!complex [%s, %s]' % (self.real.to_yaml(), self.imag.to_yaml())
 
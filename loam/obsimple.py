@@ -34,6 +34,9 @@ class obnil(object):
             raise SlawWrongLengthException('%s packing not a multiple of 8 bytes (%d): %s' % (type(self).__name__, len(packed), self))
         return packed
 
+    def slaw_v2_size(self):
+        return 8
+
     def to_json(self, degrade=False):
         if degrade:
             return None
@@ -76,6 +79,9 @@ class obbool(int):
             raise SlawWrongLengthException('%s packing not a multiple of 8 bytes (%d): %s' % (type(self).__name__, len(packed), self))
         return packed
 
+    def slaw_v2_size(self):
+        return 8
+
     def to_json(self, degrade=False):
         if degrade:
             return bool(self)
@@ -1,5 +1,5 @@
 import struct
-from loam.util import get_prefix, AM_I_BIG_ENDIAN
+from loam.util import get_prefix, AM_I_BIG_ENDIAN, cached_slaw
 from loam.obnum import unt64, int64
 
 class obstring(str): #since strings are Unicode by default in python3
@@ -13,115 +13,115 @@ class obstring(str): #since strings are Unicode by default in python3
     """
 
     def __add__(self, *args):
-        return obstring(unicode.__add__(self, *args))
+        return obstring(str.__add__(self, *args))
 
     def __format__(self, *args):
-        return obstring(unicode.__format__(self, *args))
+        return obstring(str.__format__(self, *args))
 
     def __getitem__(self, *args):
-        return obstring(unicode.__getitem__(self, *args))
+        return obstring(str.__getitem__(self, *args))
 
     def __getslice__(self, *args):
-        return obstring(unicode.__getslice__(self, *args))
+        return obstring(str.__getslice__(self, *args))
 
     def __len__(self, *args):
-        return unt64(unicode.__len__(self))
+        return unt64(str.__len__(self))
 
     def __sizeof__(self, *args):
-        return unt64(unicode.__sizeof__(self))
+        return unt64(str.__sizeof__(self))
 
     def __mod__(self, *args):
-        return obstring(unicode.__mod__(self, *args))
+        return obstring(str.__mod__(self, *args))
 
     def __rmod__(self, *args):
-        return obstring(unicode.__rmod__(self, *args))
+        return obstring(str.__rmod__(self, *args))
 
     def __mul__(self, *args):
-        return obstring(unicode.__mul__(self, *args))
+        return obstring(str.__mul__(self, *args))
 
     def __rmul__(self, *args):
-        return obstring(unicode.__rmul__(self, *args))
+        return obstring(str.__rmul__(self, *args))
 
     def capitalize(self, *args):
-        return obstring(unicode.capitalize(self, *args))
+        return obstring(str.capitalize(self, *args))
 
     def center(self, *args):
-        return obstring(unicode.center(self, *args))
+        return obstring(str.center(self, *args))
 
     def count(self, *args):
-        return unt64(unicode.count(self, *args))
+        return unt64(str.count(self, *args))
 
     def expandtabs(self, *args):
-        return obstring(unicode.expandtabs(self, *args))
+        return obstring(str.expandtabs(self, *args))
 
     def find(self, *args):
-        return int64(unicode.find(self, *args))
+        return int64(str.find(self, *args))
 
     def format(self, *args):
-        return obstring(unicode.format(self, *args))
+        return obstring(str.format(self, *args))
 
     def index(self, *args):
-        return unt64(unicode.index(self, *args))
+        return unt64(str.index(self, *args))
 
     def join(self, *args):
-        return obstring(unicode.join(self, *args))
+        return obstring(str.join(self, *args))
 
     def ljust(self, *args):
-        return obstring(unicode.ljust(self, *args))
+        return obstring(str.ljust(self, *args))
 
     def lower(self, *args):
-        return obstring(unicode.lower(self, *args))
+        return obstring(str.lower(self, *args))
 
     def lstrip(self, *args):
-        return obstring(unicode.lstrip(self, *args))
+        return obstring(str.lstrip(self, *args))
 
     def partition(self, *args):
-        return (obstring(x) for x in unicode.partition(self, *args))
+        return (obstring(x) for x in str.partition(self, *args))
 
     def replace(self, *args):
-        return obstring(unicode.replace(self, *args))
+        return obstring(str.replace(self, *args))
 
     def rfind(self, *args):
-        return int64(unicode.find(self, *args))
+        return int64(str.find(self, *args))
 
     def rindex(self, *args):
-        return unt64(unicode.find(self, *args))
+        return unt64(str.find(self, *args))
 
     def rjust(self, *args):
-        return obstring(unicode.rjust(self, *args))
+        return obstring(str.rjust(self, *args))
 
     def rpartition(self, *args):
-        return (obstring(x) for x in unicode.rpartition(self, *args))
+        return (obstring(x) for x in str.rpartition(self, *args))
 
     def rsplit(self, *args):
-        return obstruct.oblist(obstring(x) for x in unicode.rsplit(self, *args))
+        return loam.obstruct.oblist(obstring(x) for x in str.rsplit(self, *args))
 
     def rstrip(self, *args):
-        return obstring(unicode.rstrip(self, *args))
+        return obstring(str.rstrip(self, *args))
 
     def split(self, *args):
-        return obstruct.oblist(obstring(x) for x in unicode.split(self, *args))
+        return loam.obstruct.oblist(obstring(x) for x in str.split(self, *args))
 
     def splitlines(self, *args):
-        return obstruct.oblist(obstring(x) for x in unicode.splitlines(self, *args))
+        return loam.obstruct.oblist(obstring(x) for x in str.splitlines(self, *args))
 
     def strip(self, *args):
-        return obstring(unicode.strip(self, *args))
+        return obstring(str.strip(self, *args))
 
     def swapcase(self, *args):
-        return obstring(unicode.swapcase(self, *args))
+        return obstring(str.swapcase(self, *args))
 
     def title(self, *args):
-        return obstring(unicode.title(self, *args))
+        return obstring(str.title(self, *args))
 
     def translate(self, *args):
-        return obstring(unicode.translate(self, *args))
+        return obstring(str.translate(self, *args))
 
     def upper(self, *args):
-        return obstring(unicode.upper(self, *args))
+        return obstring(str.upper(self, *args))
 
     def zfill(self, *args):
-        return obstring(unicode.zfill(self, *args))
+        return obstring(str.zfill(self, *args))
 
     def to_slaw(self, version=2):
         if version == 2:
@@ -131,12 +131,12 @@ class obstring(str): #since strings are Unicode by default in python3
         raise SlawWrongVersionException('Slaw version %d not supported' % version)
 
     def to_slaw_v1(self):
-        v = self.encode('utf8') + '\x00'
+        v = self.encode('utf8') + b'\x00'
         q = len(v)
         if q % 4:
-            v += '\x00' * (4 - (q % 4))
+            v += b'\x00' * (4 - (q % 4))
             q += 4 - (q % 4)
-        q = q / 4
+        q = q // 4
         if q <= 0x1fffffff:
             header = struct.pack('I', (2 << 28) | q)
         elif q <= 0xffffffff:
@@ -146,18 +146,18 @@ class obstring(str): #since strings are Unicode by default in python3
         return header + v
 
     def to_slaw_v2(self):
-        x = self.encode('utf8')+'\x00'
+        x = self.encode('utf8') + b'\x00'
         n = len(x)
         if n <= 7:
             ## pack as wee string
             if AM_I_BIG_ENDIAN:
-                x = '%s%s' % ('\x00' * (8 - len(x)), x)
+                x = b'\x00' * (8 - len(x)) + x
             (special,) = struct.unpack('q', struct.pack('8s', x))
             first = 0x30 | n
             packed = struct.pack('q', (first << 56) | special)
         else:
             ## pack as full string
-            octlen = 1 + (n / 8)
+            octlen = 1 + (n // 8)
             if n % 8 > 0:
                 octlen += 1
                 padding = 8 - (n % 8)
@@ -169,13 +169,51 @@ class obstring(str): #since strings are Unicode by default in python3
             raise SlawWrongLengthException('%s packing not a multiple of 8 bytes (%d): %s' % (type(self).__name__, len(packed), self))
         return packed
 
+    def slaw_v2_size(self):
+        n = len(self.encode('utf8')) + 1
+        if n <= 7:
+            return 8
+        return 8 + 8 * ((n + 7) // 8)
+
+    def encode_into(self, buf, offset=0):
+        """
+        Writes this string as version 2 slaw into buf at offset, and
+        returns the offset just past it.
+        """
+        x = self.encode('utf8')
+        n = len(x) + 1
+        if n <= 7:
+            buf[offset:offset+8] = obstring.to_slaw_v2(self)
+            return offset + 8
+        padding = (8 - (n % 8)) % 8
+        octlen = 1 + ((n + padding) // 8)
+        struct.pack_into('q', buf, offset, ((0x70 | padding) << 56) | octlen)
+        start = offset + 8
+        buf[start:start+len(x)] = x
+        end = offset + 8 * octlen
+        buf[start+len(x):end] = b'\x00' * (padding + 1)
+        return end
+
     def to_json(self, degrade=False):
         if degrade:
-            return unicode(self)
-        return { 'json_class': 'obstring', 'v': unicode(self) }
+            return str(self)
+        return { 'json_class': 'obstring', 'v': str(self) }
 
     def to_yaml(self, indent=''):
         return '%s' % self
 
+    def freeze(self):
+        """
+        Returns a frozen_obstring with the same value.
+        """
+        return frozen_obstring(self)
+
+class frozen_obstring(cached_slaw, obstring):
+    """
+    An obstring that remembers its slaw encodings, for strings that get
+    deposited over and over (descrips, ingest keys).
+    """
+    pass
+
 #import obstruct
 import loam.obstruct
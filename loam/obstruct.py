@@ -2,6 +2,7 @@ import struct
 from loam.const import *
 from loam.exceptions import *
 from loam.obnum import int64
+from loam.util import cached_slaw
 
 class obcons(tuple):
     """
@@ -57,7 +58,7 @@ class obcons(tuple):
         data_bytes = self.left.to_slaw_v1() + self.right.to_slaw_v1()
         q = len(data_bytes)
         if q % 4:
-            data_bytes += '\x00' * (4 - (q % 4))
+            data_bytes += b'\x00' * (4 - (q % 4))
             q += 4 - (q % 4)
         if q <= 0x3fffffff:
             header = struct.pack('I', (1 << 30) | q)
@@ -68,13 +69,21 @@ class obcons(tuple):
         return header + data_bytes
 
     def to_slaw_v2(self):
-        data_bytes = self.left.to_slaw_v2() + self.right.to_slaw_v2()
-        octlen = 1 + (len(data_bytes) / 8)
-        first = 0x62
-        packed = struct.pack('q', (first << 56) | octlen) + data_bytes
-        if len(packed) % 8 > 0:
-            raise SlawWrongLengthException('%s packing not a multiple of 8 bytes (%d): %s' % (type(self).__name__, len(packed), self))
-        return packed
+        return encode_slaw2(self)
+
+    def slaw_v2_size(self):
+        return 8 + slaw_v2_size(self.left) + slaw_v2_size(self.right)
+
+    def encode_into(self, buf, offset=0):
+        """
+        Writes this cons as version 2 slaw into buf at offset, and returns
+        the offset just past it.  The header is filled in last, once the
+        length is known.
+        """
+        end = encode_into(self.left, buf, offset + 8)
+        end = encode_into(self.right, buf, end)
+        struct.pack_into('q', buf, offset, (0x62 << 56) | ((end - offset) // 8))
+        return end
 
     def to_json(self, degrade=False):
         val = [self.left.to_json(degrade), self.right.to_json(degrade)]
@@ -88,6 +97,13 @@ class obcons(tuple):
         else:
             return '!cons\n%s  %s: %s' % (indent, self.left.to_yaml('%s  ' % indent), self.right.to_yaml('%s  ' % indent))
 
+    def freeze(self):
+        """
+        Returns a cons of the frozen left and right members, which (unlike
+        a cons of lists or vectors) can be hashed.
+        """
+        return obcons((freeze(self.left), freeze(self.right)))
+
 class oblist(list):
     """
     Loam version of a list.  Like python lists, these can be composed of
@@ -186,7 +202,7 @@ class oblist(list):
 
     def to_slaw_v1(self):
         n = len(self)
-        data_bytes = ''.join(e.to_slaw_v1() for e in self)
+        data_bytes = b''.join(e.to_slaw_v1() for e in self)
         if n <= 0x7ffffff:
             header = struct.pack('I', (2 << 27) | n)
         elif n <= 0xffffffff:
@@ -196,19 +212,30 @@ class oblist(list):
         return header + data_bytes
 
     def to_slaw_v2(self):
+        return encode_slaw2(self)
+
+    def slaw_v2_size(self):
+        size = 8 + sum(slaw_v2_size(e) for e in self)
+        if len(self) > 14:
+            size += 8
+        return size
+
+    def encode_into(self, buf, offset=0):
+        """
+        Writes this list as version 2 slaw into buf at offset, and returns
+        the offset just past it.  The header is filled in last, once the
+        length is known.
+        """
         n = len(self)
-        data_bytes = ''.join(e.to_slaw_v2() for e in self)
-        octlen = 1 + (len(data_bytes) / 8)
-        extra = ''
+        end = offset + 8
         if n > 14:
-            octlen += 1
-            extra = struct.pack('q', n)
+            struct.pack_into('q', buf, end, n)
+            end += 8
             n = 15
-        first = 0x40 | n
-        packed = struct.pack('q', (first << 56) | octlen) + extra + data_bytes
-        if len(packed) % 8 > 0:
-            raise SlawWrongLengthException('%s packing not a multiple of 8 bytes (%d): %s' % (type(self).__name__, len(packed), self))
-        return packed
+        for e in self:
+            end = encode_into(e, buf, end)
+        struct.pack_into('q', buf, offset, ((0x40 | n) << 56) | ((end - offset) // 8))
+        return end
 
     def search_ex(self, search, how=SEARCH_GAP):
         """
@@ -278,6 +305,13 @@ class oblist(list):
             joinstr = '\n%s  - ' % indent
             return '- %s' % joinstr.join(x.to_yaml('%s  ' % indent) for x in self)
 
+    def freeze(self):
+        """
+        Returns an immutable, hashable copy of this list (see frozen_oblist),
+        with its members frozen too.
+        """
+        return frozen_oblist(self)
+
 class obmap(dict):
     """
     Loam version of a dict.  Like python dicts, these can be composed of
@@ -375,7 +409,7 @@ class obmap(dict):
 
     def to_slaw_v1(self):
         n = len(self)
-        data_bytes = ''.join(c.to_slaw_v1() for c in self.iteritems())
+        data_bytes = b''.join(c.to_slaw_v1() for c in self.iteritems())
         if n <= 0x7ffffff:
             header = struct.pack('I', (3 << 27) | n)
         elif n <= 0xffffffff:
@@ -385,20 +419,34 @@ class obmap(dict):
         return header + data_bytes
 
     def to_slaw_v2(self):
+        return encode_slaw2(self)
+
+    def slaw_v2_size(self):
+        size = 8 + sum(8 + slaw_v2_size(make_loamtype(k)) + slaw_v2_size(self[k]) for k in self.iterkeys())
+        if len(self) > 14:
+            size += 8
+        return size
+
+    def encode_into(self, buf, offset=0):
+        """
+        Writes this map as version 2 slaw into buf at offset, and returns
+        the offset just past it.  Entries are written as conses, without
+        building obcons objects for them, and each header is filled in
+        once the length under it is known.
+        """
         n = len(self)
-        data_bytes = ''.join(c.to_slaw_v2() for c in self.iteritems())
-        octlen = 1 + (len(data_bytes) / 8)
-        extra = ''
+        end = offset + 8
         if n > 14:
-            octlen += 1
-            extra = struct.pack('q', n)
+            struct.pack_into('q', buf, end, n)
+            end += 8
             n = 15
-        first = 0x50 | n
-        header = (first << 56) | octlen
-        packed = struct.pack('q', header) + extra + data_bytes
-        if len(packed) % 8 > 0:
-            raise SlawWrongLengthException('%s packing not a multiple of 8 bytes (%d): %s' % (type(self).__name__, len(packed), self))
-        return packed
+        for k in self.iterkeys():
+            start = end
+            end = encode_into(make_loamtype(k), buf, start + 8)
+            end = encode_into(self[k], buf, end)
+            struct.pack_into('q', buf, start, (0x62 << 56) | ((end - start) // 8))
+        struct.pack_into('q', buf, offset, ((0x50 | n) << 56) | ((end - offset) // 8))
+        return end
 
     def to_json(self, degrade=False):
         val = dict((c.left.to_json(True),c.right.to_json(degrade)) for c in self.items())
@@ -409,4 +457,99 @@ class obmap(dict):
     def to_yaml(self, indent=''):
         return '!!omap%s' % ''.join('\n%s- %s: %s' % (indent, k.to_yaml('%s  ' % indent), v.to_yaml('%s  ' % indent)) for k,v in self.iteritems())
 
-from loam.util import make_loamtype, get_prefix
+    def freeze(self):
+        """
+        Returns an immutable, hashable copy of this map (see frozen_obmap),
+        with its values frozen too.
+        """
+        return frozen_obmap((k, self[k]) for k in self.iterkeys())
+
+def frozen_error(*args, **kwargs):
+    raise TypeError('frozen loam containers cannot be modified')
+
+class frozen_oblist(cached_slaw, oblist):
+    """
+    An immutable oblist.  Its members are frozen as well, so it can be
+    hashed, and its slaw encodings are computed once and then reused, both
+    by to_slaw() and when it is encoded as part of a bigger slaw.  Meant
+    for things like a producer's descrips, deposited on every protein.
+    """
+
+    def __init__(self, *args):
+        self.__frozen = False
+        oblist.__init__(self, *args)
+        self.__frozen = True
+        self.__hash = None
+
+    def __setitem__(self, index, value):
+        if self.__frozen:
+            frozen_error()
+        return list.__setitem__(self, index, freeze(make_loamtype(value)))
+
+    def __hash__(self):
+        if self.__hash is None:
+            self.__hash = hash(tuple(self))
+        return self.__hash
+
+    ## copying an immutable list gets the same list; pickles are rebuilt
+    ## through the constructor, as list's own reduction calls append()
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return (frozen_oblist, (list(self),))
+
+    __delitem__ = frozen_error
+    __iadd__ = frozen_error
+    __imul__ = frozen_error
+    append = frozen_error
+    extend = frozen_error
+    insert = frozen_error
+    pop = frozen_error
+    remove = frozen_error
+    reverse = frozen_error
+    sort = frozen_error
+    clear = frozen_error
+
+class frozen_obmap(cached_slaw, obmap):
+    """
+    An immutable obmap.  Its values are frozen as well, so it can be
+    hashed, and its slaw encodings are computed once and then reused.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.__frozen = False
+        obmap.__init__(self, *args, **kwargs)
+        self.__frozen = True
+        self.__hash = None
+
+    def __setitem__(self, key, value):
+        if self.__frozen:
+            frozen_error()
+        return obmap.__setitem__(self, key, freeze(make_loamtype(value)))
+
+    def __hash__(self):
+        if self.__hash is None:
+            self.__hash = hash(frozenset((k, self[k]) for k in self.iterkeys()))
+        return self.__hash
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return (frozen_obmap, (list((k, self[k]) for k in self.iterkeys()),))
+
+    __delitem__ = frozen_error
+    update = frozen_error
+    pop = frozen_error
+    popitem = frozen_error
+    setdefault = frozen_error
+    clear = frozen_error
+
+from loam.util import make_loamtype, get_prefix, slaw_v2_size, encode_into, encode_slaw2, freeze
@@ -1,4 +1,4 @@
-import math
+import math, copy
 import loam.obnum
 
 def common_class(*args, **kwargs):
@@ -75,7 +75,8 @@ class obvector(loam.obnum.obnumber):
             args = loam.util.make_obnumbersc(*args)
             kls = 'v%d%s' % (len(args), type(args[0]).__name__)
             return globals()[kls](*args)
-        return super(obvector, cls).__new__(cls, *args)
+        #return super(obvector, cls).__new__(cls, *args)
+        return super(obvector, cls).__new__(cls)
 
     def __init__(self, *args):
         args = list(args)
@@ -154,15 +155,6 @@ class obvector(loam.obnum.obnumber):
             value = self._klass(value)
         self._items[index] = value
 
-    def bytesize(self):
-        return (self.bits / 8) * (self.is_complex + 1) * self.size
-
-    def encode(self):
-        data = ''
-        for i in range(self.size):
-            data += self._items[i].encode()
-        return data
-
     @classmethod
     def underlying_class(cls):
         if cls.is_float:
@@ -342,6 +334,29 @@ class obvector(loam.obnum.obnumber):
     def __ne__(self, other):
         return not (self == other)
 
+    def __hash__(self):
+        """
+        Only frozen vectors (see freeze()) can be hashed.  Trailing zeros
+        are left out, as vectors that differ only by them are equal.
+        """
+        if not isinstance(self._items, tuple):
+            raise TypeError("unhashable type: '%s' (freeze() it first)" % type(self).__name__)
+        items = self._items
+        while len(items) > 0 and items[-1] == 0:
+            items = items[:-1]
+        return hash(items)
+
+    def freeze(self):
+        """
+        Returns a copy of this vector whose elements can't be changed, and
+        which can therefore be hashed.
+        """
+        if isinstance(self._items, tuple):
+            return self
+        v = copy.copy(self)
+        v._items = tuple(self._items)
+        return v
+
     def dot(self, other):
         """
         Dot product of two vectors.
@@ -1,4 +1,5 @@
-import unittest, math
+import unittest, math, copy, pickle
+import loam.util
 from loam import *
 from loam.obnum import obnumber, obint
 from plasma.exceptions import *
@@ -274,6 +275,40 @@ class LoamNumTestCase(unittest.TestCase):
         self.assertEquals(16, x.bytesize())
         self.assertEquals('2d', x.get_format())
 
+class LoamNumTypeTestCase(unittest.TestCase):
+
+    def testTables(self):
+        import loam.numtype
+        self.assertEquals(120, len(loam.numtype.BY_CLASS))
+        self.assertEquals(120, len(loam.numtype.V1_TYPES))
+        self.assertEquals(120, len(loam.numtype.V2_TYPES))
+        for desc in loam.numtype.BY_CLASS.values():
+            self.assertTrue(loam.numtype.V1_TYPES[desc.v1_key] is desc)
+            self.assertTrue(loam.numtype.V2_TYPES[desc.v2_key] is desc)
+
+    def testDescriptor(self):
+        import loam.numtype
+        desc = loam.numtype.describe(v3float32)
+        self.assertEquals(v3float32, desc.klass)
+        self.assertEquals('3f', desc.format)
+        self.assertEquals(12, desc.bytesize)
+        self.assertEquals(2, desc.vtype)
+        desc = loam.numtype.describe(mv2int16)
+        self.assertEquals('4h', desc.format)
+        self.assertEquals(8, desc.bytesize)
+        desc = loam.numtype.describe(unt64)
+        self.assertEquals(0x7007, desc.v2_key)
+        self.assertEquals(0xdc01c00000000000, desc.v2_array_header)
+
+    def testArray(self):
+        import loam.numtype
+        desc = loam.numtype.describe(int16)
+        data = desc.encode_array([int16(1), int16(-2), int16(3)], '<')
+        self.assertEquals(b'\x01\x00\xfe\xff\x03\x00', data)
+        x = desc.decode_array(data, '<')
+        self.assertEquals([1, -2, 3], x)
+        self.assertEquals(int16, type(x[1]))
+
 class LoamIntTestCase(unittest.TestCase):
 
     pass
@@ -530,5 +565,105 @@ class LoamStructTestCase(unittest.TestCase):
         self.assertEquals(3, len(items))
         self.assertEquals(obcons, type(items[0]))
 
+class LoamEncodeIntoTestCase(unittest.TestCase):
+
+    def makeMap(self):
+        x = obmap(dict(('k%d' % i, int32(i)) for i in range(20)))
+        x['list'] = oblist([int8(1), obstring('a longer string'), obnil(), obbool(True)])
+        x['cons'] = obcons((obstring('x'), float64(1.5)))
+        return x
+
+    def testSize(self):
+        x = self.makeMap()
+        self.assertEqual(loam.util.slaw_v2_size(x), len(x.to_slaw_v2()))
+        for v in x.values():
+            self.assertEqual(loam.util.slaw_v2_size(v), len(v.to_slaw_v2()))
+
+    def testEncodeInto(self):
+        x = self.makeMap()
+        data = x.to_slaw_v2()
+        buf = bytearray(b'\xff' * (len(data) + 24))
+        end = x.encode_into(buf, 16)
+        self.assertEqual(end, 16 + len(data))
+        self.assertEqual(bytes(buf[16:end]), data)
+        self.assertEqual(buf[:16], b'\xff' * 16)
+        self.assertEqual(buf[end:], b'\xff' * 8)
+
+class LoamFrozenTestCase(unittest.TestCase):
+
+    def makeList(self):
+        return oblist(['foo', 'bar', obmap({ 'a': oblist([int32(1), float64(2.5)]) })])
+
+    def testFreeze(self):
+        x = self.makeList().freeze()
+        self.assertEqual(frozen_oblist, type(x))
+        self.assertEqual(frozen_obstring, type(x[0]))
+        self.assertEqual(frozen_obmap, type(x[2]))
+        self.assertEqual(frozen_oblist, type(x[2]['a']))
+        self.assertTrue(x.freeze() is x)
+        self.assertEqual(x, self.makeList())
+        self.assertEqual(hash(x), hash(self.makeList().freeze()))
+        self.assertEqual(1, len(set([x, self.makeList().freeze()])))
+
+    def testImmutable(self):
+        x = self.makeList().freeze()
+        self.assertRaises(TypeError, x.append, 'baz')
+        self.assertRaises(TypeError, x.__setitem__, 0, 'baz')
+        self.assertRaises(TypeError, x.__delitem__, 0)
+        self.assertRaises(TypeError, x[2].__setitem__, 'b', 1)
+        self.assertRaises(TypeError, x[2].update, { 'b': 1 })
+
+    def testCachedSlaw(self):
+        x = self.makeList().freeze()
+        data = x.to_slaw(2)
+        self.assertEqual(data, self.makeList().to_slaw(2))
+        self.assertTrue(x.to_slaw(2) is data)
+        self.assertEqual(x.to_slaw(1), self.makeList().to_slaw(1))
+        outer = oblist([x, 'baz'])
+        self.assertEqual(outer.to_slaw(2), oblist([self.makeList(), 'baz']).to_slaw(2))
+
+    def testCachedKeys(self):
+        ## frozen strings aren't rewrapped in mutable containers, so their
+        ## cached encodings get used
+        key = frozen_obstring('key')
+        self.assertTrue(oblist([key])[0] is key)
+        self.assertTrue(loam.util.make_loamtype(key) is key)
+        m = obmap({ key: int32(1) })
+        expected = obmap({ 'key': int32(1) }).to_slaw(2)
+        self.assertEqual(m.to_slaw(2), expected)
+        ## swap in the encoding of a string just as long: the map has to
+        ## pick it up rather than encoding the key afresh
+        key._slaw_cache[2] = obstring('kez').to_slaw_v2()
+        self.assertEqual(m.to_slaw(2), obmap({ 'kez': int32(1) }).to_slaw(2))
+        self.assertEqual(m.slaw_v2_size(), len(expected))
+
+    def makeNumeric(self):
+        return oblist(['foo', v3float32(1, 2, 3), numeric_array([v2float64(1, 2), v2float64(3, 4)], v2float64), obcons(('k', oblist(['v'])))])
+
+    def testFreezeNumeric(self):
+        x = self.makeNumeric().freeze()
+        self.assertEqual(v3float32, type(x[1]))
+        self.assertEqual(frozen_numeric_array, type(x[2]))
+        self.assertEqual(frozen_oblist, type(x[3].right))
+        self.assertEqual(hash(x), hash(self.makeNumeric().freeze()))
+        self.assertRaises(TypeError, hash, v3float32(1, 2, 3))
+        data = x.to_slaw(2)
+        self.assertEqual(data, self.makeNumeric().to_slaw(2))
+        self.assertRaises(TypeError, x[1].__setitem__, 0, float32(9))
+        self.assertRaises(TypeError, x[2].append, v2float64(5, 6))
+        self.assertRaises(TypeError, x[2][0].__setitem__, 1, float64(9))
+        self.assertEqual(x.to_slaw(2), self.makeNumeric().to_slaw(2))
+
+    def testFrozenCopies(self):
+        x = self.makeList().freeze()
+        self.assertTrue(copy.copy(x) is x)
+        self.assertTrue(copy.deepcopy(x) is x)
+        self.assertTrue(copy.copy(x[2]) is x[2])
+        y = pickle.loads(pickle.dumps(x))
+        self.assertEqual(frozen_oblist, type(y))
+        self.assertEqual(frozen_obmap, type(y[2]))
+        self.assertEqual(y, x)
+        self.assertEqual(hash(y), hash(x))
+
 if '__main__' == __name__:
     main()
@@ -27,6 +27,9 @@ def make_loamtype(value):
         return make_obnumber(value)
     if type(value) in (datetime.date, datetime.datetime):
         return loam.obtime.obtimestamp(value)
+    if isinstance(value, loam.obstr.obstring):
+        ## (frozen obstrings keep their cached encodings)
+        return value
     #if type(value) in (str, unicode):
     if isinstance(value, str):
         return loam.obstr.obstring(value)
@@ -189,4 +192,94 @@ def make_obnumerics(*values):
     bits = 8
     maxint = 0
 
-import loam.obnum, loam.obvect, loam.obmv, loam.obstr, loam.obstruct, loam.numarr, loam.obtime
+def slaw_v2_size(obj):
+    """
+    Returns the length in bytes of obj encoded as version 2 slaw.  Types
+    that can work it out without encoding themselves have a slaw_v2_size()
+    method; anything else is encoded to find out.
+    """
+    f = getattr(obj, 'slaw_v2_size', None)
+    if f is not None:
+        return f()
+    return len(obj.to_slaw_v2())
+
+def encode_into(obj, buf, offset=0):
+    """
+    Writes obj as version 2 slaw into buf (a bytearray, mmap or writable
+    memoryview, with room for slaw_v2_size(obj) bytes) at offset, and
+    returns the offset just past what was written.
+    """
+    f = getattr(obj, 'encode_into', None)
+    if f is not None:
+        return f(buf, offset)
+    data = obj.to_slaw_v2()
+    end = offset + len(data)
+    buf[offset:end] = data
+    return end
+
+def encode_slaw2(obj):
+    """
+    Encodes obj as version 2 slaw in a single pass over one preallocated
+    buffer, rather than by concatenating the encodings of its parts.
+    """
+    buf = bytearray(slaw_v2_size(obj))
+    end = encode_into(obj, buf, 0)
+    if end != len(buf):
+        raise SlawWrongLengthException('%s encoded to %d bytes, expected %d' % (type(obj).__name__, end, len(buf)))
+    return bytes(buf)
+
+def freeze(value):
+    """
+    Returns an immutable version of value: the frozen variant of an
+    oblist, obmap, obcons, obstring, vector or numeric array (see their
+    freeze() methods), and value itself for everything else.
+    """
+    f = getattr(value, 'freeze', None)
+    if f is None:
+        return value
+    return f()
+
+class cached_slaw(object):
+    """
+    Mixin for the frozen loam types, which memoizes their slaw encodings.
+    It has to come before the loam type in the list of bases.
+    """
+
+    def __slaw(self):
+        try:
+            return self._slaw_cache
+        except AttributeError:
+            self._slaw_cache = dict()
+            return self._slaw_cache
+
+    def freeze(self):
+        return self
+
+    def to_slaw_v1(self):
+        cache = self.__slaw()
+        if 1 not in cache:
+            cache[1] = super(cached_slaw, self).to_slaw_v1()
+        return cache[1]
+
+    def to_slaw_v2(self):
+        cache = self.__slaw()
+        if 2 not in cache:
+            parent = super(cached_slaw, self)
+            if hasattr(parent, 'encode_into'):
+                buf = bytearray(parent.slaw_v2_size())
+                parent.encode_into(buf, 0)
+                cache[2] = bytes(buf)
+            else:
+                cache[2] = parent.to_slaw_v2()
+        return cache[2]
+
+    def slaw_v2_size(self):
+        return len(self.to_slaw_v2())
+
+    def encode_into(self, buf, offset=0):
+        data = self.to_slaw_v2()
+        end = offset + len(data)
+        buf[offset:end] = data
+        return end
+
+import loam.obnum, loam.obvect, loam.obmv, loam.obstr, loam.obstruct, loam.numarr, loam.obtime, loam.numtype
@@ -82,6 +82,8 @@ POOL_FLAG_STOP_WHEN_FULL = 1 << 0
 POOL_FLAG_FROZEN         = 1 << 1
 POOL_FLAG_AUTO_DISPOSE   = 1 << 2
 POOL_FLAG_CHECKSUM       = 1 << 3
+## locks are fcntl locks on the mmap file rather than SysV semaphores
+POOL_FLAG_FILE_LOCKS     = 1 << 4
 POOL_FLAG_SYNC           = 1 << 32
 
 KILOBYTE = 2**10
@@ -20,6 +20,7 @@ COMMAND_REQUIRED_STATE = {
     'oldest_index':           HOSE_STATE_PARTICIPATE,
     'deposit':                HOSE_STATE_PARTICIPATE,
     'deposit_ex':             HOSE_STATE_PARTICIPATE,
+    'deposit_many':           HOSE_STATE_PARTICIPATE,
     'curr':                   HOSE_STATE_PARTICIPATE,
     'next':                   HOSE_STATE_PARTICIPATE,
     'prev':                   HOSE_STATE_PARTICIPATE,
@@ -46,7 +47,7 @@ class Hose(object):
             #if args[0].startswith('tcp://'):
             #    return TCPHose(*args)
             #return MMapHose(*args)
-        return super(Hose, cls).__new__(cls, *args)
+        return super(Hose, cls).__new__(cls)
 
     def __init__(self, name):
         self._last_retort = None
@@ -558,6 +559,23 @@ class Hose(object):
         """
         return self.deposit(protein)
 
+    def deposit_many(self, proteins):
+        """
+        Deposit a batch of proteins into this pool, in order.  Local pools
+        take the deposit lock and wake awaiters just once for the whole
+        batch; remote pools send the deposits without waiting for each
+        reply in turn.
+
+        Returns a list of (index, timestamp) tuples, one per protein.  The
+        possible exceptions are those of deposit(); if one is raised, the
+        proteins before the one that failed have been deposited.
+        """
+        result = list()
+        for p in proteins:
+            ret = self.deposit_ex(p)
+            result.append((ret['index'], ret['timestamp']))
+        return result
+
     ## ------------------ ##
     ## Reading from Pools ##
     ## ------------------ ##
@@ -74,7 +74,11 @@ class HoseGang(object):
                 timeout = None
             elif timeout == POOL_NO_WAIT:
                 timeout = 0
-            (rlist, wlist, elist) = select.select(awaiters, [], [], timeout)
+            ## a hose may already have its protein buffered, in which case
+            ## select() won't report its socket
+            rlist = list(awaiters[i] for i in range(self.hose_count()) if self.__hoses[i].awaiter_ready())
+            if len(rlist) == 0:
+                (rlist, wlist, elist) = select.select(awaiters, [], [], timeout)
             if rlist is None or len(rlist) <= 0:
                 for x in self.__hoses:
                     x.cancel_awaiter()
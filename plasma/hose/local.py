@@ -23,9 +23,9 @@ class LocalHose(Hose):
         if isinstance(options, Protein):
             options = options.ingests()
         args = dict()
-        for key in ('resizable', 'single_file', 'size', 'index_capacity', 'mode', 'uid', 'gid', 'stop_when_full', 'frozen', 'auto_dispose', 'checksum', 'sync'):
+        for key in ('resizable', 'single_file', 'size', 'index_capacity', 'mode', 'uid', 'gid', 'stop_when_full', 'frozen', 'auto_dispose', 'checksum', 'sync', 'lock_backend'):
             xkey = key.replace('_', '-')
-            if options.has_key(xkey):
+            if xkey in options:
                 args[key] = options[xkey]
         retval = pool.create(**args)
         self._close('create')
@@ -74,6 +74,7 @@ class LocalHose(Hose):
         self._check_state('participate')
         self._pool = MMapPool(path)
         self._pool.participate()
+        self.__apply_options(options)
         self._hose_name = path
         self._is_configured = True
         self._state = HOSE_STATE_PARTICIPATE
@@ -89,11 +90,12 @@ class LocalHose(Hose):
         if isinstance(create_options, Protein):
             create_options = create_options.ingests()
         args = dict()
-        for key in ('resizable', 'single_file', 'size', 'index_capacity', 'mode', 'uid', 'gid', 'stop_when_full', 'frozen', 'auto_dispose', 'checksum', 'sync'):
+        for key in ('resizable', 'single_file', 'size', 'index_capacity', 'mode', 'uid', 'gid', 'stop_when_full', 'frozen', 'auto_dispose', 'checksum', 'sync', 'lock_backend'):
             xkey = key.replace('_', '-')
-            if create_options.has_key(xkey):
+            if xkey in create_options:
                 args[key] = create_options[xkey]
         self._pool.participate_creatingly(**args)
+        self.__apply_options(participate_options)
         self._hose_name = path
         self._is_configured = True
         self._state = HOSE_STATE_PARTICIPATE
@@ -103,6 +105,22 @@ class LocalHose(Hose):
             self._hose_index = -1
         self._pool.runout()
 
+    def __apply_options(self, options):
+        ## 'await-spin': see set_await_spin(); 'thread-locks' and
+        ## 'lock-timing': see MMapPool.set_thread_locks() and
+        ## set_lock_timing()
+        if isinstance(options, Protein):
+            options = options.ingests()
+        if not isinstance(options, dict):
+            ## (None, or obnil when participating over tcp)
+            return
+        if 'await-spin' in options:
+            self._pool.set_await_spin(options['await-spin'])
+        if 'thread-locks' in options:
+            self._pool.set_thread_locks(bool(options['thread-locks']))
+        if 'lock-timing' in options:
+            self._pool.set_lock_timing(bool(options['lock-timing']))
+
     def withdraw(self):
         self._check_state('withdraw')
         self._pool.withdraw()
@@ -188,6 +206,10 @@ class LocalHose(Hose):
         (index, timestamp) = self._pool.deposit_ex(protein)
         return obmap({ 'index': index, 'timestamp': timestamp })
 
+    def deposit_many(self, proteins):
+        self._check_state('deposit_many')
+        return self._pool.deposit_many(proteins)
+
     def curr(self):
         self._check_state('curr')
         protein = self._pool.curr()
@@ -254,11 +276,12 @@ class LocalHose(Hose):
         self._pool.save_last()
         while True:
             try:
-                protein = self._pool.prev()
+                protein = self._pool.prev(search, SEARCH_GAP)
             except PoolNoSuchProteinException:
                 self._pool.restore_last()
                 raise
-            if protein.descrips() and protein.matches(search, SEARCH_GAP):
+            ## the pool only decodes proteins whose descrips match
+            if protein is not None and protein.descrips():
                 self._hose_index = protein.index()
                 return protein
 
@@ -268,12 +291,12 @@ class LocalHose(Hose):
         orig_pos = self._pool.tell()
         while True:
             try:
-                protein = self._pool.await_next()
+                protein = self._pool.await_next(search=search, how=SEARCH_GAP)
             except PoolAwaitTimedoutException:
                 self._pool.restore_last()
                 self._pool.seek(orig_pos)
                 raise PoolNoSuchProteinException("no matching protein remaining in pool")
-            if protein.descrips() and protein.matches(search, SEARCH_GAP):
+            if protein is not None and protein.descrips():
                 self._hose_index = protein.index()
                 return protein
 
@@ -281,18 +304,27 @@ class LocalHose(Hose):
         self._check_state('await_next')
         return self._pool.await_next(timeout, interrupt=interrupt)
 
+    def set_await_spin(self, usec):
+        ## await_next() (and the other awaits) poll the pool for up to usec
+        ## microseconds before blocking on its notification, for the lowest
+        ## latency when deposits come close together; 0 turns it off.
+        ## get_info() reports how many awaits were answered each way
+        ## (await-spin-wakeups, await-block-wakeups).
+        self._check_state('await_next')
+        self._pool.set_await_spin(usec)
+
     def await_probe_frwd(self, search, timeout=POOL_WAIT_FOREVER, interrupt=None):
         self._check_state('await_probe_frwd')
         self._pool.save_last()
         #last = self._pool._last
         while True:
             try:
-                protein = self._pool.await_next(timeout, interrupt=interrupt)
+                protein = self._pool.await_next(timeout, interrupt=interrupt, search=search, how=SEARCH_GAP)
             except (PoolAwaitTimedoutException, PoolAwaitWokenException):
                 self._pool.restore_last()
                 #self._pool._last = last
                 raise
-            if protein.matches(search, SEARCH_GAP):
+            if protein is not None:
                 self._hose_index = protein.index()
                 return protein
 
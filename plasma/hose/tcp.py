@@ -66,6 +66,9 @@ POOL_CMD_FANCY_RESULT_1   = 64
 POOL_CMD_FANCY_RESULT_2   = 65
 POOL_CMD_FANCY_RESULT_3   = 66
 
+## deposit requests deposit_many() sends before reading the replies
+DEPOSIT_WINDOW = 64
+
 OLD_RETORTS = [
     (OB_UNKNOWN_ERR,          0, 2,    -203),
     (OB_ARGUMENT_WAS_NULL,    0, 2, -210000),
@@ -107,10 +110,8 @@ class TCPHose(Hose):
         else:
             HANDSHAKE[TCP_PROTOCOL_VERSION_INDEX] = TCP_PROTOCOL_VERSION
             HANDSHAKE[SLAW_VERSION_INDEX] = SLAW_VERSION
-            sendbytes = ''.join(chr(x) for x in HANDSHAKE)
-        #sock.sendall(sendbytes)
-        sb = ctypes.py_object(sendbytes)
-        sock.sendall(sb)
+            sendbytes = bytes(HANDSHAKE)
+        sock.sendall(sendbytes)
         recvbytes = sock.recv(1024)
         #print("handshake debug: recvbytes len:", len(recvbytes))
         if len(recvbytes) < 3:
@@ -132,7 +133,7 @@ class TCPHose(Hose):
             B = int(i / 8)
             b = i % 8
             #print 'bit %d (byte %d of %d (%d))' % (i, B, len(maskbytes), ops_bytes)
-            (byte,) = struct.unpack('B', maskbytes[B])
+            byte = maskbytes[B]
             ops[i] = bool((byte >> b) & 1)
         return (protocol_version, slaw_version, ops)
 
@@ -168,6 +169,7 @@ class TCPHose(Hose):
         #else:
         #    self._hose_name = 'tcp://%s/%s' % (host, name)
         self.__buffer = ''
+        self._stream = plasma.slaw.SlawStreamDecoder()
         if self._protocol_version == 1:
             self._flipped_wait = True
         if secure is not None:
@@ -208,14 +210,16 @@ class TCPHose(Hose):
             return False
         return self._operations[id]
 
-    def _send_request_noresp(self, command, *args):
+    def _request_data(self, command, *args):
         ing = obmap({ 'op': int32(command) })
         if len(args):
             ing['args'] = oblist(args)
         p = Protein(ingests=ing)
         #print 'send: %s' % p
-        data = p.to_slaw(self._slaw_version)
-        self._socket.sendall(data)
+        return p.to_slaw(self._slaw_version)
+
+    def _send_request_noresp(self, command, *args):
+        self._socket.sendall(self._request_data(command, *args))
 
     def _get_response(self):
         #fh = self._socket
@@ -237,7 +241,12 @@ class TCPHose(Hose):
         #    self.__buffer = xfh.read()
         #    file('/tmp/bad_data.remainder', 'w').write(self.__buffer)
         #    raise
-        x = plasma.slaw.parse_slaw(self._slaw_version, self)
+        if self._slaw_version == 2:
+            ## responses are framed off the socket in big recv_into() reads;
+            ## anything read past this one stays buffered for the next call
+            x = self._stream.read_slaw(self._socket)
+        else:
+            x = plasma.slaw.parse_slaw(self._slaw_version, self)
         #print 'recv: %s' % x
         ing = x.ingests()
         return (ing['op'], ing['args'])
@@ -260,10 +269,10 @@ class TCPHose(Hose):
     def _check_retort(self, retort, ok_retorts=OB_OK):
         ## remap old retorts
         key = (self._protocol_version, retort)
-        if OLD_RETORTS_LOOKUP.has_key(key):
+        if key in OLD_RETORTS_LOOKUP:
             retort = OLD_RETORTS_LOOKUP[key]
         self._last_retort = retort
-        if isinstance(ok_retorts, (int, long)):
+        if isinstance(ok_retorts, int):
             if retort == ok_retorts:
                 return True
         else:
@@ -273,7 +282,7 @@ class TCPHose(Hose):
 
     def read(self, size):
         #print 'sock read %d' % size
-        data = ''
+        data = b''
         while size > 0:
             read_size = 8192
             if read_size > size:
@@ -493,6 +502,25 @@ class TCPHose(Hose):
         return obmap({ 'index':     args[0],
                        'timestamp': obtimestamp(args[2]) })
 
+    def deposit_many(self, proteins):
+        self._check_state('deposit_many')
+        ## pipelined: a window of deposit requests goes out in one send,
+        ## then their replies are read back, so there's a round trip per
+        ## window rather than per protein.  (Bounding the window stops
+        ## unread replies from backing up while we're still sending.)
+        proteins = list(proteins)
+        result = list()
+        for i in range(0, len(proteins), DEPOSIT_WINDOW):
+            window = proteins[i:i+DEPOSIT_WINDOW]
+            self._socket.sendall(b''.join(self._request_data(OP_DEPOSIT, p) for p in window))
+            ## read every reply before checking any, to stay in step with
+            ## the server if one of them failed
+            replies = list(self._get_response() for p in window)
+            for (op, args) in replies:
+                self._check_retort(args[1])
+                result.append((args[0], obtimestamp(args[2])))
+        return result
+
     ## ------------------ ##
     ## Reading from Pools ##
     ## ------------------ ##
@@ -708,6 +736,13 @@ class TCPHose(Hose):
         self._hose_index = protein.index()
         return protein
 
+    def awaiter_ready(self):
+        """
+        True if the awaited protein has already been read off the socket
+        returned by start_awaiter(), so select() on it may never fire.
+        """
+        return self._awaiting and self._stream.ready()
+
     def cancel_awaiter(self):
         if self._awaiting:
             self._interrupt()
@@ -725,7 +760,10 @@ class TCPHose(Hose):
             if retort == POOL_NO_SUCH_PROTEIN:
                 if timeout == POOL_NO_WAIT:
                     raise PoolAwaitTimedoutException()
-                if timeout != POOL_WAIT_FOREVER:
+                if self._stream.ready():
+                    ## already read off the socket, select() won't see it
+                    pass
+                elif timeout != POOL_WAIT_FOREVER:
                     sfhs = [self._socket]
                     if interrupt is not None:
                         sfhs.append(interrupt)
@@ -757,7 +795,9 @@ class TCPHose(Hose):
             return self.next()
         self._send_request_noresp(OP_MULTI_ADD_AWAITER)
         try:
-            if timeout != POOL_WAIT_FOREVER:
+            if self._stream.ready():
+                pass
+            elif timeout != POOL_WAIT_FOREVER:
                 sfhs = [self._socket]
                 if interrupt is not None:
                     sfhs.append(interrupt)
@@ -841,15 +881,14 @@ class TCPHoseV0(TCPHose):
         self._port = port
         self._socket = self.opensocket(host, port)
 
-    def _send_request_noresp(self, command, *args):
+    def _request_data(self, command, *args):
         ing = obmap({ 'op': int32(command) })
         if len(args):
             ing['args'] = oblist(args)
         p = Protein(ingests=ing)
         #print 'send: %s' % p
         data = p.to_slaw(self._slaw_version)
-        datalen = struct.pack('>Qs' % len(data), data)
-        self._socket.sendall(datalen)
+        return struct.pack('>Qs' % len(data), data)
 
     def _get_response(self):
         size = struct.unpack('>Q', self.read(8))
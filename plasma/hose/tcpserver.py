@@ -20,6 +20,7 @@ class TCPServer(object):
         self._addr = addr
         self._secure = secure
         self.__last_buffer = ''
+        self._stream = plasma.slaw.SlawStreamDecoder()
         self.__name = None
         self.__process = addr
         self.__pid = os.getpid()
@@ -108,7 +109,7 @@ class TCPServer(object):
         maskbytes = list((0,) * oplen)
         for i in range(len(self.ops)):
             if self.ops[i] is not None:
-                n = i / 8
+                n = i // 8
                 maskbytes[n] |= (2**(i%8))
         opdata = struct.pack('%dB' % (len(maskbytes) + 3), pv, sv, len(maskbytes), *maskbytes)
         self._socket.sendall(opdata)
@@ -123,9 +124,14 @@ class TCPServer(object):
         if self._protocol_version == 0:
             size = struct.unpack('>Q', self._socket.read(8))[0]
         try:
-            p = plasma.slaw.parse_slaw(self._slaw_version, self)
+            if self._slaw_version == 2:
+                ## a whole request (or several) per recv_into(), instead of
+                ## a select() and recv() for every header field
+                p = self._stream.read_slaw(self._socket)
+            else:
+                p = plasma.slaw.parse_slaw(self._slaw_version, self)
             self.__op_count[p.ingests()['op']] += 1
-        except HoseDisconnectException:
+        except (HoseDisconnectException, ObDisconnectedException):
             return False
         return self.handle(p)
 
@@ -1,11 +1,13 @@
-import unittest, os, random, hashlib, time, socket, sys, time, subprocess
+import unittest, os, random, hashlib, time, socket, sys, time, subprocess, tempfile, shutil, threading
 from loam import *
 from plasma.protein import Protein
 from plasma.const import *
 from plasma.exceptions import *
 from plasma.hose import Hose, PoolFetchOp
 from plasma.hose.local import LocalHose
-from plasma.hose.tcp import TCPHose
+from plasma.hose.tcp import TCPHose, DEPOSIT_WINDOW
+from plasma.hose.tcpserver import TCPServer
+from plasma.pool.mmap import MMapPool
 
 SERVER_ALREADY_RUNNING = False
 POOL_SERVER_BIN = None
@@ -570,6 +572,66 @@ class LocalHoseTestCase(TCPHoseTestCase):
     def testIsConfigured(self):
         pass
 
+class TCPServerTestCase(unittest.TestCase):
+    """
+    A TCPHose talking to a TCPServer running in a thread, which serves
+    pools made in a scratch directory with file locks.
+    """
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix='pyplasma-test-')
+        self.orig_pools_dir = os.environ.get('OB_POOLS_DIR')
+        os.environ['OB_POOLS_DIR'] = self.dir
+        MMapPool(os.path.join(self.dir, 'pool')).create(size=102400, index_capacity=100, lock_backend='fcntl')
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.bind(('localhost', 0))
+        self.listener.listen(1)
+        self.thread = threading.Thread(target=self.serve)
+        self.thread.daemon = True
+        self.thread.start()
+        self.hose = Hose.participate('tcp://localhost:%d/pool' % self.listener.getsockname()[1])
+
+    def tearDown(self):
+        self.hose.withdraw()
+        self.thread.join(5)
+        self.listener.close()
+        if self.orig_pools_dir is None:
+            del os.environ['OB_POOLS_DIR']
+        else:
+            os.environ['OB_POOLS_DIR'] = self.orig_pools_dir
+        shutil.rmtree(self.dir, True)
+
+    def serve(self):
+        (conn, addr) = self.listener.accept()
+        try:
+            TCPServer(conn, addr).runloop()
+        finally:
+            conn.close()
+
+    def testDepositMany(self):
+        self.assertIsInstance(self.hose, TCPHose)
+        self.assertEqual(self.hose.deposit(Protein()), 0)
+        ## more than one window of requests
+        n = DEPOSIT_WINDOW * 2 + 22
+        ps = list(Protein(['batch'], { 'i': int64(i) }) for i in range(n))
+        ret = self.hose.deposit_many(ps)
+        self.assertEqual(list(x[0] for x in ret), list(range(1, n + 1)))
+        self.assertIsInstance(ret[0][1], obtimestamp)
+        self.assertTrue(ret[0][1] <= ret[-1][1])
+        self.assertEqual(self.hose.newest_index(), n)
+        self.assertEqual(self.hose.nth_protein(75).ingests()['i'], 74)
+        self.assertEqual(self.hose.deposit_many([]), [])
+        self.assertEqual(self.hose.deposit(Protein()), n + 1)
+
+    def testDepositManyFails(self):
+        ## the proteins before the one the pool refuses are deposited, and
+        ## the hose stays in step with the server
+        ps = [Protein(['first']), Protein(['huge'], { 'pad': 'x' * 200000 }), Protein(['last'])]
+        self.assertRaises(PoolProteinBiggerThanPoolException, self.hose.deposit_many, ps)
+        self.assertEqual(self.hose.nth_protein(0).descrips(), ['first'])
+        self.assertEqual(self.hose.newest_index(), 1)
+        self.assertEqual(self.hose.deposit(Protein(['after'])), 2)
+
 if '__main__' == __name__:
     unittest.main()
 
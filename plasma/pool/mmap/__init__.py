@@ -1,26 +1,37 @@
-import os, struct, select, datetime, pwd, grp, mmap, random, time, logging, fcntl, traceback
+import os, struct, select, datetime, pwd, grp, mmap, random, time, logging, fcntl, traceback, errno
 from loam import *
+from loam.util import slaw_v2_size, encode_into
 from plasma.const import *
 import plasma.config
 from plasma.exceptions import *
-from plasma.sem_ops import SemaphoreSet
+from plasma.sem_ops import SemaphoreSet, FileLockSet, ThreadLockedSet, TimedLockSet, LOCK_BACKENDS, lock_stats, forget_lock_stats
 import plasma.util
-from plasma.pool.util import makedirs, with_umask
+from plasma.pool.util import makedirs, with_umask, open_exlocked
 import plasma.slaw
-from plasma.protein import Protein
+from plasma.protein import Protein, LazyProtein, descrips_match
 from plasma.slaw import BINARY_MAGIC
 from plasma.pool.mmap.chunks import *
+from plasma.pool.mmap.cache import OffsetIndex, shared_offset_cache, forget_offset_cache, protein_cache
 
 #DEFAULT_MODE = 0777
 DEFAULT_MODE = 0o777
 DEFAULT_OWNER = -1
 DEFAULT_GROUP = -1
 NULL_BYTE = chr(0)
-CACHE_SIZE = 1000
 MY_CONFIG_LOCK = None
 POOL_MMAP_V0_HEADER_SIZE = 24
 POOL_MMAP_MAGICV0 = 0x00065b0000af4c81
 POOL_MMAP_SLAW_VERSION_SHIFTY = 24
+WAKE_POLL_INTERVAL = 0.01
+RECORD_HEAD = struct.Struct('dQ')
+RECORD_TAIL = struct.Struct('Q')
+SLAW_HEADER = struct.Struct('Q')
+POINTERS = struct.Struct('qq')
+SNAPSHOT_SPINS = 1000
+## spin-then-block awaits: polls of the pool header before each one backs
+## off with sched_yield()
+AWAIT_SPIN_BUSY = 64
+sched_yield = getattr(os, 'sched_yield', lambda: time.sleep(0))
 
 class MMapPool(object):
 
@@ -35,12 +46,42 @@ class MMapPool(object):
         self.__is_iterating = False
         self.__iterator_stopped = False
         self.__sem = None
+        ## whether threads in this process queue up in front of the pool's
+        ## locks (see set_thread_locks())
+        self.__thread_locks = False
+        ## whether this handle times its locks (see set_lock_timing())
+        self.__lock_timing = False
         self.__indx = None
+        self.__gnrt = None
+        self.__wake = None
+        ## our wakeup fifo, kept from the first await until the pool is
+        ## closed: (slot in the wake chunk, name, file)
+        self.__endpoint = None
+        ## fifos of other hoses we've woken, kept open: name -> fd
+        self.__wakers = dict()
         self.__chunks = None
         self.__mmap = None
         self.__fh = None
         self.__mmap_file = None
-        self.__cache_buffer = None
+        ## identifies the pool file in the caches shared between pool objects
+        self.__key = None
+        ## index -> (offset, size), shared with the other pool objects open
+        ## on the same file
+        self.__offsets = None
+        ## index -> offset for the run of proteins this handle has seen
+        self.__dense = OffsetIndex()
+        self.__view = None
+        ## proteins evicted by deposits through this handle, the number of
+        ## deposits that evicted any, and how many evicted proteins had to
+        ## be stepped over one by one (rather than jumped via the index)
+        self.__evictions = 0
+        self.__eviction_runs = 0
+        self.__eviction_skips = 0
+        ## microseconds await_next() spends polling before it blocks, and
+        ## how many awaits were answered by polling or had to block
+        self.__await_spin = 0
+        self.__spin_wakeups = 0
+        self.__block_wakeups = 0
 
     ## ---------------- ##
     ## file() interface ## 
@@ -120,32 +161,48 @@ class MMapPool(object):
         self.__pool_pos += size
         return data
 
-    def readline(self, size=None):
+    def readline(self, size=None, search=None, how=SEARCH_GAP):
+        ## with a search, a protein whose descrips don't match is stepped
+        ## over without decoding the rest of it, and None is returned
         pos = self.tell()
-        (old, new) = self.__pointers()
+        (old, new, next_index, generation) = self.__snapshot()
         if pos < old:
             raise PoolNoSuchProteinException("oldest pointer has advanced beyond pool pointer")
         if pos > new:
             raise PoolNoSuchProteinException("pool pointer has advanced beyond newest pointer")
         try:
-            (timestamp, index) = struct.unpack('dQ', self.read(16))
-            protein = plasma.slaw.parse_slaw(self.__slaw_version, self)
-            (jumpback,) = struct.unpack('Q', self.read(8))
+            if self.__slaw_version == 2:
+                (timestamp, index, protein, jumpback) = self.__decode_record(pos, search is not None, generation, old)
+            elif search is not None:
+                (timestamp, index) = struct.unpack('dQ', self.read(16))
+                protein = plasma.slaw.parse_descrips(self.__slaw_version, self)
+                (jumpback,) = struct.unpack('Q', self.read(8))
+            else:
+                (timestamp, index) = struct.unpack('dQ', self.read(16))
+                protein = plasma.slaw.parse_slaw(self.__slaw_version, self)
+                (jumpback,) = struct.unpack('Q', self.read(8))
             #if self.tell() % self.file_size() == 0:
             #    self.seek(self.header_size(), 1)
-            self.__quick_cache(index, pos, jumpback)
         except StompledException:
             self.seek(pos)
             raise
+        if search is not None:
+            ## only the descrips have been decoded; the rest is only worth
+            ## decoding if they match
+            if descrips_match(protein, search, how):
+                self.seek(pos)
+                return self.readline()
+            protein = None
         try:
             timestamp = obtimestamp(timestamp)
         except:
             #print "bad timestamp: %f at %d (%d)" % (timestamp, pos, pos % self.file_size())
             print("bad timestamp: %f at %d (%d)" % (timestamp, pos, pos % self.file_size()))
             raise
-        protein.set_origin(self)
-        protein.set_index(index)
-        protein.set_timestamp(timestamp)
+        if protein is not None:
+            protein.set_origin(self)
+            protein.set_index(index)
+            protein.set_timestamp(timestamp)
         self.__last = {
             'start':     pos,
             'end':       self.tell(),
@@ -183,14 +240,7 @@ class MMapPool(object):
         self.deposit(protein)
 
     def writelines(self, proteins):
-        if self.frozen():
-            raise PoolFrozenException()
-        self.__deposit_lock()
-        try:
-            for p in proteins:
-                self.__deposit(protein)
-        finally:
-            self.__deposit_unlock()
+        self.deposit_many(proteins)
 
     def xreadlines(self):
         return self
@@ -212,10 +262,11 @@ class MMapPool(object):
                frozen=False,
                auto_dispose=False,
                checksum=False,
-               sync=False):
+               sync=False,
+               lock_backend='sysv'):
         self.__config_lock()
         try:
-            self.__create(resizable, single_file, size, index_capacity, mode, uid, gid, stop_when_full, frozen, auto_dispose, checksum, sync)
+            self.__create(resizable, single_file, size, index_capacity, mode, uid, gid, stop_when_full, frozen, auto_dispose, checksum, sync, lock_backend)
         finally:
             self.__config_unlock()
 
@@ -235,11 +286,12 @@ class MMapPool(object):
                                frozen=False,
                                auto_dispose=False,
                                checksum=False,
-                               sync=False):
+                               sync=False,
+                               lock_backend='sysv'):
         self.__config_lock()
         try:
             if not self.exists():
-                self.__create(resizable, single_file, size, index_capacity, mode, uid, gid, stop_when_full, frozen, auto_dispose, checksum, sync)
+                self.__create(resizable, single_file, size, index_capacity, mode, uid, gid, stop_when_full, frozen, auto_dispose, checksum, sync, lock_backend)
             return self.participate()
         finally:
             self.__config_unlock()
@@ -258,6 +310,7 @@ class MMapPool(object):
             #else:
             #    self.__init_v0(dv)
             self.__open()
+            self.__forget_file(self.__key)
             fh = self.__lock_pool()
             self.__mmap.close()
             self.__sem.destroy()
@@ -470,30 +523,51 @@ class MMapPool(object):
     def deposit(self, protein):
         if self.frozen():
             raise PoolFrozenException()
+        record = self.__encode_record(protein)
         self.__deposit_lock()
         try:
-            (index, timestamp, offset) = self.__deposit(protein)
+            (index, timestamp, offset) = self.__deposit(record)
         finally:
             self.__deposit_unlock()
+        self.__quick_cache(index, offset, len(record))
         return int64(index)
 
     def deposit_ex(self, protein):
         if self.frozen():
             raise PoolFrozenException()
+        record = self.__encode_record(protein)
         self.__deposit_lock()
         try:
-            (index, timestamp, offset) = self.__deposit(protein)
+            (index, timestamp, offset) = self.__deposit(record)
         finally:
             self.__deposit_unlock()
+        self.__quick_cache(index, offset, len(record))
         return (int64(index), timestamp)
 
-    def nth_protein(self, idx):
+    def deposit_many(self, proteins):
+        ## all the proteins are encoded before taking the deposit lock, and
+        ## the lock is taken (and awaiters woken) just once
+        if self.frozen():
+            raise PoolFrozenException()
+        records = list(self.__encode_record(p) for p in proteins)
+        if len(records) == 0:
+            return list()
+        self.__deposit_lock()
+        try:
+            deposited = self.__deposit_many(records)
+        finally:
+            self.__deposit_unlock()
+        for (record, (index, timestamp, offset)) in zip(records, deposited):
+            self.__quick_cache(index, offset, len(record))
+        return list((int64(index), timestamp) for (index, timestamp, offset) in deposited)
+
+    def nth_protein(self, idx, search=None, how=SEARCH_GAP):
         found = self.seek_to(idx)
         try:
             pos = self.tell()
-            p = self.readline()
-            if p.index() != idx:
-                raise Exception("expected index %d at %d, got %d" % (idx, pos, p.index()))
+            p = self.readline(search=search, how=how)
+            if self.__last['index'] != idx:
+                raise Exception("expected index %d at %d, got %d" % (idx, pos, self.__last['index']))
             return p
             return self.readline()
         except StompledException:
@@ -582,7 +656,7 @@ class MMapPool(object):
         if new < self.file_size():
             ## pool hasn't wrapped, but oldest pointer may have advanced
             return old
-        n = int(new / self.file_size())
+        n = new // self.file_size()
         return n * self.file_size() + self.header_size()
 
     def last_index(self):
@@ -612,6 +686,14 @@ class MMapPool(object):
 
     def curr(self):
         if self.__last is not None:
+            if self.__last['protein'] is None:
+                ## stepped over by a search, so it still needs decoding
+                pos = self.tell()
+                self.seek(self.__last['start'])
+                try:
+                    self.readline()
+                finally:
+                    self.seek(pos)
             return self.__last['protein']
         (old, new) = self.__pointers()
         if self.tell() > new:
@@ -621,7 +703,7 @@ class MMapPool(object):
         except StompledException:
             return self.curr()
 
-    def prev(self):
+    def prev(self, search=None, how=SEARCH_GAP):
         if self.__last is None:
             ## we haven't read anything yet, so let's do that
             (old, new) = self.__pointers()
@@ -636,22 +718,26 @@ class MMapPool(object):
                     raise PoolNoSuchProteinException("pool is empty")
                 self.seek(new)
                 try:
-                    return self.readline()
+                    return self.readline(search=search, how=how)
                 except StompledException:
-                    return self.prev()
+                    return self.prev(search, how)
         if self.__last['index'] > 0:
-            return self.nth_protein(self.__last['index'] - 1)
+            return self.nth_protein(self.__last['index'] - 1, search, how)
         raise PoolNoSuchProteinException("already at protein zero")
 
-    def await_next(self, timeout=POOL_NO_WAIT, interrupt=None):
+    def await_next(self, timeout=POOL_NO_WAIT, interrupt=None, search=None, how=SEARCH_GAP):
         (old, new) = self.__pointers()
         if self.tell() < old:
             self.seek(old)
         if self.tell() > new:
             if timeout == POOL_NO_WAIT:
                 raise PoolAwaitTimedoutException()
-            #self.await(timeout, interrupt=interrupt)
-            self._await(timeout, interrupt=interrupt)
+            if self.__await_spin > 0:
+                timeout = self.__spin(timeout)
+            if timeout is not None:
+                #self.await(timeout, interrupt=interrupt)
+                self._await(timeout, interrupt=interrupt)
+                self.__block_wakeups += 1
         (old, new) = self.__pointers()
         if self.tell() < old:
             self.seek(old)
@@ -672,11 +758,62 @@ class MMapPool(object):
                     self.seek(first_pos)
                 else:
                     self.seek(pos)
-            return self.readline()
+            return self.readline(search=search, how=how)
         except StompledException:
-            return self.await_next()
+            return self.await_next(search=search, how=how)
+
+    def __spin(self, timeout):
+        ## Polls the header for a deposit past our position, for up to the
+        ## spin budget (or the timeout, if that's sooner): busily at first,
+        ## then yielding the cpu between polls.  Only the generation is read
+        ## each time round, the pointers only when it moves.  Returns None
+        ## if a deposit turned up, otherwise what's left of the timeout.
+        ## (The interrupt isn't looked at until we block.)
+        start = time.time()
+        budget = self.__await_spin / 1000000.0
+        if timeout != POOL_WAIT_FOREVER:
+            budget = min(budget, timeout)
+        gnrt = self.__gnrt
+        seen = None
+        generation = None
+        polls = 0
+        while True:
+            if gnrt is not None:
+                generation = gnrt.generation
+            if generation is None or generation != seen:
+                seen = generation
+                (old, new) = self.__pointers()
+                if self.tell() <= new:
+                    self.__spin_wakeups += 1
+                    return None
+            elapsed = time.time() - start
+            if elapsed >= budget:
+                break
+            polls += 1
+            if polls > AWAIT_SPIN_BUSY:
+                sched_yield()
+        if timeout == POOL_WAIT_FOREVER:
+            return timeout
+        return max(timeout - elapsed, 0)
+
+    def set_await_spin(self, usec):
+        ## Before await_next() blocks on the pool's notification, it polls
+        ## the pool header for up to usec microseconds, which saves the
+        ## wakeup (a fifo write and a select() return) when deposits follow
+        ## each other closely, at the cost of the cpu burnt polling.  0 (the
+        ## default) always blocks at once.
+        self.__await_spin = max(int(usec), 0)
+
+    def await_spin(self):
+        return self.__await_spin
 
     def get_info(self):
+        locks = lock_stats(self.__key)
+        cache = self.__offsets.stats()
+        if protein_cache() is not None:
+            proteins = protein_cache().stats()
+        else:
+            proteins = { 'budget': 0, 'used': 0, 'hits': 0, 'misses': 0 }
         if self.__indx is not None:
             index_capacity = self.__indx.capacity
             index_step = self.__indx.step
@@ -700,6 +837,35 @@ class MMapPool(object):
             'auto-dispose':      obbool(self.auto_dispose()),
             'checksum':          obbool(self.checksum()),
             'sync':              obbool(self.sync()),
+            'evictions':         unt64(self.__evictions),
+            'eviction-runs':     unt64(self.__eviction_runs),
+            'eviction-skips':    unt64(self.__eviction_skips),
+            'offset-cache-policy':    obstring(cache['policy']),
+            'offset-cache-capacity':  unt64(cache['capacity']),
+            'offset-cache-entries':   unt64(cache['entries']),
+            'offset-cache-hits':      unt64(cache['hits']),
+            'offset-cache-misses':    unt64(cache['misses']),
+            'offset-cache-evictions': unt64(cache['evictions']),
+            'offset-cache-stale':     unt64(cache['stale']),
+            'offset-index-entries':   unt64(len(self.__dense)),
+            'protein-cache-budget':   unt64(proteins['budget']),
+            'protein-cache-used':     unt64(proteins['used']),
+            'protein-cache-hits':     unt64(proteins['hits']),
+            'protein-cache-misses':   unt64(proteins['misses']),
+            'lock-backend':           obstring(self.__sem.backend()),
+            'thread-locks':           obbool(self.__thread_locks),
+            'lock-timing':            obbool(self.__lock_timing),
+            'deposit-lock-uncontended':      unt64(locks.deposit.uncontended),
+            'deposit-lock-contended':        unt64(locks.deposit.contended),
+            'deposit-lock-wait':             oblist(unt64(n) for n in locks.deposit.wait),
+            'deposit-lock-hold':             oblist(unt64(n) for n in locks.deposit.hold),
+            'notification-lock-uncontended': unt64(locks.notification.uncontended),
+            'notification-lock-contended':   unt64(locks.notification.contended),
+            'notification-lock-wait':        oblist(unt64(n) for n in locks.notification.wait),
+            'notification-lock-hold':        oblist(unt64(n) for n in locks.notification.hold),
+            'await-spin':             unt64(self.__await_spin),
+            'await-spin-wakeups':     unt64(self.__spin_wakeups),
+            'await-block-wakeups':    unt64(self.__block_wakeups),
         })
         pass
 
@@ -710,6 +876,8 @@ class MMapPool(object):
     #def await(self, timeout=POOL_WAIT_FOREVER, interrupt=None):
     #BAU: await is now a reserved word
     def _await(self, timeout=POOL_WAIT_FOREVER, interrupt=None):
+        if self.__wake is not None:
+            return self.__await_endpoint(timeout, interrupt)
         fh = self.add_awaiter()
         (old, new) = self.__pointers()
         if self.tell() <= new:
@@ -736,6 +904,46 @@ class MMapPool(object):
             return POOL_WAIT_FOREVER
         return timeout - (end - start)
 
+    def __await_endpoint(self, timeout, interrupt):
+        ## waits on our wakeup fifo (or, if the wake chunk has no free slot
+        ## for one, polls) until the newest pointer passes our position
+        fh = self.__open_endpoint()
+        deadline = None
+        if timeout != POOL_WAIT_FOREVER:
+            deadline = time.time() + timeout
+        while True:
+            if fh is not None:
+                ## forget wakeups for deposits from before we look
+                self.__drain_endpoint()
+            (old, new) = self.__pointers()
+            if self.tell() <= new:
+                break
+            if timeout == POOL_NO_WAIT:
+                raise PoolAwaitTimedoutException()
+            wait = None
+            if deadline is not None:
+                wait = deadline - time.time()
+                if wait <= 0:
+                    raise PoolAwaitTimedoutException()
+            if fh is not None and self.__arm_endpoint():
+                ## a deposit from before we armed won't have woken us
+                (old, new) = self.__pointers()
+                if self.tell() <= new:
+                    break
+            sfhs = list()
+            if fh is not None:
+                sfhs.append(fh)
+            elif wait is None or wait > WAKE_POLL_INTERVAL:
+                wait = WAKE_POLL_INTERVAL
+            if interrupt is not None:
+                sfhs.append(interrupt)
+            (rlist, wlist, xlist) = select.select(sfhs, [], [], wait)
+            if interrupt is not None and interrupt in rlist:
+                raise PoolAwaitWokenException()
+        if deadline is None or timeout == POOL_NO_WAIT:
+            return timeout
+        return max(deadline - time.time(), 0)
+
     def file_size(self):
         return self.__size
         if self.__pool_version == 0:
@@ -772,6 +980,8 @@ class MMapPool(object):
                 pass
 
     def add_awaiter(self):
+        if self.__wake is not None:
+            return self.__open_endpoint()
         self.__notification_lock()
         try:
             fh = self.__open_fifo()
@@ -780,12 +990,98 @@ class MMapPool(object):
         return fh
 
     def remove_awaiter(self):
+        if self.__wake is not None:
+            ## the endpoint stays registered until the pool is closed
+            return None
         self.__notification_lock()
         try:
             self.__close_fifo()
         finally:
             self.__notification_unlock()
 
+    def __open_endpoint(self):
+        ## Our wakeup fifo, made and registered in the wake chunk the first
+        ## time we await, and kept until we close, so awaiting and
+        ## depositing don't touch the filesystem.  None if every slot is
+        ## taken (awaits then poll).
+        if self.__endpoint is not None:
+            return self.__endpoint[2]
+        self.__notification_lock()
+        try:
+            fifo_file = None
+            while fifo_file is None or os.path.exists(fifo_file):
+                fifo_name = ''.join(RANDCHARS[random.randint(0, len(RANDCHARS)-1)] for i in range(12))
+                fifo_file = os.path.join(self.__notification_directory, fifo_name)
+            slot = self.__wake.register(os.getpid(), fifo_name)
+            if slot is None:
+                ## idle slots are never written to, so hoses that died
+                ## without unregistering are only found here
+                self.__reap_endpoints()
+                slot = self.__wake.register(os.getpid(), fifo_name)
+            if slot is None:
+                return None
+            os.mkfifo(fifo_file, 0o622)
+            ## opened for writing too, so it never reads as closed when
+            ## depositors close their ends; without blocking, so it can be
+            ## drained.  (And opened before a depositor can find it
+            ## registered but with no reader, and clear it.)
+            fh = os.fdopen(os.open(fifo_file, os.O_RDWR|os.O_NONBLOCK), 'rb', 0)
+        finally:
+            self.__notification_unlock()
+        self.__endpoint = (slot, fifo_file, fh)
+        return fh
+
+    def __arm_endpoint(self):
+        ## ask for a wakeup on the next deposit; true if we weren't already
+        ## armed.  Only a deposit moves an armed slot on (to pending), so
+        ## it's safe to check without the lock.
+        slot = self.__endpoint[0]
+        if self.__wake.state(slot) == WAKE_ARMED:
+            return False
+        self.__notification_lock()
+        try:
+            self.__wake.arm(slot)
+        finally:
+            self.__notification_unlock()
+        return True
+
+    def __drain_endpoint(self):
+        try:
+            while os.read(self.__endpoint[2].fileno(), 4096):
+                pass
+        except (IOError, OSError):
+            ## EAGAIN: nothing (more) to read
+            pass
+
+    def __reap_endpoints(self):
+        ## called with the notification lock held
+        for (slot, pid, state, name) in self.__wake.endpoints():
+            try:
+                os.kill(pid, 0)
+            except OSError as e:
+                if e.errno == errno.ESRCH:
+                    self.__wake.unregister(slot)
+                    try:
+                        os.unlink(os.path.join(self.__notification_directory, name))
+                    except OSError:
+                        pass
+
+    def __close_endpoint(self):
+        if self.__endpoint is not None:
+            (slot, fifo_file, fh) = self.__endpoint
+            self.__endpoint = None
+            self.__notification_lock()
+            try:
+                self.__wake.unregister(slot)
+            finally:
+                self.__notification_unlock()
+            fh.close()
+            if os.path.exists(fifo_file):
+                os.remove(fifo_file)
+        for fd in self.__wakers.values():
+            os.close(fd)
+        self.__wakers = dict()
+
     def __open_fifo(self):
         fifo_name = ''.join(RANDCHARS[random.randint(0, len(RANDCHARS)-1)] for i in range(12))
         fifo_file = os.path.join(self.__notification_directory, fifo_name)
@@ -822,14 +1118,57 @@ class MMapPool(object):
                 pass
 
     def __wake_awaiters(self):
+        if self.__wake is not None and self.__wake.waiters == 0:
+            ## nobody is blocked (or they've all been woken already); a
+            ## waiter arms before it looks at the pointers we've just moved
+            return
         self.__notification_lock()
         try:
+            if self.__wake is not None:
+                endpoints = self.__wake.endpoints()
+                for (slot, pid, state, name) in endpoints:
+                    if state == WAKE_ARMED:
+                        self.__wake.fire(slot)
+                        self.__wake_endpoint(slot, name)
+                if len(self.__wakers) > len(endpoints):
+                    ## close the fifos of hoses that have gone
+                    names = set(name for (slot, pid, state, name) in endpoints)
+                    for name in list(self.__wakers):
+                        if name not in names:
+                            os.close(self.__wakers.pop(name))
+                return
             for fname in os.listdir(self.__notification_directory):
                 fifo = os.path.join(self.__notification_directory, fname)
                 self.__write_fifo(fifo)
         finally:
             self.__notification_unlock()
 
+    def __wake_endpoint(self, slot, name):
+        ## write a byte to a registered fifo, keeping it open for the next
+        ## deposit; a fifo nobody has open for reading any more belonged to
+        ## a hose that went away without unregistering
+        fd = self.__wakers.get(name)
+        try:
+            if fd is None:
+                fd = os.open(os.path.join(self.__notification_directory, name), os.O_WRONLY|os.O_NONBLOCK)
+                self.__wakers[name] = fd
+            os.write(fd, NULL_BYTE.encode('ascii'))
+        except (IOError, OSError) as e:
+            if e.errno == errno.EAGAIN:
+                ## full of wakeups it hasn't read yet
+                return
+            if fd is not None:
+                os.close(fd)
+                del(self.__wakers[name])
+            if e.errno in (errno.ENXIO, errno.EPIPE, errno.ENOENT):
+                self.__wake.unregister(slot)
+                try:
+                    os.unlink(os.path.join(self.__notification_directory, name))
+                except OSError:
+                    pass
+            else:
+                logging.exception("error while notifying fifo %s" % name)
+
     def clear_iterator(self):
         self.__is_iterating = False
         self.__iterator_stopped = False
@@ -894,9 +1233,10 @@ class MMapPool(object):
             raise PoolNoSuchProteinException("protein %d no longer in pool" % index)
         ## try the cache
         offset = self.__quick_lookup(index)
-        if offset is not None:
+        if offset is not None and self.__index_at(offset) == index:
             self.seek(offset)
             return index
+        last = self.__dense.last()
         orig_pos = self.tell()
         (first_index, first_pos) = self.first_index_and_offset()
         (old, new) = self.__pointers()
@@ -916,6 +1256,10 @@ class MMapPool(object):
                 start_index = self.__last['index']
                 start_pos = self.__last['start']
                 #print "(3) start_pos = %d / %d" % (start_pos, start_index)
+        if last is not None and last[1] >= old:
+            ## carry on from the end of the offset index, which extends it
+            if index >= last[0] and index - last[0] < index - start_index:
+                (start_index, start_pos) = last
         if self.__indx is not None:
             (xidx, offset, ts) = self.__indx.find(index)
             if xidx is not None and offset >= old and abs(index - xidx) < abs(index - start_index) and xidx <= index:
@@ -971,6 +1315,71 @@ class MMapPool(object):
     def sync(self):
         return self.has_flag(POOL_FLAG_SYNC)
 
+    def set_zero_copy(self, on=True):
+        ## With zero copy on, proteins read from a version 2 pool are views
+        ## straight into the mmap: nothing is copied until a part of the
+        ## protein is decoded, and rude data (and numpy-backed numeric
+        ## arrays) are read-only views of the pool.  Those only stay good
+        ## until the pool wraps round and overwrites the protein, which its
+        ## is_valid() reports.  (Proteins never straddle the end of the
+        ## pool, so a single view of the record always does.)
+        if on and self.__view is None and self.__slaw_version == 2:
+            self.__view = memoryview(self.__mmap).toreadonly()
+        elif not on and self.__view is not None:
+            ## (not released: proteins read through it may still use it)
+            self.__view = None
+
+    def zero_copy(self):
+        return self.__view is not None
+
+    def set_offset_cache(self, capacity=None, policy=None):
+        ## Switches to a cache of protein offsets with the given capacity and
+        ## eviction policy ('lru' or 'clock'; see plasma.pool.mmap.cache),
+        ## which pools opened on this file from now on share.
+        self.__offsets = shared_offset_cache(self.__key, capacity, policy)
+
+    def offset_cache(self):
+        return self.__offsets
+
+    def build_offset_index(self):
+        ## Fills in this handle's offset index for every protein in the
+        ## pool, with one pass over the record headers (each record is
+        ## skipped, not decoded), after which seek_to() (and so
+        ## nth_protein() and prev()) finds any of them without stepping
+        ## through the pool.  New proteins are added as they're read.
+        pos = self.tell()
+        last = self.__last
+        try:
+            (old, new) = self.__pointers()
+            if new < old:
+                return 0
+            self.__dense.clear()
+            self.seek(old)
+            (first_index, first_pos) = self.first_index_and_offset()
+            while self.tell() <= new:
+                ## (skip() moves on to the oldest protein if this one has
+                ## just been overwritten, which starts the index over)
+                index = self.skip()
+                if index == first_index - 1:
+                    self.seek(first_pos)
+        finally:
+            self.seek(pos)
+            self.__last = last
+        return len(self.__dense)
+
+    def snapshot(self):
+        ## (oldest, newest, next index, generation) as of a single moment.
+        ## A reader can take a snapshot, read any number of proteins, and
+        ## then check generation() once: if it hasn't changed, nothing was
+        ## deposited (or evicted) in the meantime.  The generation is None
+        ## for pools without a generation chunk.
+        return self.__snapshot()
+
+    def generation(self):
+        if self.__gnrt is None:
+            return None
+        return self.__gnrt.generation
+
     def save_last(self):
         self.__saved_last = self.__last
 
@@ -991,7 +1400,7 @@ class MMapPool(object):
             logging.error("already have config lock")
             return False
         logging.debug("acquiring config lock")
-        MY_CONFIG_LOCK = os.open(plasma.config.config_lock_dir(), os.O_EXLOCK|os.O_DIRECTORY)
+        MY_CONFIG_LOCK = open_exlocked(plasma.config.config_lock_dir())
         logging.debug("config lock acquired")
         return True
 
@@ -1006,6 +1415,53 @@ class MMapPool(object):
         logging.debug("config lock released")
         return True
 
+    def set_thread_locks(self, on=True):
+        ## Stacks a threading lock in front of each of the pool's locks,
+        ## shared by the handles on the pool in this process, so threads
+        ## depositing to (or awaiting) the same pool wait for one another
+        ## in the process, and only one of them at a time goes on to the
+        ## semaphore (or file lock).  Handles that don't use it still
+        ## exclude each other through the process lock, just less cheaply.
+        ## Not to be changed while the handle holds a lock.
+        self.__thread_locks = on
+        if self.__sem is not None:
+            self.__sem = self.__stack_locks(self.__sem)
+
+    def thread_locks(self):
+        return self.__thread_locks
+
+    def lock_backend(self):
+        ## 'sysv' or 'fcntl' (see plasma.sem_ops), chosen when the pool
+        ## was created
+        return self.__sem.backend()
+
+    def set_lock_timing(self, on=True):
+        ## Times how long this handle waits for and holds the deposit and
+        ## notification locks, into histograms shared by the handles on
+        ## the pool in this process, which get_info() reports (see
+        ## plasma.sem_ops.LockStats).  Off, the locks aren't timed at all.
+        ## Not to be changed while the handle holds a lock.
+        self.__lock_timing = on
+        if self.__sem is not None:
+            self.__sem = self.__stack_locks(self.__sem)
+
+    def lock_timing(self):
+        return self.__lock_timing
+
+    def reset_lock_stats(self):
+        lock_stats(self.__key).reset()
+
+    def __stack_locks(self, sem):
+        while isinstance(sem, (TimedLockSet, ThreadLockedSet)):
+            sem = sem.inner()
+        ## process-wide fcntl locks can't tell handles in a process apart
+        if self.__thread_locks or (isinstance(sem, FileLockSet) and sem.process_wide()):
+            sem = ThreadLockedSet(sem, self.__key)
+        if self.__lock_timing:
+            ## (outermost, so waiting for the threading locks counts too)
+            sem = TimedLockSet(sem, lock_stats(self.__key))
+        return sem
+
     def __deposit_lock(self):
         return self.__sem.deposit_lock()
 
@@ -1047,13 +1503,13 @@ class MMapPool(object):
         return unt64(size)
 
     def __get_uid(self, uid):
-        if isinstance(uid, (str, unicode)):
+        if isinstance(uid, str):
             pwent = pwd.getpwnam(uid)
             uid = pwent.pw_uid
         return int64(uid)
 
     def __get_gid(self, gid):
-        if isinstance(gid, (str, unicode)):
+        if isinstance(gid, str):
             grent = grp.getgrnam(gid)
             gid = grent.gr_gid
         return int64(gid)
@@ -1100,14 +1556,23 @@ class MMapPool(object):
                  frozen=False,
                  auto_dispose=False,
                  checksum=False,
-                 sync=False):
+                 sync=False,
+                 lock_backend='sysv'):
+        if lock_backend not in LOCK_BACKENDS:
+            raise ValueError("unknown lock backend '%s' (not one of %s)" % (lock_backend, ', '.join(LOCK_BACKENDS)))
+        if lock_backend != 'sysv' and not (single_file or resizable):
+            raise PoolWrongVersionException("version 0 pools can only use sysv locks")
         self.__slaw_version = SLAW_VERSION_CURRENT
         self.__slaw_type = PLASMA_BINARY_FILE_TYPE_POOL
         self.__pool_flags = 0
         self.__size = self.__get_size(size)
         self.__perm = { 'mode': int64(mode), 'uid': self.__get_uid(uid), 'gid': self.__get_gid(gid) }
         self.__index_capacity = unt64(index_capacity)
-        self.__sem = SemaphoreSet()
+        if lock_backend == 'sysv':
+            self.__sem = SemaphoreSet()
+        else:
+            ## opened on the pool file once it's there
+            self.__sem = None
         if single_file:
             self.__init_v1(POOL_DIRECTORY_VERSION_SINGLE_FILE)
             self.__create_v1(size, index_capacity, mode, uid, gid, stop_when_full, frozen, auto_dispose, checksum, sync)
@@ -1146,7 +1611,9 @@ class MMapPool(object):
         conf = confChunk()
         ptrs = ptrsChunk()
         perm = permChunk()
-        self.__header_size = 8 + conf.size() + ptrs.size() + perm.size()
+        gnrt = gnrtChunk()
+        wake = wakeChunk()
+        self.__header_size = 8 + conf.size() + ptrs.size() + perm.size() + gnrt.size() + wake.size()
         if self.__index_capacity > 0:
             indx = indxChunk()
             indx.initialize(self.__index_capacity)
@@ -1163,9 +1630,13 @@ class MMapPool(object):
         conf.mmap_version = self.__pool_version
         conf.header_size = self.__header_size
         conf.file_size = self.__size
-        conf.sem_key = self.__sem.key()
         conf.next_index = 0
         conf.flags = 0
+        if self.__sem is not None:
+            conf.sem_key = self.__sem.key()
+        else:
+            conf.sem_key = 0
+            conf.flags |= POOL_FLAG_FILE_LOCKS
         if stop_when_full:
             conf.flags |= POOL_FLAG_STOP_WHEN_FULL
         if frozen:
@@ -1184,10 +1655,14 @@ class MMapPool(object):
         conf.set_pool(self.__fh, 8)
         ptrs.set_pool(self.__fh, conf.end())
         perm.set_pool(self.__fh, ptrs.end())
+        gnrt.set_pool(self.__fh, perm.end())
+        wake.set_pool(self.__fh, gnrt.end())
         if indx is not None:
-            indx.set_pool(self.__fh, perm.end())
+            indx.set_pool(self.__fh, wake.end())
             indx.initialize(self.__index_capacity)
         self.__save_default_config()
+        self.__fh.close()
+        self.__fh = None
 
     def __init_mmap_file(self):
         #fh = os.fdopen(os.open(self.__mmap_file, os.O_RDWR|os.O_CREAT|os.O_EXCL, self.__perm['mode'] & 0666), 'rb+')
@@ -1195,8 +1670,19 @@ class MMapPool(object):
         os.chown(self.__mmap_file, self.__perm['uid'], self.__perm['gid'])
         os.ftruncate(fh.fileno(), self.__size)
         fh.seek(0)
+        ## a pool removed without dispose() leaves what this process kept
+        ## about its file, which a new file may turn up under
+        st = os.fstat(fh.fileno())
+        self.__forget_file((st.st_dev, st.st_ino))
         return fh
 
+    def __forget_file(self, key):
+        forget_offset_cache(key)
+        forget_lock_stats(key)
+        cache = protein_cache()
+        if cache is not None:
+            cache.forget(key)
+
     def __save_default_config(self):
         if self.__pool_conf_file is None:
             return None
@@ -1237,6 +1723,9 @@ class MMapPool(object):
         else:
             raise PoolWrongVersionException("unimplemented pool version %d" % pool_version)
         self.__mmap.seek(0)
+        self.__key = self.__file_key()
+        self.__offsets = shared_offset_cache(self.__key)
+        self.__sem = self.__stack_locks(self.__sem)
         self.__pool_pos = 0
         self.closed = False
         self.__last = None
@@ -1297,7 +1786,14 @@ class MMapPool(object):
             self.__indx = self.__chunks['indx']
         else:
             self.__indx = None
-        self.__sem = SemaphoreSet(conf.sem_key)
+        ## pools created before the generation chunk existed don't have it
+        self.__gnrt = self.__chunks.get('gnrt')
+        ## without a wake chunk, awaiters make a fifo for each await
+        self.__wake = self.__chunks.get('wake')
+        if conf.flags & POOL_FLAG_FILE_LOCKS:
+            self.__sem = FileLockSet(self.__mmap_file)
+        else:
+            self.__sem = SemaphoreSet(conf.sem_key)
         self.__header_size = self.__chunks['conf'].header_size
         self.__size = self.__chunks['conf'].file_size
 
@@ -1343,14 +1839,26 @@ class MMapPool(object):
                 self.__sem.deposit_unlock()
             if self.__sem.has_notification_lock():
                 self.__sem.notification_unlock()
+            self.__close_endpoint()
+            self.__sem.close()
+            self.__sem = None
         self.__indx = None
+        self.__gnrt = None
+        self.__wake = None
         self.__chunks = None
         self.__mmap_file = None
-        self.__cache_buffer = None
+        self.__key = None
+        self.__offsets = None
+        self.__dense.clear()
+        ## proteins read without copying may still hold views of the mmap,
+        ## so rather than release the view (or close the mmap under them),
+        ## just let go of both: the mmap is unmapped once the last view of
+        ## it is gone
+        self.__view = None
         if self.__mmap is not None:
             try:
                 self.__mmap.close()
-            except:
+            except BufferError:
                 pass
             self.__mmap = None
         if self.__fh is not None:
@@ -1387,27 +1895,124 @@ class MMapPool(object):
 
     def __pointers(self):
         if self.__pool_version == 0:
-            pos = self.__mmap.tell()
-            self.__mmap.seek(0)
-            (old, new) = struct.unpack('qq', self.__mmap.read(16))
-            self.__mmap.seek(pos)
-            return (old, new)
+            return POINTERS.unpack_from(self.__mmap, 0)
+        if self.__gnrt is not None:
+            ## never torn by a concurrent deposit
+            return self.__snapshot()[:2]
         return self.__chunks['ptrs'].all()
 
-    def __set_pointers(self, old, new):
+    def __snapshot(self):
+        ## (oldest, newest, next index, generation), seqlock style: the
+        ## generation is odd while a depositor is changing the pointers,
+        ## so read until it's even and the same before and after.  If it
+        ## stays odd (a depositor died mid-update), give up validating
+        ## and return None for the generation, as for pools without one.
+        gnrt = self.__gnrt
+        if gnrt is not None:
+            ptrs = self.__chunks['ptrs']
+            conf = self.__chunks['conf']
+            for i in range(SNAPSHOT_SPINS):
+                generation = gnrt.generation
+                if generation & 1:
+                    continue
+                (old, new) = ptrs.all()
+                next_index = conf.next_index
+                if gnrt.generation == generation:
+                    return (old, new, next_index, generation)
+        if self.__pool_version == 0:
+            (old, new) = POINTERS.unpack_from(self.__mmap, 0)
+            return (old, new, None, None)
+        (old, new) = self.__chunks['ptrs'].all()
+        return (old, new, self.__chunks['conf'].next_index, None)
+
+    def __decode_record(self, pos, descrips_only=False, generation=None, oldest=None):
+        ## decode the protein record at pos straight out of the mmap,
+        ## rather than copying it out piece by piece through read(); with
+        ## descrips_only, just the protein's descrips are decoded
+        ptr = pos % self.file_size()
+        if ptr < self.header_size():
+            raise IOError("attempted read from the header")
+        ## a zero-copy view decodes to proteins that point into the mmap
+        buf = self.__mmap
+        if self.__view is not None:
+            buf = self.__view
+        ## (proteins that point into the mmap can't outlive it in a cache)
+        cache = None
+        if not descrips_only and self.__view is None and oldest is not None:
+            cache = protein_cache()
+        protein = None
+        try:
+            (timestamp, index) = RECORD_HEAD.unpack_from(buf, ptr)
+            if cache is not None:
+                protein = cache.get(self.__key, index, pos, oldest)
+            if protein is not None:
+                cache = None
+                end = ptr + 16 + protein.slaw_v2_size()
+            elif descrips_only:
+                (protein, end) = plasma.slaw.decode_descrips2(buf, ptr + 16)
+            else:
+                (protein, end) = plasma.slaw.decode_slaw2(buf, ptr + 16)
+            (jumpback,) = RECORD_TAIL.unpack_from(buf, end)
+        except struct.error:
+            self.__check_stompled(pos, generation)
+            raise SlawWrongLengthException()
+        except Exception:
+            self.__check_stompled(pos, generation)
+            raise
+        self.__check_stompled(pos, generation)
+        if cache is not None and isinstance(protein, LazyProtein):
+            ## cache the protein only once it's known not to be garbage,
+            ## and keep it to ourselves
+            cache.put(self.__key, index, pos, jumpback, protein)
+            protein = protein.copy()
+        if self.__view is not None and not descrips_only:
+            protein.set_valid(lambda: self.__still_valid(pos, generation))
+        self.seek(pos + (end + 8 - ptr))
+        return (timestamp, index, protein, jumpback)
+
+    def __still_valid(self, pos, generation):
+        ## whether the record at pos hasn't been overwritten yet
+        if self.__mmap is None:
+            ## closed, so we can't tell
+            return False
+        if generation is not None and self.__gnrt.generation == generation:
+            return True
+        (old, new) = self.__pointers()
+        return pos >= old
+
+    def __check_stompled(self, pos, generation=None):
+        if generation is not None and self.__gnrt.generation == generation:
+            ## nothing has been deposited since the snapshot was taken
+            return
+        (old, new) = self.__pointers()
+        if pos < old:
+            self.seek(old)
+            logging.error("read at %s (%d) stompled" % (pos, old))
+            raise StompledException()
+
+    def __set_pointers(self, old, new, next_index=None):
         #(xold, xnew) = self.__pointers()
         #if old > new:
         #    raise Exception("setting pointers to something bizzarre: (%d, %d) from (%d, %d)" % (old, new, xold, xnew))
         #if xnew - new > 2 * self.file_size():
         #    raise Exception("big jump in pointers: (%d, %d) to (%d, %d)" % (xold, xnew, olf, new))
         if self.__pool_version == 0:
-            pos = self.__mmap.tell()
-            self.__mmap.seek(0)
-            self.__mmap.write(struct.pack('qq', old, new))
-            self.__mmap.seek(pos)
-        else:
-            self.__chunks['ptrs'].oldest_entry = old
-            self.__chunks['ptrs'].newest_entry = new
+            POINTERS.pack_into(self.__mmap, 0, old, new)
+            return
+        gnrt = self.__gnrt
+        if gnrt is not None:
+            generation = gnrt.generation | 1
+            gnrt.generation = generation
+        self.__chunks['ptrs'].set_all(old, new)
+        if next_index is not None:
+            self.__chunks['conf'].next_index = next_index
+        if gnrt is not None:
+            gnrt.generation = generation + 1
+
+    def __file_key(self):
+        ## the pool file (rather than its name, which a new pool may take)
+        st = os.fstat(self.__fh.fileno())
+        return (st.st_dev, st.st_ino)
 
     def __index_at(self, pos=None):
         orig_pos = self.tell()
@@ -1422,86 +2027,196 @@ class MMapPool(object):
         return index
 
     def __quick_cache(self, index, start, size):
-        if self.__cache_buffer is None:
-            self.__cache_buffer = list((None,) * CACHE_SIZE)
-        n = index % len(self.__cache_buffer)
-        self.__cache_buffer[n] = (index, start, size)
+        self.__dense.note(index, start)
+        if self.__offsets is not None:
+            self.__offsets.store(index, start, size)
 
     def __quick_lookup(self, index):
-        if self.__cache_buffer is None:
+        (old, new) = self.__pointers()
+        offset = self.__dense.get(index, old)
+        if offset is not None:
+            return offset
+        if self.__offsets is None:
             return None
-        n = index % len(self.__cache_buffer)
-        cache = self.__cache_buffer[n]
-        if cache is not None and cache[0] == index:
-            return cache[1]
-        return None
-
-    def __deposit(self, protein):
+        cached = self.__offsets.lookup(index, old)
+        if cached is None:
+            return None
+        return cached[0]
+
+    def __encode_record(self, protein):
+        ## encode the protein, before taking the deposit lock, straight into
+        ## the record that will be copied into the pool; the timestamp and
+        ## index in front are filled in under the lock
+        size = slaw_v2_size(protein)
+        jumpback = size + 24
+        if jumpback > self.__max_protein_size():
+            raise PoolProteinBiggerThanPoolException()
+        record = bytearray(jumpback)
+        encode_into(protein, record, 16)
+        RECORD_TAIL.pack_into(record, 16 + size, jumpback)
+        return record
+
+    def __deposit(self, record):
+        return self.__deposit_many([record])[0]
+
+    def __deposit_many(self, records):
+        ## called with the deposit lock held; everything here is a constant
+        ## amount of work per protein (apart from evicting old proteins),
+        ## whatever the size of the proteins.  The records are laid out one
+        ## after another and published in runs, moving the pointers and
+        ## next index once per run; a run only ends where the pool wraps,
+        ## so the proteins it evicts are all from the previous lap.
         if self.frozen():
             raise PoolFrozenException()
-        timestamp = obtimestamp()
         (old, new) = self.__pointers()
         last = self.__last
         curpos = self.tell()
-        data = protein.to_slaw()
-        jumpback = len(data) + 24
-        if jumpback > self.__max_protein_size():
-            raise PoolProteinBiggerThanPoolException()
+        sz = self.file_size()
+        deposited = list()
+        run = list()
         try:
-            if new >= old:
-                self.seek(new)
-                last_protein = self.readline()
-                index = last_protein.index() + 1
-            else:
+            index = None
+            if new < old:
                 ## pool is empty
-                self.seek(old)
+                tail = old
                 index = 0
+            else:
+                ## just past the newest protein, whose length is in its
+                ## header; the next index is in the pool's header (or, for
+                ## version 0 pools, one past the newest protein's)
+                tail = self.__record_end(new)
+                if tail is None:
+                    ## (version 1 slaw, or a byte-swapped protein)
+                    self.seek(new)
+                    index = self.skip() + 1
+                    tail = self.tell()
             if self.__chunks is not None:
                 index = self.__chunks['conf'].next_index
-            newnew = self.tell()
-            sz = self.file_size()
-            if newnew % sz == 0:
-                newnew += self.header_size()
-                self.seek(newnew)
-            ptr = newnew % sz
-            if ptr + jumpback > sz:
-                ## protein will need to wrap
-                if self.stop_when_full():
-                    raise PoolFullException()
-                newnew = newnew + (sz - (newnew % sz)) + self.header_size()
-                ptr = newnew % sz
-            (first_index, first_pos) = self.first_index_and_offset()
+            elif index is None:
+                (ts, index) = RECORD_HEAD.unpack_from(self.__mmap, new % sz)
+                index += 1
             newold = old
-            self.seek(old)
-            ## check that we're not overwriting old proteins
-            ## if so, advance oldest pointer
-            while newnew + jumpback - sz > newold:
-                ix = self.skip()
-                if ix == first_index - 1:
-                    ## we're overwriting the remainder of the pool
-                    newold = first_pos
-                    self.seek(newold)
-                else:
-                    newold = self.tell()
-            ## advance oldest pointer before we write
-            self.__set_pointers(newold, new)
-            self.__mmap.seek(newnew % sz)
-            self.__mmap.write(struct.pack('dQ', timestamp.timestamp(), index))
-            self.__mmap.write(data)
-            self.__mmap.write(struct.pack('Q', jumpback))
-            ## advance newest pointer after write
-            self.__set_pointers(newold, newnew)
-            if self.__chunks is not None:
-                self.__chunks['conf'].next_index = index + 1
+            for record in records:
+                jumpback = len(record)
+                newnew = tail
+                if newnew % sz == 0:
+                    newnew += self.header_size()
+                if (newnew % sz) + jumpback > sz:
+                    ## protein will need to wrap
+                    if len(run) > 0:
+                        self.__publish(run, new, newold)
+                        new = run[-1][1]
+                        run = list()
+                    if self.stop_when_full():
+                        raise PoolFullException()
+                    newnew = newnew + (sz - (newnew % sz)) + self.header_size()
+                ## check that we're not overwriting old proteins
+                ## if so, advance oldest pointer
+                if newnew + jumpback - sz > newold:
+                    newold = self.__evict(newold, newnew + jumpback - sz, new, newnew)
+                timestamp = obtimestamp()
+                RECORD_HEAD.pack_into(record, 0, timestamp.timestamp(), index)
+                run.append((record, newnew, index, timestamp))
+                deposited.append((index, timestamp, newnew))
+                index += 1
+                tail = newnew + jumpback
+            if len(run) > 0:
+                self.__publish(run, new, newold)
+                run = list()
         finally:
             self.seek(curpos)
             self.__last = last
+            if len(deposited) > len(run):
+                self.__wake_awaiters()
+        return deposited
+
+    def __record_end(self, pos):
+        ## where the record starting at pos ends, from the octlen in its
+        ## protein's header rather than by stepping over it; None if the
+        ## header isn't a native version 2 protein's
+        if self.__slaw_version != 2:
+            return None
+        (header,) = SLAW_HEADER.unpack_from(self.__mmap, pos % self.file_size() + 16)
+        if header >> 60 != 1 or header & 0xf0 != 0:
+            return None
+        octlen = ((header >> 4) & 0xffffffffffffff) | (header & 0xf)
+        return pos + 24 + 8 * octlen
+
+    def __publish(self, run, new, newold):
+        ## copy a run of records into the pool: advance the oldest pointer
+        ## before we write, and the newest pointer after
+        self.__set_pointers(newold, new)
+        sz = self.file_size()
+        for (record, offset, index, timestamp) in run:
+            ptr = offset % sz
+            self.__mmap[ptr:ptr+len(record)] = record
+        self.__set_pointers(newold, run[-1][1], run[-1][2] + 1)
         if self.__indx is not None:
-            self.__indx.add_entry(newnew, timestamp, index, newold)
-        self.__wake_awaiters()
-        return (index, timestamp, newnew)
+            for (record, offset, index, timestamp) in run:
+                self.__indx.add_entry(offset, timestamp, index, newold)
+
+    def __evict(self, old, limit, newest, start):
+        ## returns the new oldest pointer: the first protein that starts at
+        ## or after limit.  The index gets us to the last indexed protein
+        ## before limit, so at most about index-step proteins are stepped
+        ## over one at a time.  newest is the newest protein in the pool,
+        ## and start where the protein being deposited goes: if that laps
+        ## the newest one too, the new protein is the oldest there is.
+        (first_index, first_pos) = self.first_index_and_offset()
+        sz = self.file_size()
+        newold = self.__index_floor(old, limit)
+        evicted = 0
+        if newold > old:
+            (ts, old_index) = RECORD_HEAD.unpack_from(self.__mmap, old % sz)
+            (ts, new_index) = RECORD_HEAD.unpack_from(self.__mmap, newold % sz)
+            evicted = new_index - old_index
+        self.seek(newold)
+        skips = 0
+        while limit > newold:
+            pos = newold
+            ix = self.skip()
+            skips += 1
+            if pos == newest:
+                newold = start
+                self.seek(newold)
+            elif ix == first_index - 1:
+                ## we're overwriting the remainder of the pool
+                newold = first_pos
+                self.seek(newold)
+            else:
+                newold = self.tell()
+        self.__evictions += evicted + skips
+        self.__eviction_runs += 1
+        self.__eviction_skips += skips
+        return newold
+
+    def __index_floor(self, old, limit):
+        ## offset of the last indexed protein starting between old and
+        ## limit (binary search; the entries are in offset order), or old
+        ## if there isn't one.  Unused entries have an offset of 0 (or -1),
+        ## and entries older than old may not have been collected yet.
+        indx = self.__indx
+        if indx is None:
+            return old
+        (lo, hi) = (0, indx.count)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if indx[mid][0] <= limit:
+                lo = mid + 1
+            else:
+                hi = mid
+        for i in range(lo - 1, -1, -1):
+            offset = indx[i][0]
+            if old <= offset <= limit:
+                return offset
+            if 0 < offset < old:
+                break
+        return old
 
     def __lookup(self, timestamp, whence=TIMESTAMP_ABSOLUTE, direction=DIRECTION_ABSOLUTE):
+        ## Deposit times only ever grow, so the protein is found by binary
+        ## search: of the index chunk for the stretch of proteins it's in,
+        ## then of the protein headers in that stretch.
         if type(timestamp) == datetime.datetime:
             timestamp = obtimestamp(timestamp).timestamp()
         elif isinstance(timestamp, obtimestamp):
@@ -1515,51 +2230,88 @@ class MMapPool(object):
             finally:
                 self.seek(orig_pos)
                 self.__last = last
-        if self.__indx is not None:
-            (offset, ts, idx) = self.__indx.timefind(timestamp)
-            ts = ts.timestamp()
-            self.seek(offset)
-        else:
-            (old, new) = self.__pointers()
-            if new < old:
-                raise PoolNoSuchProteinException("pool is empty")
-            self.seek(new)
-            try:
-                (ts, idx) = struct.unpack('dQ', self.read(16))
-                self.seek(new)
-            except StompledException:
-                self.seek(orig_pos)
-                return self.__lookup(timestamp, TIMESTAMP_ABSOLUTE, direction)
-            offset = new
-        if ts < timestamp and direction == DIRECTION_HIGHER:
-            raise PoolNoSuchProteinException("latest protein is earlier than the requested time")
-        prev_offset = offset
-        prev_ts = ts
-        prev_idx = idx
-        while True:
-            if prev_ts == timestamp:
-                break
-            try:
-                self.seek_to(prev_idx - 1)
-                offset = self.tell()
-                (ts, idx) = struct.unpack('dQ', self.read(16))
-            except (StompledException, PoolNoSuchProteinException):
-                (ts, idx) = (None, None)
-                break
-            if ts <= timestamp:
-                break
+        try:
+            (after, before) = self.__time_bracket(timestamp)
+        except StompledException:
+            self.seek(orig_pos)
+            return self.__lookup(timestamp, TIMESTAMP_ABSOLUTE, direction)
         self.seek(orig_pos)
+        if after is not None and after[1] == timestamp:
+            ## an exact match is the answer whichever way we're looking
+            before = after
         if direction == DIRECTION_LOWER:
-            if ts is None:
+            if before is None:
                 raise PoolNoSuchProteinException("earliest protein is later than the requested time")
-            return (idx, obtimestamp(ts), offset)
+            return (before[0], obtimestamp(before[1]), before[2])
         if direction == DIRECTION_HIGHER:
-            return (prev_idx, obtimestamp(prev_ts), prev_offset)
-        if ts is None:
-            return (prev_idx, obtimestamp(prev_ts), prev_offset)
-        if abs(timestamp - ts) < abs(timestamp - prev_ts):
-            return (idx, obtimestamp(ts), offset)
-        return (prev_idx, obtimestamp(prev_ts), prev_offset)
+            if after is None:
+                raise PoolNoSuchProteinException("latest protein is earlier than the requested time")
+            return (after[0], obtimestamp(after[1]), after[2])
+        if after is None or (before is not None and abs(timestamp - before[1]) < abs(timestamp - after[1])):
+            return (before[0], obtimestamp(before[1]), before[2])
+        return (after[0], obtimestamp(after[1]), after[2])
+
+    def __head_at(self, pos):
+        ## (index, timestamp, pos) of the record at pos
+        (ts, idx) = RECORD_HEAD.unpack_from(self.__mmap, pos % self.file_size())
+        self.__check_stompled(pos)
+        return (idx, ts, pos)
+
+    def __time_bracket(self, timestamp):
+        ## returns (index, timestamp, offset) of the first protein deposited
+        ## at or after timestamp and of the one before it (None if there
+        ## isn't one)
+        (old, new) = self.__pointers()
+        if new < old:
+            raise PoolNoSuchProteinException("pool is empty")
+        lo = self.__head_at(old)
+        hi = self.__head_at(new)
+        if hi[1] < timestamp:
+            return (None, hi)
+        if lo[1] >= timestamp:
+            return (lo, None)
+        if self.__indx is not None:
+            ## narrow lo..hi down to a stretch between two index entries
+            (below, above) = self.__indx.timebracket(timestamp)
+            if below is not None:
+                offset = self.__indx[below][0]
+                if old <= offset <= new:
+                    x = self.__head_at(offset)
+                    if lo[1] <= x[1] < timestamp:
+                        lo = x
+            if above is not None:
+                offset = self.__indx[above][0]
+                if old <= offset <= new:
+                    x = self.__head_at(offset)
+                    if timestamp <= x[1] <= hi[1] and x[0] > lo[0]:
+                        hi = x
+        ## lo is earlier than timestamp, hi isn't: if the offset index has
+        ## everything in between, bisect the headers, otherwise step
+        ## through them (filling in the offset index on the way)
+        if self.__dense.get(lo[0], old) is not None and self.__dense.get(hi[0]) is not None:
+            (a, b) = (lo[0] + 1, hi[0])
+            while a < b:
+                mid = (a + b) // 2
+                x = self.__head_at(self.__dense.get(mid))
+                if x[1] >= timestamp:
+                    b = mid
+                else:
+                    a = mid + 1
+            return (self.__head_at(self.__dense.get(a)), self.__head_at(self.__dense.get(a - 1)))
+        (first_index, first_pos) = self.first_index_and_offset()
+        self.seek(lo[2])
+        while lo[0] < hi[0]:
+            self.skip()
+            if lo[0] == first_index - 1:
+                self.seek(first_pos)
+            x = self.__head_at(self.tell())
+            if x[0] != lo[0] + 1:
+                ## skip() found lo overwritten and went on to the oldest
+                raise StompledException()
+            if x[1] >= timestamp:
+                return (x, lo)
+            lo = x
+        return (hi, lo)
 
     def __max_protein_size(self):
         return self.file_size() - self.header_size()
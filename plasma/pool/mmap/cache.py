@@ -0,0 +1,440 @@
+"""
+Caches of where proteins are in mmap pools.
+
+An OffsetCache maps protein indexes to the (offset, size) of their records,
+so MMapPool.seek_to() can jump straight to a protein it (or any other hose
+on the same pool) has already passed.  Entries live in preallocated arrays
+(a dict only maps indexes to slots), and when the cache is full an entry is
+evicted either least recently used first (LRUOffsetCache) or by the second
+chance clock algorithm (ClockOffsetCache), which is cheaper to keep up.
+
+Nothing ever has to be told about proteins leaving the pool: lookups and
+stores pass in the pool's oldest pointer, and an entry whose offset is
+below it is stale, so it is a miss and its slot is the first to be reused.
+
+shared_offset_cache() hands out one cache per pool file, shared by all the
+MMapPool objects open on it in the process.
+
+Each MMapPool also keeps an OffsetIndex: the offsets of a contiguous run
+of indexes, as dense as the pool itself, filled in as records are read
+(or by MMapPool.build_offset_index()), so finding any protein in the run
+takes a single array lookup.
+
+A ProteinCache, which is off unless enable_protein_cache() is called,
+keeps proteins that have been read (up to a total number of bytes), keyed
+by pool file and index, so reading the same one again -- curr(), prev(),
+fetches of overlapping ranges -- doesn't go back to the pool for it.
+"""
+import weakref, bisect
+from array import array
+from collections import deque, OrderedDict
+
+CACHE_SIZE = 65536
+CACHE_POLICY = 'clock'
+PROTEIN_CACHE_BUDGET = 16 * 1024 * 1024
+
+class OffsetCache(object):
+    """
+    Maps protein indexes to (offset, size); subclasses choose what to evict.
+    """
+    policy = None
+
+    def __init__(self, capacity=CACHE_SIZE):
+        if capacity < 1:
+            raise ValueError("offset cache capacity must be at least 1")
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.stale = 0
+        self._oldest = 0
+        self._slots = dict()
+        self._index = array('q', [-1]) * capacity
+        self._offset = array('q', [0]) * capacity
+        self._size = array('q', [0]) * capacity
+
+    def __len__(self):
+        return len(self._slots)
+
+    def lookup(self, index, oldest=None):
+        """
+        Returns the (offset, size) of protein index, or None if it isn't
+        cached, or is older than the oldest pointer.
+        """
+        if oldest is not None:
+            self._oldest = oldest
+        slot = self._slots.get(index)
+        if slot is None:
+            self.misses += 1
+            return None
+        if self._offset[slot] < self._oldest:
+            self.stale += 1
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._touch(slot)
+        return (self._offset[slot], self._size[slot])
+
+    def store(self, index, offset, size, oldest=None):
+        """
+        Records that protein index is at offset, size bytes long.
+        """
+        if oldest is not None:
+            self._oldest = oldest
+        slot = self._slots.get(index)
+        if slot is None:
+            if len(self._slots) < self.capacity:
+                slot = len(self._slots)
+                self._insert(slot)
+            else:
+                slot = self._victim()
+                self._slots.pop(self._index[slot], None)
+                if self._offset[slot] >= self._oldest:
+                    self.evictions += 1
+            self._slots[index] = slot
+            self._index[slot] = index
+        self._offset[slot] = offset
+        self._size[slot] = size
+        self._touch(slot)
+
+    def clear(self):
+        """
+        Forgets every entry (but not the counters).
+        """
+        counters = (self.hits, self.misses, self.evictions, self.stale)
+        self.__init__(self.capacity)
+        (self.hits, self.misses, self.evictions, self.stale) = counters
+
+    def stats(self):
+        """
+        A dict of the cache's policy, capacity, entries and counters.
+        """
+        return {
+            'policy':    self.policy,
+            'capacity':  self.capacity,
+            'entries':   len(self._slots),
+            'hits':      self.hits,
+            'misses':    self.misses,
+            'evictions': self.evictions,
+            'stale':     self.stale,
+        }
+
+    def _insert(self, slot):
+        ## a slot is used for the first time
+        pass
+
+    def _touch(self, slot):
+        raise NotImplementedError()
+
+    def _victim(self):
+        raise NotImplementedError()
+
+class LRUOffsetCache(OffsetCache):
+    """
+    Evicts the least recently used entry, keeping the slots in a doubly
+    linked list (in two more arrays) from most to least recently used.
+    """
+    policy = 'lru'
+
+    def __init__(self, capacity=CACHE_SIZE):
+        OffsetCache.__init__(self, capacity)
+        self.__prev = array('l', [-1]) * capacity
+        self.__next = array('l', [-1]) * capacity
+        self.__head = -1
+        self.__tail = -1
+
+    def __unlink(self, slot):
+        (prev, next) = (self.__prev[slot], self.__next[slot])
+        if prev >= 0:
+            self.__next[prev] = next
+        else:
+            self.__head = next
+        if next >= 0:
+            self.__prev[next] = prev
+        else:
+            self.__tail = prev
+
+    def __push(self, slot):
+        self.__prev[slot] = -1
+        self.__next[slot] = self.__head
+        if self.__head >= 0:
+            self.__prev[self.__head] = slot
+        else:
+            self.__tail = slot
+        self.__head = slot
+
+    def _insert(self, slot):
+        self.__push(slot)
+
+    def _touch(self, slot):
+        if slot != self.__head:
+            self.__unlink(slot)
+            self.__push(slot)
+
+    def _victim(self):
+        return self.__tail
+
+class ClockOffsetCache(OffsetCache):
+    """
+    Evicts by the clock algorithm: a hand sweeps the slots, clearing the
+    referenced bit of each one it passes, and takes the first slot that
+    wasn't referenced since its last sweep (or is stale).
+    """
+    policy = 'clock'
+
+    def __init__(self, capacity=CACHE_SIZE):
+        OffsetCache.__init__(self, capacity)
+        self.__ref = bytearray(capacity)
+        self.__hand = 0
+
+    def _touch(self, slot):
+        self.__ref[slot] = 1
+
+    def _victim(self):
+        ref = self.__ref
+        hand = self.__hand
+        while ref[hand] and self._offset[hand] >= self._oldest:
+            ref[hand] = 0
+            hand = (hand + 1) % self.capacity
+        self.__hand = (hand + 1) % self.capacity
+        return hand
+
+class OffsetIndex(object):
+    """
+    The offsets of proteins base, base + 1, ..., in an array.  Offsets only
+    ever grow with the index, so dropping the proteins that have left the
+    pool is a binary search for the oldest pointer; dropped entries are
+    only cut off the front of the array once they're half of it.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.base = 0
+        self.__head = 0
+        self.__offsets = array('q')
+
+    def __len__(self):
+        return len(self.__offsets) - self.__head
+
+    def first(self):
+        """
+        The first index in the table.
+        """
+        return self.base + self.__head
+
+    def last(self):
+        """
+        (index, offset) of the last protein in the table, or None.
+        """
+        if len(self) == 0:
+            return None
+        return (self.base + len(self.__offsets) - 1, self.__offsets[-1])
+
+    def note(self, index, offset):
+        """
+        Records that protein index is at offset.  The next index after the
+        table's extends it; an index further on starts it over (reading
+        has jumped ahead, and the newer proteins are the ones that will be
+        wanted); older ones are ignored.
+        """
+        n = index - self.base
+        if n == len(self.__offsets) and len(self) > 0:
+            self.__offsets.append(offset)
+        elif n >= len(self.__offsets) or len(self) == 0:
+            self.base = index
+            self.__head = 0
+            self.__offsets = array('q', [offset])
+
+    def trim(self, oldest):
+        """
+        Drops the proteins before offset oldest.
+        """
+        offsets = self.__offsets
+        if self.__head < len(offsets) and offsets[self.__head] < oldest:
+            self.__head = bisect.bisect_left(offsets, oldest, self.__head)
+            if self.__head > len(offsets) // 2:
+                del offsets[:self.__head]
+                self.base += self.__head
+                self.__head = 0
+
+    def get(self, index, oldest=None):
+        """
+        Returns the offset of protein index, or None if it isn't in the
+        table (or has left the pool, if the oldest pointer is given).
+        """
+        if oldest is not None:
+            self.trim(oldest)
+        n = index - self.base
+        if n < self.__head or n >= len(self.__offsets):
+            return None
+        return self.__offsets[n]
+
+POLICIES = {
+    'lru':   LRUOffsetCache,
+    'clock': ClockOffsetCache,
+}
+
+def make_offset_cache(capacity=None, policy=None):
+    """
+    Returns a new, unshared offset cache; capacity and policy ('lru' or
+    'clock') default to CACHE_SIZE and CACHE_POLICY.
+    """
+    if capacity is None:
+        capacity = CACHE_SIZE
+    if policy is None:
+        policy = CACHE_POLICY
+    try:
+        cls = POLICIES[policy]
+    except KeyError:
+        raise ValueError("unknown offset cache policy '%s'" % policy)
+    return cls(capacity)
+
+## caches in use, by pool file; each goes away when the last pool object
+## holding it does
+SHARED = weakref.WeakValueDictionary()
+
+def shared_offset_cache(key, capacity=None, policy=None):
+    """
+    Returns the offset cache shared by every pool opened on key (which
+    identifies the pool file).  If capacity or policy are given and differ
+    from those of the current cache, it is replaced by a new one (which
+    pools opened from then on will share).
+    """
+    cache = SHARED.get(key)
+    if cache is not None:
+        if (capacity is None or capacity == cache.capacity) and (policy is None or policy == cache.policy):
+            return cache
+    cache = make_offset_cache(capacity, policy)
+    SHARED[key] = cache
+    return cache
+
+def forget_offset_cache(key):
+    """
+    Drops the shared cache for key, e.g. because its pool was disposed.
+    """
+    SHARED.pop(key, None)
+
+class ProteinCache(object):
+    """
+    Proteins read from pools, least recently used first out once the
+    encoded sizes of those cached pass budget.  Only lazy proteins are
+    cached, and what's handed out is always a copy() of the cached one,
+    so changing it doesn't change the cache.
+    """
+
+    def __init__(self, budget=PROTEIN_CACHE_BUDGET):
+        self.budget = budget
+        self.used = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.stale = 0
+        ## (pool, index) -> (offset, size, protein), least recently used
+        ## first
+        self.__entries = OrderedDict()
+        ## pool -> (offset, index) in the order they were cached, which is
+        ## more or less the order they leave the pool in
+        self.__order = dict()
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def __drop(self, key):
+        (offset, size, protein) = self.__entries.pop(key)
+        self.used -= protein.slaw_v2_size()
+
+    def __expire(self, pool, oldest):
+        order = self.__order.get(pool)
+        while order and order[0][0] < oldest:
+            (offset, index) = order.popleft()
+            entry = self.__entries.get((pool, index))
+            if entry is not None and entry[0] == offset:
+                self.__drop((pool, index))
+                self.stale += 1
+
+    def get(self, pool, index, offset, oldest):
+        """
+        Returns a copy of the protein cached for index in pool, if it's the
+        one at offset, and offset isn't below the oldest pointer.
+        Returns None otherwise.
+        """
+        self.__expire(pool, oldest)
+        key = (pool, index)
+        entry = self.__entries.get(key)
+        if entry is None or entry[0] != offset:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.__entries.move_to_end(key)
+        return entry[2].copy()
+
+    def put(self, pool, index, offset, size, protein):
+        """
+        Caches protein (a LazyProtein, which mustn't be changed from now
+        on) as index in pool, a record of size bytes at offset.
+        """
+        need = protein.slaw_v2_size()
+        if need > self.budget:
+            return
+        key = (pool, index)
+        if key in self.__entries:
+            self.__drop(key)
+        while self.used + need > self.budget:
+            (old, entry) = next(iter(self.__entries.items()))
+            self.__drop(old)
+            self.evictions += 1
+        self.__entries[key] = (offset, size, protein)
+        self.used += need
+        order = self.__order.setdefault(pool, deque())
+        order.append((offset, index))
+        if len(order) > 2 * len(self.__entries) + 64:
+            ## mostly entries evicted since: keep those still cached
+            live = sorted((e[0], k[1]) for k, e in self.__entries.items() if k[0] == pool)
+            self.__order[pool] = deque(live)
+
+    def forget(self, pool):
+        """
+        Drops everything cached for pool.
+        """
+        for key in list(k for k in self.__entries if k[0] == pool):
+            self.__drop(key)
+        self.__order.pop(pool, None)
+
+    def stats(self):
+        """
+        A dict of the cache's budget, bytes used, entries and counters.
+        """
+        return {
+            'budget':    self.budget,
+            'used':      self.used,
+            'entries':   len(self.__entries),
+            'hits':      self.hits,
+            'misses':    self.misses,
+            'evictions': self.evictions,
+            'stale':     self.stale,
+        }
+
+PROTEIN_CACHE = None
+
+def enable_protein_cache(budget=None):
+    """
+    Turns on caching of the proteins read from pools in this process, with
+    a budget of bytes (default PROTEIN_CACHE_BUDGET), and returns the cache.
+    """
+    global PROTEIN_CACHE
+    if budget is None:
+        budget = PROTEIN_CACHE_BUDGET
+    PROTEIN_CACHE = ProteinCache(budget)
+    return PROTEIN_CACHE
+
+def disable_protein_cache():
+    global PROTEIN_CACHE
+    PROTEIN_CACHE = None
+
+def protein_cache():
+    """
+    The protein cache, or None if it hasn't been enabled.
+    """
+    return PROTEIN_CACHE
@@ -1,4 +1,4 @@
-import struct
+import struct, mmap
 from loam.obstruct import obcons
 from loam.obtime import obtimestamp
 from plasma.const import *
@@ -6,6 +6,21 @@ from plasma.exceptions import *
 import datetime
 
 CHUNK_HEADER = 0x1badd00d
+INDEX_ENTRY = struct.Struct('qd')
+WAKE_ENTRY = struct.Struct('qq16s')
+WAKE_SLOTS = 256
+
+## states of a wake slot
+WAKE_IDLE = 0
+WAKE_ARMED = 1
+WAKE_PENDING = 2
+
+def mapped(fh):
+    ## chunks read and write fields directly in the pool's mmap (at fixed
+    ## offsets, without moving its file position) where they can
+    if isinstance(fh, mmap.mmap):
+        return fh
+    return None
 
 class Chunk(object):
     @classmethod
@@ -25,6 +40,10 @@ class Chunk(object):
             return permChunk(fh, pos)
         if chunk_type == 'indx' or chunk_type == b'indx':
             return indxChunk(fh, pos)
+        if chunk_type == 'gnrt' or chunk_type == b'gnrt':
+            return gnrtChunk(fh, pos)
+        if chunk_type == 'wake' or chunk_type == b'wake':
+            return wakeChunk(fh, pos)
         raise PoolCorruptException("unknown chunk type '%s'" % chunk_type)
 
     def __init__(self, fh=None, pos=None):
@@ -36,14 +55,17 @@ class Chunk(object):
                 self._pos = fh.tell()
         else:
             self._pos = pos
+        self._buf = mapped(fh)
         self._cache = dict()
         self._keydata = dict()
+        self._all = struct.Struct(''.join(key['format'] for key in self._keys))
         x = self._pos + 16
         for key in self._keys:
             size = struct.calcsize(key['format'])
             self._keydata[key['name']] = {
                 'name':   key['name'],
                 'format': key['format'],
+                'struct': struct.Struct(key['format']),
                 'pos':    x,
                 'size':   size,
                 'default': key['default']
@@ -59,20 +81,26 @@ class Chunk(object):
         if pos is None:
             pos = fh.tell()
         self._fh = fh
+        self._buf = mapped(fh)
         self._pos = pos
         #print 'setting %s start to %d' % (type(self).__name__, pos)
         for kd in self._keydata.values():
             kd['pos'] += self._pos
-        for k, v in self._cache.iteritems():
+        for k, v in self._cache.items():
             setattr(self, k, v)
         self.write_header()
         self._fh.seek(self.datasize(), 1)
 
-    def __getattribute__(self, key):
+    def __getattr__(self, key):
+        ## only called for the chunk's fields, which never end up in the
+        ## instance dict (see __setattr__)
         if key.startswith('_'):
-            return super(Chunk, self).__getattribute__(key)
+            raise AttributeError(key)
         #if self._keydata.has_key(key):
         if key in self._keydata:
+            if self._buf is not None:
+                keydata = self._keydata[key]
+                return keydata['struct'].unpack_from(self._buf, keydata['pos'])[0]
             if self._fh is None:
                 return self._cache.get(key, self._keydata[key]['default'])
             startpos = self._fh.tell()
@@ -82,13 +110,17 @@ class Chunk(object):
             #print 'get %s (at %d): %s' % (key, pos, val)
             self._fh.seek(startpos)
             return val
-        return super(Chunk, self).__getattribute__(key)
+        raise AttributeError(key)
 
     def __setattr__(self, key, val):
         #print '%s.__setattr__(%s, %s)' % (type(self).__name__, key, val)
         if key.startswith('_'):
             return super(Chunk, self).__setattr__(key, val)
-        if self._keydata.has_key(key):
+        if key in self._keydata:
+            if self._buf is not None:
+                keydata = self._keydata[key]
+                keydata['struct'].pack_into(self._buf, keydata['pos'], val)
+                return None
             if self._fh is None:
                 #print 'no fh yet, caching %s = %s' % (key, val)
                 self._cache[key] = val
@@ -118,6 +150,8 @@ class Chunk(object):
         return sz
 
     def all(self):
+        if self._buf is not None:
+            return self._all.unpack_from(self._buf, self._pos + 16)
         fmt = ''
         for key in self._keys:
             fmt += key['format']
@@ -128,13 +162,21 @@ class Chunk(object):
         self._fh.seek(startpos)
         return retval
 
+    def set_all(self, *values):
+        ## sets every field at once; in the mmap, with a single write
+        if self._buf is not None:
+            self._all.pack_into(self._buf, self._pos + 16, *values)
+            return None
+        for (key, val) in zip(self._keys, values):
+            setattr(self, key['name'], val)
+
     def end(self):
         return self._pos + self.size()
 
     def write_header(self):
         self._fh.seek(self._pos)
-        hdr = (0x1badd00d << 32) | struct.unpack('>I', self._name)[0]
-        self._fh.write(struct.pack('QQ', hdr, self.size() / 8))
+        hdr = (0x1badd00d << 32) | struct.unpack('>I', self._name.encode('ascii'))[0]
+        self._fh.write(struct.pack('QQ', hdr, self.size() // 8))
 
     def name(self):
         return self._name
@@ -166,6 +208,14 @@ class permChunk(Chunk):
         { 'name': 'gid',  'format': 'q', 'default': -1 }
     ]
 
+class gnrtChunk(Chunk):
+    ## bumped to odd before and back to even after each change to the
+    ## pointers (and next_index), so readers can take a consistent snapshot
+    _name = 'gnrt'
+    _keys = [
+        { 'name': 'generation', 'format': 'Q', 'default': 0 }
+    ]
+
 class PoolIndexBase(object):
     _keys = [
         { 'name': 'signature', 'format': 'Q', 'default': 0x00BEEF00FEED0011 },
@@ -181,6 +231,8 @@ class PoolIndexBase(object):
         if self._fh is None:
             return self._itemcache[idx]
         nth_pos = (self.start + idx) % self.capacity
+        if self._buf is not None:
+            return INDEX_ENTRY.unpack_from(self._buf, self._pos + self._entries_offset + (16 * nth_pos))
         #self._fh.seek(self._pos + self._entries_offset + (16 * idx))
         self._fh.seek(self._pos + self._entries_offset + (16 * nth_pos))
         #print "indx: get(%d) -> %d" % (idx, self._fh.tell())
@@ -201,6 +253,9 @@ class PoolIndexBase(object):
             #self._itemcache[idx] = (offset, ts)
             self._itemcache[nth_pos] = (offset, ts)
             return None
+        if self._buf is not None:
+            INDEX_ENTRY.pack_into(self._buf, self._pos + self._entries_offset + (16 * nth_pos), offset, ts)
+            return None
         #self._fh.seek(self._pos + self._entries_offset + (16 * idx))
         self._fh.seek(self._pos + self._entries_offset + (16 * nth_pos))
         self._fh.write(struct.pack('qd', offset, ts))
@@ -232,7 +287,7 @@ class PoolIndexBase(object):
         orig_start = self.start
         if idx < orig_first:
             return (None, None, None)
-        n_for_idx = (idx - orig_first) / orig_step
+        n_for_idx = (idx - orig_first) // orig_step
         #nth_pos = (orig_start + n_for_idx) % orig_capacity
         idx_for_n = orig_first + (n_for_idx * orig_step)
         #(offset, timestamp) = self[nth_pos]
@@ -258,27 +313,44 @@ class PoolIndexBase(object):
             ts = obtimestamp(ts).timestamp()
         elif isinstance(ts, obtimestamp):
             ts = ts.timestamp()
-        orig_first = self.first
-        orig_last = self.last
-        orig_start = self.start
-        orig_step = self.step
-        orig_capacity = self.capacity
-        for i in range(self.count):
-            #n = (orig_start + i) % orig_capacity
-            #(offset, timestamp) = self[n]
-            (offset, timestamp) = self[i]
-            if timestamp >= ts:
-                #return (offset, obtimestamp(timestamp), self.idx_for_n(n))
-                return (offset, obtimestamp(timestamp), self.idx_for_n(i))
-            if orig_step != self.step:
-                logging.warning("index compacted while looking for timestamp")
-                return self.timefind(ts)
+        (below, above) = self.timebracket(ts)
+        if above is not None:
+            (offset, timestamp) = self[above]
+            return (offset, obtimestamp(timestamp), self.idx_for_n(above))
         #n = (self.start + self.count) % self.capacity
         #(offset, timestamp) = self[n]
         (offset, timestamp) = self[self.count]
         #return (offset, obtimestamp(timestamp), self.idx_for_n(n))
         return (offset, obtimestamp(timestamp), self.idx_for_n(self.count))
 
+    def timebracket(self, ts):
+        ## Binary search of the entries (deposit times only ever grow) for
+        ## the last one earlier than ts and the first one at or after it;
+        ## returns their positions, either of which may be None.  Entries
+        ## never filled in (offset 0) are passed over.
+        count = self.count
+        (lo, hi) = (0, count)
+        above = None
+        while lo < hi:
+            mid = (lo + hi) // 2
+            n = mid
+            while n < hi and self[n][0] == 0:
+                n += 1
+            if n == hi:
+                hi = mid
+            elif self[n][1] >= ts:
+                above = n
+                hi = mid
+            else:
+                lo = n + 1
+        below = count if above is None else above
+        below -= 1
+        while below >= 0 and self[below][0] == 0:
+            below -= 1
+        if below < 0:
+            below = None
+        return (below, above)
+
     def garbage_collect(self, oldest):
         num_to_kill = 0
         count = self.count
@@ -292,7 +364,7 @@ class PoolIndexBase(object):
     def compact(self):
         if self.count >= self.capacity:
             #print "compact: count %d -> %d; step %d -> %d" % (self.count, self.count / 2, self.step, self.step * 2)
-            self.count /= 2
+            self.count //= 2
             self.step *= 2
             for i in range(1, self.count):
                 self[i] = self[2*i]
@@ -303,7 +375,7 @@ class PoolIndexBase(object):
     def add_entry(self, offset, timestamp, idx, oldest):
         if self.count == 0:
             self.first = idx
-        n = (idx - self.first) / self.step
+        n = (idx - self.first) // self.step
         #print "add_entry(%d, %d) -> %d" % (idx, offset, n)
         if n >= self.count:
             while n > self.count:
@@ -362,3 +434,69 @@ class indxChunk(Chunk, PoolIndexBase):
             sz += key['size']
         return sz + (16 * self.capacity)
 
+class wakeChunk(Chunk):
+    ## registry of the wakeup endpoints (fifos in the notification
+    ## directory) of the hoses awaiting deposits: slots of (pid, state, fifo
+    ## name), a pid of 0 marking a free slot.  A hose arms its slot before
+    ## it blocks, and a deposit wakes only the armed slots, leaving them
+    ## pending until they're armed again; waiters counts the armed slots,
+    ## so depositors can skip all of it while nobody waits.  Only changed
+    ## under the notification lock.
+    _name = 'wake'
+    _keys = [
+        { 'name': 'slots',   'format': 'Q', 'default': WAKE_SLOTS },
+        { 'name': 'waiters', 'format': 'Q', 'default': 0 }
+    ]
+
+    def __init__(self, *args, **kwargs):
+        super(wakeChunk, self).__init__(*args, **kwargs)
+        self._entries_offset = 16 + self.datasize()
+
+    def size(self):
+        return 16 + self.datasize() + (WAKE_ENTRY.size * self.slots)
+
+    def __getitem__(self, n):
+        (pid, state, name) = WAKE_ENTRY.unpack_from(self._buf, self._pos + self._entries_offset + (WAKE_ENTRY.size * n))
+        return (pid, state, name.rstrip(b'\0').decode('ascii'))
+
+    def __setitem__(self, n, val):
+        (pid, state, name) = val
+        WAKE_ENTRY.pack_into(self._buf, self._pos + self._entries_offset + (WAKE_ENTRY.size * n), pid, state, name.encode('ascii'))
+
+    def endpoints(self):
+        ## (slot, pid, state, name) of the registered endpoints
+        found = list()
+        for n in range(self.slots):
+            (pid, state, name) = self[n]
+            if pid != 0:
+                found.append((n, pid, state, name))
+        return found
+
+    def register(self, pid, name):
+        ## returns the slot taken, or None if they're all in use
+        for n in range(self.slots):
+            if self[n][0] == 0:
+                self[n] = (pid, WAKE_IDLE, name)
+                return n
+        return None
+
+    def unregister(self, n):
+        if self[n][1] == WAKE_ARMED:
+            self.waiters -= 1
+        self[n] = (0, WAKE_IDLE, '')
+
+    def state(self, n):
+        return self[n][1]
+
+    def arm(self, n):
+        (pid, state, name) = self[n]
+        if state != WAKE_ARMED:
+            self[n] = (pid, WAKE_ARMED, name)
+            self.waiters += 1
+
+    def fire(self, n):
+        ## an armed slot is being woken: pending until it's armed again
+        (pid, state, name) = self[n]
+        if state == WAKE_ARMED:
+            self[n] = (pid, WAKE_PENDING, name)
+            self.waiters -= 1
@@ -0,0 +1,565 @@
+import unittest, mmap, struct, os, shutil, tempfile, threading
+from loam import *
+from plasma.protein import Protein, LazyProtein
+from plasma.const import *
+from plasma.exceptions import *
+from plasma.pool.mmap import MMapPool
+from plasma.pool.mmap.chunks import *
+from plasma.pool.mmap.cache import *
+from plasma.sem_ops import LOCK_STATS_BUCKETS
+
+class MMapChunkTestCase(unittest.TestCase):
+
+    def makeHeader(self):
+        m = mmap.mmap(-1, 4096)
+        for (pos, name, octs) in ((8, b'conf', 8), (72, b'ptrs', 4), (104, b'gnrt', 3)):
+            hdr = (CHUNK_HEADER << 32) | struct.unpack('>I', name)[0]
+            m[pos:pos+16] = struct.pack('QQ', hdr, octs)
+        m.seek(8)
+        return m
+
+    def testFields(self):
+        m = self.makeHeader()
+        conf = Chunk.load(m)
+        ptrs = Chunk.load(m)
+        self.assertIsInstance(conf, confChunk)
+        self.assertIsInstance(ptrs, ptrsChunk)
+        pos = m.tell()
+        conf.next_index = 42
+        self.assertEqual(conf.next_index, 42)
+        self.assertEqual(struct.unpack_from('q', m, 8 + 16 + 40)[0], 42)
+        ptrs.set_all(100, 200)
+        self.assertEqual(ptrs.all(), (100, 200))
+        ptrs.newest_entry = 300
+        self.assertEqual((ptrs.oldest_entry, ptrs.newest_entry), (100, 300))
+        ## reading and writing fields doesn't move the mmap's position
+        self.assertEqual(m.tell(), pos)
+        self.assertRaises(AttributeError, getattr, ptrs, 'no_such_field')
+
+    def testGeneration(self):
+        m = self.makeHeader()
+        (conf, ptrs, gnrt) = (Chunk.load(m), Chunk.load(m), Chunk.load(m))
+        self.assertIsInstance(gnrt, gnrtChunk)
+        self.assertEqual(gnrt.generation, 0)
+        gnrt.generation = 3
+        self.assertEqual(struct.unpack_from('Q', m, 104 + 16)[0], 3)
+        self.assertEqual(gnrt.end(), 128)
+
+    def testWake(self):
+        m = mmap.mmap(-1, 8192)
+        hdr = (CHUNK_HEADER << 32) | struct.unpack('>I', b'wake')[0]
+        m[0:32] = struct.pack('QQQQ', hdr, (32 + WAKE_ENTRY.size * 4) // 8, 4, 0)
+        wake = Chunk.load(m)
+        self.assertIsInstance(wake, wakeChunk)
+        self.assertEqual(wake.end(), 32 + WAKE_ENTRY.size * 4)
+        self.assertEqual(wake.endpoints(), [])
+        for i in range(4):
+            self.assertEqual(wake.register(100 + i, 'FIFO%d' % i), i)
+        self.assertIsNone(wake.register(200, 'FULL'))
+        wake.unregister(1)
+        self.assertEqual(wake.register(300, 'AGAIN'), 1)
+        wake.unregister(2)
+        self.assertEqual(wake.endpoints(), [(0, 100, WAKE_IDLE, 'FIFO0'), (1, 300, WAKE_IDLE, 'AGAIN'), (3, 103, WAKE_IDLE, 'FIFO3')])
+
+    def testWakeArm(self):
+        m = mmap.mmap(-1, 8192)
+        hdr = (CHUNK_HEADER << 32) | struct.unpack('>I', b'wake')[0]
+        m[0:32] = struct.pack('QQQQ', hdr, (32 + WAKE_ENTRY.size * 4) // 8, 4, 0)
+        wake = Chunk.load(m)
+        for i in range(3):
+            wake.register(100 + i, 'FIFO%d' % i)
+        wake.arm(0)
+        wake.arm(0)
+        wake.arm(2)
+        self.assertEqual(wake.waiters, 2)
+        ## a burst wakes each armed slot once
+        wake.fire(0)
+        wake.fire(0)
+        wake.fire(1)
+        self.assertEqual(wake.waiters, 1)
+        self.assertEqual([e[2] for e in wake.endpoints()], [WAKE_PENDING, WAKE_IDLE, WAKE_ARMED])
+        wake.arm(0)
+        wake.unregister(2)
+        self.assertEqual(wake.waiters, 1)
+        self.assertEqual(wake.state(0), WAKE_ARMED)
+
+class OffsetCacheTestCase(unittest.TestCase):
+
+    def fill(self, cache, n):
+        for i in range(n):
+            cache.store(i, 100 * i, 50)
+
+    def testLookup(self):
+        for policy in POLICIES:
+            cache = make_offset_cache(4, policy)
+            self.fill(cache, 3)
+            self.assertEqual(cache.lookup(1), (100, 50))
+            self.assertIsNone(cache.lookup(3))
+            ## proteins gone from the pool aren't found
+            self.assertIsNone(cache.lookup(1, 150))
+            self.assertEqual(cache.lookup(2, 150), (200, 50))
+            self.assertEqual((cache.hits, cache.misses, cache.stale), (2, 2, 1))
+
+    def testLRU(self):
+        cache = make_offset_cache(3, 'lru')
+        self.fill(cache, 3)
+        cache.lookup(0)
+        cache.store(3, 300, 50)
+        self.assertIsNone(cache.lookup(1))
+        self.assertEqual(cache.lookup(0), (0, 50))
+        self.assertEqual((len(cache), cache.evictions), (3, 1))
+
+    def testClock(self):
+        cache = make_offset_cache(3, 'clock')
+        self.fill(cache, 3)
+        cache.store(3, 300, 50)
+        cache.lookup(3)
+        cache.store(4, 400, 50)
+        self.assertEqual(cache.lookup(3), (300, 50))
+        self.assertEqual(len(cache), 3)
+        ## stale entries are reused first
+        cache.store(5, 500, 50, oldest=250)
+        self.assertEqual(cache.lookup(3), (300, 50))
+        self.assertEqual(cache.evictions, 2)
+
+    def testShared(self):
+        cache = shared_offset_cache('test-pool', 10, 'lru')
+        self.assertIs(shared_offset_cache('test-pool'), cache)
+        self.assertIsNot(shared_offset_cache('test-pool', 20), cache)
+        forget_offset_cache('test-pool')
+        self.assertRaises(ValueError, make_offset_cache, 10, 'fifo')
+
+class ProteinCacheTestCase(unittest.TestCase):
+
+    def protein(self, i):
+        return LazyProtein(Protein(['p'], { 'i': int64(i) }).to_slaw(2))
+
+    def testCopies(self):
+        cache = ProteinCache()
+        cache.put('pool', 1, 100, 80, self.protein(1))
+        p = cache.get('pool', 1, 100, 0)
+        self.assertEqual(p.ingests()['i'], 1)
+        p.ingests()['i'] = int64(2)
+        p.add_descrips('q')
+        q = cache.get('pool', 1, 100, 0)
+        self.assertEqual(q.ingests()['i'], 1)
+        self.assertEqual(q.descrips(), ['p'])
+        ## a different protein has the index now
+        self.assertIsNone(cache.get('pool', 1, 200, 0))
+        self.assertIsNone(cache.get('other', 1, 100, 0))
+        self.assertEqual((cache.hits, cache.misses), (2, 2))
+
+    def testBudget(self):
+        size = self.protein(0).slaw_v2_size()
+        cache = ProteinCache(3 * size)
+        for i in range(3):
+            cache.put('pool', i, 100 * i, 80, self.protein(i))
+        cache.get('pool', 0, 0, 0)
+        cache.put('pool', 3, 300, 80, self.protein(3))
+        self.assertEqual((len(cache), cache.used, cache.evictions), (3, 3 * size, 1))
+        self.assertIsNone(cache.get('pool', 1, 100, 0))
+        self.assertIsNotNone(cache.get('pool', 0, 0, 0))
+
+    def testOldest(self):
+        cache = ProteinCache()
+        for i in range(4):
+            cache.put('pool', i, 100 * i, 80, self.protein(i))
+        self.assertIsNone(cache.get('pool', 1, 100, 150))
+        self.assertEqual((len(cache), cache.stale), (2, 2))
+        self.assertIsNotNone(cache.get('pool', 2, 200, 150))
+        cache.forget('pool')
+        self.assertEqual((len(cache), cache.used), (0, 0))
+
+class OffsetIndexTestCase(unittest.TestCase):
+
+    def testNote(self):
+        index = OffsetIndex()
+        for i in range(10, 20):
+            index.note(i, 100 * i)
+        self.assertEqual((len(index), index.first(), index.last()), (10, 10, (19, 1900)))
+        self.assertEqual(index.get(15), 1500)
+        self.assertIsNone(index.get(9))
+        self.assertIsNone(index.get(20))
+        ## older proteins are ignored, a jump ahead starts over
+        index.note(5, 500)
+        self.assertEqual(len(index), 10)
+        index.note(30, 3000)
+        self.assertEqual((len(index), index.get(30), index.get(15)), (1, 3000, None))
+
+    def testTrim(self):
+        index = OffsetIndex()
+        for i in range(100):
+            index.note(i, 100 * i)
+        self.assertEqual(index.get(10, 1050), None)
+        self.assertEqual((len(index), index.first()), (89, 11))
+        self.assertEqual(index.get(11), 1100)
+        index.trim(6000)
+        self.assertEqual((len(index), index.first(), index.get(99)), (40, 60, 9900))
+        index.note(100, 10000)
+        self.assertEqual(index.last(), (100, 10000))
+
+class PoolIndexTestCase(unittest.TestCase):
+
+    def testTimeBracket(self):
+        indx = PoolIndex()
+        indx.initialize(8)
+        ## entries that were never filled in have offset 0
+        entries = [(100, 1.0), (0, 0.0), (300, 3.0), (400, 4.0), (0, 0.0), (0, 0.0), (700, 7.0)]
+        for n, entry in enumerate(entries):
+            indx[n] = entry
+        indx.count = len(entries)
+        self.assertEqual(indx.timebracket(0.5), (None, 0))
+        self.assertEqual(indx.timebracket(1.0), (None, 0))
+        self.assertEqual(indx.timebracket(2.0), (0, 2))
+        self.assertEqual(indx.timebracket(3.5), (2, 3))
+        self.assertEqual(indx.timebracket(5.0), (3, 6))
+        self.assertEqual(indx.timebracket(8.0), (6, None))
+        self.assertEqual(indx.timefind(5.0)[0], 700)
+
+class MMapPoolTestCase(unittest.TestCase):
+    """
+    Pools made in a scratch directory, locked with file locks, so they don't
+    need OB_POOLS_DIR or SysV semaphores.
+    """
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix='pyplasma-test-')
+        self.pools = list()
+
+    def tearDown(self):
+        for pool in self.pools:
+            try:
+                pool.close()
+            except:
+                pass
+        shutil.rmtree(self.dir, True)
+
+    def makePool(self, name='pool', **options):
+        options.setdefault('size', 102400)
+        options.setdefault('index_capacity', 100)
+        options.setdefault('lock_backend', 'fcntl')
+        MMapPool(os.path.join(self.dir, name)).create(**options)
+        return self.openPool(name)
+
+    def openPool(self, name='pool'):
+        pool = MMapPool(os.path.join(self.dir, name))
+        pool.participate()
+        self.pools.append(pool)
+        return pool
+
+    def fill(self, pool, n):
+        for i in range(n):
+            pool.deposit(Protein(['small'], { 'i': int64(i) }))
+
+class EvictionTestCase(MMapPoolTestCase):
+
+    def testEvictions(self):
+        pool = self.makePool()
+        self.fill(pool, 2000)
+        first = pool.oldest_index()
+        self.assertGreater(first, 0)
+        before = pool.get_info().ingests()
+        pool.deposit(Protein(['large'], { 'pad': 'x' * 50000 }))
+        i = pool.get_info().ingests()
+        self.assertEqual(i['evictions'], pool.oldest_index())
+        self.assertEqual(i['eviction-runs'], before['eviction-runs'] + 1)
+        ## the big deposit jumped over most of what it evicted
+        self.assertGreater(pool.oldest_index() - first, 2 * (i['eviction-skips'] - before['eviction-skips']))
+        self.assertEqual(pool.newest_index(), 2000)
+        self.assertEqual(pool.nth_protein(pool.oldest_index()).ingests()['i'], pool.oldest_index())
+        self.assertRaises(PoolNoSuchProteinException, pool.nth_protein, pool.oldest_index() - 1)
+
+    def testWithoutIndex(self):
+        ## every evicted protein is stepped over one by one
+        pool = self.makePool(index_capacity=0)
+        self.fill(pool, 2000)
+        pool.deposit(Protein(['large'], { 'pad': 'x' * 50000 }))
+        i = pool.get_info().ingests()
+        self.assertEqual(i['evictions'], pool.oldest_index())
+        self.assertEqual(i['evictions'], i['eviction-skips'])
+        self.assertEqual(pool.nth_protein(pool.oldest_index()).ingests()['i'], pool.oldest_index())
+        self.assertRaises(PoolNoSuchProteinException, pool.nth_protein, pool.oldest_index() - 1)
+
+    def testLapped(self):
+        ## a protein that wraps round over everything left from the last
+        ## lap is the oldest protein in the pool
+        for capacity in (100, 0):
+            pool = self.makePool('lapped-%d' % capacity, index_capacity=capacity)
+            self.fill(pool, 5)
+            for i in range(3):
+                n = pool.deposit(Protein(['large'], { 'pad': 'x' * 50000 }))
+            self.assertEqual((pool.oldest_index(), pool.newest_index()), (n, n))
+            self.assertEqual(pool.nth_protein(n).descrips(), ['large'])
+            ret = pool.deposit_many(list(Protein(['large'], { 'pad': 'x' * 50000 }) for i in range(3)))
+            self.assertEqual((pool.oldest_index(), pool.newest_index()), (ret[-1][0], ret[-1][0]))
+
+class DepositManyTestCase(MMapPoolTestCase):
+
+    def batch(self, n, start=0):
+        return list(Protein(['batch'], { 'i': int64(start + i) }) for i in range(n))
+
+    def testDepositMany(self):
+        pool = self.makePool()
+        self.assertEqual(pool.deposit(Protein()), 0)
+        ret = pool.deposit_many(self.batch(150))
+        self.assertEqual(list(x[0] for x in ret), list(range(1, 151)))
+        self.assertIsInstance(ret[0][1], obtimestamp)
+        self.assertEqual(pool.newest_index(), 150)
+        self.assertEqual(pool.nth_protein(75).ingests()['i'], 74)
+        self.assertEqual(pool.deposit_many([]), [])
+        self.assertEqual(pool.deposit(Protein()), 151)
+        pool.writelines(self.batch(2))
+        self.assertEqual(pool.newest_index(), 153)
+
+    def testOneLock(self):
+        pool = self.makePool()
+        pool.set_lock_timing()
+        pool.deposit_many(self.batch(50))
+        i = pool.get_info().ingests()
+        self.assertEqual(i['deposit-lock-uncontended'] + i['deposit-lock-contended'], 1)
+
+    def testNoSkip(self):
+        ## the end of the newest protein comes from its header, so a
+        ## deposit that evicts nothing never steps over a protein
+        pool = self.makePool()
+        self.fill(pool, 3)
+        def skip():
+            raise AssertionError('skip() under the deposit lock')
+        pool.skip = skip
+        self.assertEqual(pool.deposit(Protein(['one'])), 3)
+        ret = pool.deposit_many(self.batch(50, 4))
+        self.assertEqual(ret[-1][0], 53)
+        del pool.skip
+        self.assertEqual(pool.nth_protein(53).ingests()['i'], 53)
+        self.assertEqual(self.openPool().newest_index(), 53)
+
+    def testWrap(self):
+        ## a batch bigger than what's left before the end of the pool is
+        ## published in two runs, and evicts nothing of its own
+        pool = self.makePool()
+        self.fill(pool, 900)
+        ret = pool.deposit_many(self.batch(600, 900))
+        self.assertEqual(ret[-1][0], 1499)
+        self.assertTrue(0 < pool.oldest_index() < 900)
+        for n in (900, 1200, 1499):
+            self.assertEqual(pool.nth_protein(n).ingests()['i'], n)
+        other = self.openPool()
+        self.assertEqual((other.oldest_index(), other.newest_index()), (pool.oldest_index(), 1499))
+
+class ZeroCopyTestCase(MMapPoolTestCase):
+
+    def testCloseWithViews(self):
+        pool = self.makePool()
+        pool.deposit(Protein(list('d%d' % i for i in range(40)), { 'a': numeric_array([float32(i) for i in range(4)], float32) }, b'rude' * 10))
+        pool.set_zero_copy()
+        p = pool.nth_protein(0)
+        rude = p.rude_data()
+        self.assertIsInstance(rude, memoryview)
+        a = p.ingests()['a']
+        self.assertIsNone(pool.close())
+        self.assertTrue(pool.closed)
+        ## what was read stays readable, but can't be vouched for
+        self.assertEqual(rude.tobytes(), b'rude' * 10)
+        self.assertEqual(a[3], 3)
+        self.assertFalse(p.is_valid())
+        self.assertRaises(StompledException, p.descrips)
+        pool.participate()
+        self.assertEqual(pool.nth_protein(0).rude_data(), b'rude' * 10)
+
+    def testTurnOff(self):
+        pool = self.makePool()
+        pool.deposit(Protein(['zero'], rude_data=b'rude'))
+        pool.set_zero_copy()
+        rude = pool.nth_protein(0).rude_data()
+        pool.set_zero_copy(False)
+        self.assertFalse(pool.zero_copy())
+        self.assertEqual(rude.tobytes(), b'rude')
+        self.assertNotIsInstance(pool.nth_protein(0).rude_data(), memoryview)
+
+class SharedOffsetCacheTestCase(MMapPoolTestCase):
+
+    def testTwoHandles(self):
+        pool = self.makePool()
+        self.fill(pool, 20)
+        pool.nth_protein(10)
+        other = self.openPool()
+        ## found through the offsets the first handle cached
+        self.assertEqual(other.nth_protein(5).ingests()['i'], 5)
+        i = other.get_info().ingests()
+        self.assertEqual(i['offset-cache-hits'], 1)
+        self.assertEqual(pool.get_info().ingests()['offset-cache-hits'], 1)
+        other.deposit(Protein(['other']))
+        other.nth_protein(20)
+        self.assertEqual(pool.get_info().ingests()['offset-cache-entries'], other.get_info().ingests()['offset-cache-entries'])
+
+    def testOtherPool(self):
+        pool = self.makePool('one')
+        self.fill(pool, 20)
+        other = self.makePool('two')
+        self.fill(other, 5)
+        self.assertGreater(pool.get_info().ingests()['offset-cache-entries'], other.get_info().ingests()['offset-cache-entries'])
+
+class PoolProteinCacheTestCase(MMapPoolTestCase):
+
+    def setUp(self):
+        MMapPoolTestCase.setUp(self)
+        self.cache = enable_protein_cache()
+
+    def tearDown(self):
+        disable_protein_cache()
+        MMapPoolTestCase.tearDown(self)
+
+    def testHits(self):
+        pool = self.makePool()
+        self.fill(pool, 5)
+        p = pool.nth_protein(3)
+        p.ingests()['i'] = int64(10)
+        self.assertEqual(pool.nth_protein(3).ingests()['i'], 3)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        ## shared with the pool's other handles
+        self.assertEqual(self.openPool().nth_protein(3).ingests()['i'], 3)
+        self.assertEqual(self.cache.hits, 2)
+        self.assertEqual(pool.get_info().ingests()['protein-cache-hits'], 2)
+
+    def testEvicted(self):
+        pool = self.makePool()
+        self.fill(pool, 5)
+        pool.nth_protein(3)
+        for i in range(2):
+            pool.deposit(Protein(['large'], { 'pad': 'x' * 50000 }))
+        self.assertGreater(pool.oldest_index(), 3)
+        self.assertRaises(PoolNoSuchProteinException, pool.nth_protein, 3)
+        self.assertEqual(self.cache.hits, 0)
+
+    def testDisposed(self):
+        ## a new pool on the same path doesn't see the old one's proteins
+        pool = self.makePool()
+        self.fill(pool, 5)
+        pool.nth_protein(3)
+        pool.dispose()
+        pool = self.makePool()
+        pool.deposit(Protein(['new'], { 'i': int64(0) }))
+        self.fill(pool, 4)
+        self.assertEqual(pool.nth_protein(0).descrips(), ['new'])
+        self.assertEqual(pool.nth_protein(3).descrips(), ['small'])
+        self.assertEqual(self.cache.hits, 0)
+
+    def testZeroCopy(self):
+        ## views into the mmap are never cached
+        pool = self.makePool()
+        self.fill(pool, 5)
+        pool.set_zero_copy()
+        pool.nth_protein(3)
+        pool.nth_protein(3)
+        self.assertEqual((len(self.cache), self.cache.hits), (0, 0))
+
+class PoolOffsetIndexTestCase(MMapPoolTestCase):
+
+    def testBuild(self):
+        pool = self.makePool()
+        self.fill(pool, 2000)
+        first = pool.oldest_index()
+        self.assertGreater(first, 0)
+        pool.build_offset_index()
+        self.assertEqual(pool.get_info().ingests()['offset-index-entries'], 2000 - first)
+        for n in (1999, first, (first + 1999) // 2, first + 1):
+            self.assertEqual(pool.nth_protein(n).ingests()['i'], n)
+        self.assertEqual(pool.prev().ingests()['i'], first)
+
+class TimeLookupTestCase(MMapPoolTestCase):
+
+    def testLookup(self):
+        pool = self.makePool()
+        self.fill(pool, 2000)
+        first = pool.oldest_index()
+        for n in (first, first + 1, (first + 1999) // 2, 1999):
+            ## (deposits may share a timestamp, so compare those)
+            ts = pool.nth_protein(n).timestamp()
+            for direction in (DIRECTION_ABSOLUTE, DIRECTION_LOWER, DIRECTION_HIGHER):
+                found = pool.index_lookup(ts, direction=direction)
+                self.assertEqual(pool.nth_protein(found).timestamp(), ts)
+        ts = pool.nth_protein(1999).timestamp().timestamp()
+        self.assertRaises(PoolNoSuchProteinException, pool.index_lookup, ts + 1, direction=DIRECTION_HIGHER)
+        self.assertEqual(pool.index_lookup(ts + 1, direction=DIRECTION_LOWER), 1999)
+        self.assertEqual(pool.index_lookup(0, direction=DIRECTION_HIGHER), first)
+        self.assertRaises(PoolNoSuchProteinException, pool.index_lookup, 0, direction=DIRECTION_LOWER)
+
+class AwaitSpinTestCase(MMapPoolTestCase):
+
+    def later(self, pool, descrip, delay=0.01):
+        t = threading.Timer(delay, pool.deposit, [Protein([descrip])])
+        t.start()
+        return t
+
+    def testSpin(self):
+        pool = self.makePool()
+        depositor = self.openPool()
+        pool.set_await_spin(1000000)
+        self.assertEqual(pool.await_spin(), 1000000)
+        ## the timeout cuts the spin short
+        self.assertRaises(PoolAwaitTimedoutException, pool.await_next, 0.01)
+        t = self.later(depositor, 'spun')
+        self.assertEqual(pool.await_next(5).descrips(), ['spun'])
+        t.join()
+        i = pool.get_info().ingests()
+        self.assertEqual(i['await-spin'], 1000000)
+        self.assertEqual(i['await-spin-wakeups'], 1)
+
+    def testSpinThenBlock(self):
+        pool = self.makePool()
+        depositor = self.openPool()
+        ## spins for a millisecond, then blocks until the deposit
+        pool.set_await_spin(1000)
+        t = self.later(depositor, 'blocked', 0.05)
+        self.assertEqual(pool.await_next(5).descrips(), ['blocked'])
+        t.join()
+        pool.set_await_spin(0)
+        t = self.later(depositor, 'blocked again')
+        self.assertEqual(pool.await_next(5).descrips(), ['blocked again'])
+        t.join()
+        i = pool.get_info().ingests()
+        self.assertEqual((i['await-spin-wakeups'], i['await-block-wakeups']), (0, 2))
+
+class LockTimingTestCase(MMapPoolTestCase):
+
+    def deposits(self, i):
+        return i['deposit-lock-uncontended'] + i['deposit-lock-contended']
+
+    def testStats(self):
+        pool = self.makePool()
+        self.assertFalse(pool.get_info().ingests()['lock-timing'])
+        self.fill(pool, 2)
+        ## nothing is timed until it's turned on
+        self.assertEqual(self.deposits(pool.get_info().ingests()), 0)
+        pool.set_lock_timing()
+        self.assertTrue(pool.lock_timing())
+        self.fill(pool, 3)
+        i = pool.get_info().ingests()
+        self.assertTrue(i['lock-timing'])
+        self.assertEqual(i['lock-backend'], 'fcntl')
+        self.assertEqual(self.deposits(i), 3)
+        self.assertEqual(sum(i['deposit-lock-wait']), 3)
+        self.assertEqual(sum(i['deposit-lock-hold']), 3)
+        pool.reset_lock_stats()
+        i = pool.get_info().ingests()
+        self.assertEqual(self.deposits(i), 0)
+        self.assertEqual(sum(i['deposit-lock-hold']), 0)
+        pool.set_lock_timing(False)
+        self.fill(pool, 1)
+        self.assertEqual(self.deposits(pool.get_info().ingests()), 0)
+
+    def testShared(self):
+        ## handles on the pool in this process share their stats
+        pool = self.makePool()
+        other = self.openPool()
+        pool.set_lock_timing()
+        other.set_lock_timing()
+        self.fill(pool, 2)
+        self.fill(other, 2)
+        for handle in (pool, other):
+            i = handle.get_info().ingests()
+            self.assertEqual(self.deposits(i), 4)
+            self.assertEqual(len(i['deposit-lock-wait']), LOCK_STATS_BUCKETS)
+
+if '__main__' == __name__:
+    unittest.main()
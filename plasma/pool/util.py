@@ -1,4 +1,4 @@
-import os, logging
+import os, logging, fcntl
 from functools import wraps
 
 MY_CONFIG_LOCK = None
@@ -15,6 +15,19 @@ def with_umask(f):
             os.umask(orig_umask)
     return wrapper
 
+def open_exlocked(dirname):
+    ## O_EXLOCK (flock() as part of the open) is BSD / OS X only; elsewhere
+    ## take the same lock once the directory is open
+    if hasattr(os, 'O_EXLOCK'):
+        return os.open(dirname, os.O_EXLOCK|os.O_DIRECTORY)
+    fd = os.open(dirname, os.O_RDONLY|os.O_DIRECTORY)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+    except:
+        os.close(fd)
+        raise
+    return fd
+
 def with_config_lock(f):
     @wraps(f)
     def wrapper(*args, **kwargs):
@@ -24,7 +37,7 @@ def with_config_lock(f):
             ret = f(*args, **kwargs)
         else:
             logging.debug("acquiring config lock")
-            MY_CONFIG_LOCK = os.open('/tmp', os.O_EXLOCK|os.O_DIRECTORY)
+            MY_CONFIG_LOCK = open_exlocked('/tmp')
             logging.debug("config lock acquired (%s)" % MY_CONFIG_LOCK)
             try:
                 logging.debug("releasing config lock for %s" % f)
@@ -1,7 +1,32 @@
-import struct, datetime
+import struct, datetime, copy
 from loam import *
 from plasma.const import *
-from loam.util import get_prefix, AM_I_BIG_ENDIAN
+from plasma.exceptions import *
+from loam.util import get_prefix, AM_I_BIG_ENDIAN, slaw_v2_size, encode_into, encode_slaw2
+
+def descrips_search(descrips, needle, how=SEARCH_GAP):
+    """
+    The search behind Protein.search(), for descrips that have been decoded
+    on their own (see plasma.slaw.decode_descrips()).
+    """
+    if not isinstance(descrips, oblist):
+        print('descrips is not a list (%s)' % type(descrips))
+        return int64(-1)
+    if isinstance(needle, list):
+        if len(needle) == 0:
+            return 0
+        return descrips.search_ex(needle, how)
+    else:
+        return descrips.search_ex(oblist([needle,]), how)
+
+def descrips_match(descrips, needle, how=SEARCH_GAP):
+    """
+    True if Protein.matches() would be true of a protein with these
+    descrips.  Descrips that aren't an oblist never match.
+    """
+    if not isinstance(descrips, oblist):
+        return False
+    return descrips_search(descrips, needle, how) > -1
 
 class Protein(object):
     """
@@ -48,7 +73,7 @@ class Protein(object):
         self.__origin = origin
 
     def __str__(self):
-        return 'Protein(descrips=%s, ingests=%s, rude_data="%s")' % (self.__descrips, self.__ingests, self.__rude_data)
+        return 'Protein(descrips=%s, ingests=%s, rude_data="%s")' % (self.descrips(), self.ingests(), self.rude_data())
 
     def is_null(self):
         pass
@@ -57,11 +82,14 @@ class Protein(object):
         """
         True if the protein has no descrips, ingests or rude data.
         """
-        if self.__descrips is not None and len(self.__descrips) > 0:
+        descrips = self.descrips()
+        if descrips is not None and len(descrips) > 0:
             return False
-        if self.__ingests is not None and len(self.__ingests) > 0:
+        ingests = self.ingests()
+        if ingests is not None and len(ingests) > 0:
             return False
-        if self.rude_data is not None and self.rude_data != '':
+        rude_data = self.rude_data()
+        if rude_data is not None and len(rude_data) > 0:
             return False
         return True
 
@@ -116,15 +144,7 @@ class Protein(object):
         """
         ## Slaw or bslaw, Protein_Search_Type
         ## return int64
-        if type(self.__descrips) != oblist:
-            print('descrips is not a list (%s)' % type(self.__descrips))
-            return int64(-1)
-        if isinstance(needle, list):
-            if len(needle) == 0:
-                return 0
-            return self.__descrips.search_ex(needle, how)
-        else:
-            return self.__descrips.search_ex(oblist([needle,]), how)
+        return descrips_search(self.descrips(), needle, how)
 
     def matches(self, needle, how=SEARCH_GAP):
         """
@@ -178,23 +198,26 @@ class Protein(object):
         raise SlawWrongVersionException('Slaw version %d not supported' % version)
 
     def to_slaw_v1(self):
-        pass
         n = 0
         d = int(self.descrips() is not None)
         i = int(self.ingests() is not None)
         f = 0
-        r = int(len(self.rude_data()) > 0)
-        if len(self.rude_data()) % 4:
-            p = 4 - (len(self.rude_data()) % 4)
-        data = ''
+        rude_data = self.rude_data()
+        if isinstance(rude_data, str):
+            rude_data = rude_data.encode('utf8')
+        r = int(len(rude_data) > 0)
+        p = 0
+        if len(rude_data) % 4:
+            p = 4 - (len(rude_data) % 4)
+        data = b''
         if d:
             data += self.descrips().to_slaw(1)
         if i:
             data += self.ingests().to_slaw(1)
-        data += self.__rude_data
+        data += rude_data
         if p:
-            data += '\x00' * p
-        q = len(data) / 4
+            data += b'\x00' * p
+        q = len(data) // 4
         if q > 2**32:
             h = (1 << 31) | (1 << 30) | (n << 27) | (d << 26) | (i << 25) | (r << 24) | (1 << 23) | (p << 8) | (1 << 7) | f
             h = struct.pack('IQ', h, q)
@@ -207,36 +230,62 @@ class Protein(object):
         return h+data
 
     def to_slaw_v2(self):
+        return encode_slaw2(self)
+
+    def __rude_bytes(self):
+        rude_data = self.rude_data()
+        if isinstance(rude_data, str):
+            rude_data = rude_data.encode('utf8')
+        return rude_data
+
+    def slaw_v2_size(self):
+        size = 16
+        if self.descrips() is not None:
+            size += slaw_v2_size(self.descrips())
+        if self.ingests() is not None:
+            size += slaw_v2_size(self.ingests())
+        r = len(self.__rude_bytes())
+        if r > 7:
+            size += 8 * ((r + 7) // 8)
+        return size
+
+    def encode_into(self, buf, offset=0):
+        """
+        Writes this protein as version 2 slaw into buf (a bytearray, mmap
+        or writable memoryview with room for slaw_v2_size() bytes) at
+        offset, and returns the offset just past it.  The descrips and
+        ingests are written in place, and the headers filled in last.
+        """
         n = 0
         d = int(self.descrips() is not None)
         i = int(self.ingests() is not None)
         f = 0
-        r = len(self.rude_data()) 
+        rude_data = self.__rude_bytes()
+        r = len(rude_data)
         x = int(r > 7)
-        data = ''
+        end = offset + 16
         if d:
-            data += self.descrips().to_slaw(2)
+            end = encode_into(self.descrips(), buf, end)
         if i:
-            data += self.ingests().to_slaw(2)
-        if len(self.rude_data()) > 7:
-            data += self.rude_data()
-            padding = 8 - (r % 8)
-            if padding < 8:
-                data += '\x00' * padding
-            h2 = struct.pack('q', (n << 63) | (d << 62) | (i << 61) | (f << 60) | (x << 59) | r)
+            end = encode_into(self.ingests(), buf, end)
+        if r > 7:
+            buf[end:end+r] = rude_data
+            end += r
+            padding = (8 - (r % 8)) % 8
+            if padding:
+                buf[end:end+padding] = b'\x00' * padding
+                end += padding
+            h2 = (n << 63) | (d << 62) | (i << 61) | (f << 60) | (x << 59) | r
         else:
-            s = self.rude_data()
+            s = rude_data
             if AM_I_BIG_ENDIAN:
-                s = '%s%s' % ('\x00' * (8 - len(s)), s)
-            (special,) = struct.unpack('q', struct.pack('8s', s))
-            h2 = struct.pack('Q', (n << 63) | (d << 62) | (i << 61) | (f << 60) | (x << 59) | (r << 56) | special)
-        octlen = (len(data) / 8) + 2
+                s = b'\x00' * (8 - len(s)) + s
+            (special,) = struct.unpack('Q', struct.pack('8s', s))
+            h2 = (n << 63) | (d << 62) | (i << 61) | (f << 60) | (x << 59) | (r << 56) | special
+        octlen = (end - offset) // 8
         header = (1 << 60) | ((octlen & 0xfffffffffffff0) << 4) | (octlen & 0xf)
-        packed = struct.pack('Q8s%ds' % len(data), header, h2, data)
-        #print ' '.join('%02x' % ord(c) for c in packed)
-        if len(packed) % 8 > 0:
-            raise SlawWrongLengthException('%s packing not a multiple of 8 bytes (%d): %s' % (type(self).__name__, len(packed), self.deconvert()))
-        return packed
+        struct.pack_into('QQ', buf, offset, header, h2)
+        return end
 
     def has_descrips(self, *args):
         dset = set(self.descrips())
@@ -254,7 +303,7 @@ class Protein(object):
     def add_descrips(self, *args):
         if self.__descrips is None:
             self.__descrips = oblist()
-        if type(self.__descrips) != oblist:
+        if not isinstance(self.__descrips, oblist):
             raise TypeError("descrips is not an oblist")
         for d in args:
             self.__descrips.append(d)
@@ -268,13 +317,13 @@ class Protein(object):
     def update_ingests(self, **kwargs):
         if self.__ingests is None:
             self.__ingests = obmap()
-        if type(self.__ingests) != obmap:
+        if not isinstance(self.__ingests, obmap):
             raise TypeError("ingests is not an obmap")
         for k,v in kwargs.iteritems():
             self.__ingests[k] = v
 
     def delete_ingests(self, *args):
-        if type(self.__ingests) != obmap:
+        if not isinstance(self.__ingests, obmap):
             raise TypeError("ingests is not an obmap")
         for k in args:
             if self.__ingests.has_key(k):
@@ -408,3 +457,193 @@ class Protein(object):
             yamlstr += '%singests: %s' % (indent, self.ingests().to_yaml(indent))
         return yamlstr
 
+
+class LazyProtein(Protein):
+    """
+    A protein backed by its encoded (version 2) slaw.  Only the protein's
+    header is looked at up front; descrips, ingests and rude data are each
+    decoded the first time they are asked for.  Re-encoding a lazy protein
+    none of whose parts have been decoded returns the original bytes.
+
+    Any of the set_/unset_/add_/update_/delete_ methods turns it into an
+    ordinary protein first.
+
+    A lazy protein may also be a view straight into a pool's mmap (see
+    MMapPool.set_zero_copy()).  Its rude data (and, with numpy, its
+    numeric arrays) are then read-only memoryviews of the pool rather than
+    copies, and only stay good until the pool overwrites the protein:
+    is_valid() says whether that has happened yet, so check it after
+    you're done with them.
+    """
+
+    def __init__(self, data, backward=False, timestamp=None, index=None, origin=None, valid=None):
+        """
+        data is the complete slaw encoding of the protein (bytes, or a
+        read-only memoryview), and backward is used internally to fix
+        endianness issues.  valid, if given, is called to check that data
+        still holds the protein.
+        """
+        Protein.__init__(self, timestamp=timestamp, index=index, origin=origin)
+        try:
+            (h2,) = struct.unpack_from('q', data, 8)
+        except struct.error:
+            raise SlawCorruptSlawException("unexpected end-of-file")
+        d = (h2 >> 62) & 1
+        i = (h2 >> 61) & 1
+        x = (h2 >> 59) & 1
+        pos = 16
+        self.__descrips_at = None
+        self.__ingests_at = None
+        if d:
+            self.__descrips_at = pos
+            pos += plasma.slaw.v2.slaw2_size(data, pos, backward)
+        if i:
+            self.__ingests_at = pos
+            pos += plasma.slaw.v2.slaw2_size(data, pos, backward)
+        if x:
+            r = h2 & 0x7ffffffffffffff
+            self.__rude_at = (pos, pos + r)
+        else:
+            r = (h2 >> 56) & 7
+            if AM_I_BIG_ENDIAN:
+                self.__rude_at = (16 - r, 16)
+            else:
+                self.__rude_at = (8, 8 + r)
+        if pos > len(data) or self.__rude_at[1] > len(data):
+            raise SlawCorruptSlawException("unexpected end-of-file")
+        self.__data = data
+        self.__backward = backward
+        self.__valid = valid
+        self.__parts = dict()
+
+    def __decode(self, offset):
+        if offset is None:
+            return None
+        x = plasma.slaw.v2.decode_slaw2(self.__data, offset, self.__backward)[0]
+        if not self.is_valid():
+            raise StompledException()
+        return x
+
+    def __unlazy(self):
+        if self.__data is not None:
+            rude_data = self.rude_data()
+            if isinstance(rude_data, memoryview):
+                rude_data = rude_data.tobytes()
+            Protein.__init__(self, self.descrips(), self.ingests(), rude_data, self.timestamp(), self.index(), self.origin())
+            self.__data = None
+            self.__valid = None
+            self.__parts = dict()
+
+    def is_valid(self):
+        """
+        False once the pool this protein was read from (without copying)
+        has overwritten it, after which anything taken from it without
+        being copied may be garbage.  Always True for other proteins.
+        """
+        if self.__valid is None:
+            return True
+        return self.__valid()
+
+    def set_valid(self, valid):
+        """
+        Sets the function is_valid() calls.  Used by pools.
+        """
+        self.__valid = valid
+
+    def copy(self):
+        """
+        Returns another lazy protein over the same encoded bytes, sharing
+        nothing that either of them could change: parts decoded here
+        aren't handed over, so each copy decodes its own.
+        """
+        if self.__data is None:
+            raise ValueError("protein is no longer lazy")
+        p = copy.copy(self)
+        p.__parts = dict()
+        return p
+
+    def is_lazy(self):
+        """
+        True until the protein has been modified.
+        """
+        return self.__data is not None
+
+    def descrips(self):
+        if self.__data is None:
+            return Protein.descrips(self)
+        if 'descrips' not in self.__parts:
+            self.__parts['descrips'] = self.__decode(self.__descrips_at)
+        return self.__parts['descrips']
+
+    def ingests(self):
+        if self.__data is None:
+            return Protein.ingests(self)
+        if 'ingests' not in self.__parts:
+            self.__parts['ingests'] = self.__decode(self.__ingests_at)
+        return self.__parts['ingests']
+
+    def rude_data(self):
+        if self.__data is None:
+            return Protein.rude_data(self)
+        if 'rude_data' not in self.__parts:
+            (start, end) = self.__rude_at
+            if start == end:
+                self.__parts['rude_data'] = ''
+            else:
+                self.__parts['rude_data'] = self.__data[start:end]
+        return self.__parts['rude_data']
+
+    def to_slaw_v2(self):
+        if self.__data is not None and len(self.__parts) == 0:
+            return bytes(self.__data)
+        return Protein.to_slaw_v2(self)
+
+    def slaw_v2_size(self):
+        if self.__data is not None and len(self.__parts) == 0:
+            return len(self.__data)
+        return Protein.slaw_v2_size(self)
+
+    def encode_into(self, buf, offset=0):
+        if self.__data is not None and len(self.__parts) == 0:
+            end = offset + len(self.__data)
+            buf[offset:end] = self.__data
+            return end
+        return Protein.encode_into(self, buf, offset)
+
+    def unset_descrips(self):
+        self.__unlazy()
+        Protein.unset_descrips(self)
+
+    def set_descrips(self, *args):
+        self.__unlazy()
+        Protein.set_descrips(self, *args)
+
+    def add_descrips(self, *args):
+        self.__unlazy()
+        Protein.add_descrips(self, *args)
+
+    def unset_ingests(self):
+        self.__unlazy()
+        Protein.unset_ingests(self)
+
+    def set_ingests(self, **kwargs):
+        self.__unlazy()
+        Protein.set_ingests(self, **kwargs)
+
+    def update_ingests(self, **kwargs):
+        self.__unlazy()
+        Protein.update_ingests(self, **kwargs)
+
+    def delete_ingests(self, *args):
+        self.__unlazy()
+        Protein.delete_ingests(self, *args)
+
+    def unset_rude_data(self):
+        self.__unlazy()
+        Protein.unset_rude_data(self)
+
+    def set_rude_data(self, data):
+        self.__unlazy()
+        Protein.set_rude_data(self, data)
+
+import plasma.slaw.v2
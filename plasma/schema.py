@@ -0,0 +1,405 @@
+"""
+Registered protein schemas.
+
+Many proteins have a fixed shape: the same descrips (perhaps with a slot or
+two that vary) and ingests with the same keys, in the same order, holding
+values of the same types every time.  A schema describes such a shape
+once, and is compiled into an encoder that packs the fixed parts of the
+slaw (headers, constant descrips and keys, numbers and vectors) with
+precomputed struct.Structs, and a decoder that returns a ProteinRecord
+instead of building oblists and obmaps.  Proteins that don't fit the
+schema go through the generic plasma.slaw path instead, so a schema can
+always be used safely.
+
+    schema = register_schema('benchmark',
+                             ['benchmark', obstring],
+                             [('n', int64), ('vect', v3float32), ('words', oblist)])
+    data = schema.encode(protein)
+    rec = schema.decode(data)
+    rec['n'], rec.vect, rec.descrips()
+"""
+import struct, copy
+from loam import *
+from loam.util import make_loamtype, slaw_v2_size, encode_into
+from loam.obnum import obnumber
+from plasma.exceptions import *
+from plasma.protein import Protein
+
+SCHEMAS = dict()
+
+## field kinds
+CONST = 0
+HEADER = 1
+VALUE = 2
+
+def fits(value, cls):
+    ## numbers have to be of exactly the slot's class (unt64 is a subclass
+    ## of int64, but encodes differently); anything else may be a subclass
+    if issubclass(cls, obnumber):
+        return type(value) is cls
+    return isinstance(value, cls)
+
+class ProteinRecord(object):
+    """
+    A protein decoded through a ProteinSchema.  Ingest values are available
+    as rec[key], rec.get(key) or (for keys that are python identifiers)
+    rec.key; descrips() and ingests() build the usual oblist and obmap.
+    """
+    __slots__ = ('_schema', '_values')
+
+    def __init__(self, schema, values):
+        self._schema = schema
+        self._values = values
+
+    def __getitem__(self, key):
+        return self._values[self._schema.key_index[key]]
+
+    def __getattr__(self, name):
+        ## unset slots (e.g. while copy or pickle rebuilds a record) must
+        ## not go looking for ingests through _schema
+        if name.startswith('_'):
+            raise AttributeError(name)
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __contains__(self, key):
+        return key in self._schema.key_index
+
+    def __deepcopy__(self, memo):
+        ## schemas are shared (and hold compiled structs), only the values
+        ## are copied
+        return type(self)(self._schema, copy.deepcopy(self._values, memo))
+
+    def __repr__(self):
+        return '%s(%r, %s)' % (type(self).__name__, self._schema.name, list(self._values))
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def schema(self):
+        return self._schema
+
+    def keys(self):
+        return list(self._schema.keys)
+
+    def descrips(self):
+        values = iter(self._values)
+        return oblist(next(values) if isinstance(d, type) else d for d in self._schema.descrips)
+
+    def ingests(self):
+        m = obmap()
+        for k in self._schema.keys:
+            m[k] = self[k]
+        return m
+
+    def to_protein(self):
+        return Protein(self.descrips(), self.ingests())
+
+class ProteinSchema(object):
+    """
+    A compiled protein shape.  descrips is a list whose entries are either
+    constant values (usually strings) or loam classes, which stand for a
+    descrip that varies; ingests is a list of (key, loam class) pairs (or a
+    dict), giving the keys of the ingests map in order and the type of each
+    value.
+    """
+
+    def __init__(self, name, descrips, ingests):
+        self.name = name
+        self.descrips = list(descrips)
+        if isinstance(ingests, dict):
+            ingests = list(ingests.items())
+        self.ingests = list((make_loamtype(k), cls) for k, cls in ingests)
+        self.keys = tuple(k for k, cls in self.ingests)
+        n = len(list(d for d in self.descrips if isinstance(d, type)))
+        ## position of each ingest's value in the slot values
+        self.key_index = dict((k, n + i) for i, k in enumerate(self.keys))
+        self.__compile()
+
+    def __repr__(self):
+        return 'ProteinSchema(%r)' % self.name
+
+    ## ------------------- ##
+    ## compiling the shape ##
+    ## ------------------- ##
+
+    def __compile(self):
+        ## Lay out the whole protein as a sequence of struct fields, then cut
+        ## it into runs of fixed size fields separated by variable size
+        ## slots.  Each header's octlen is its group's fixed size plus the
+        ## sizes of the variable slots inside it.
+        self.__run = list()
+        self.__open = list()
+        self.__fixed = dict()
+        self.__slots = list()
+        self.__pieces = list()
+        self.__header('protein', None)
+        self.__const('Q', (1 << 62) | (1 << 61))
+        self.__header('descrips', (0x40 | min(len(self.descrips), 15)) << 56)
+        if len(self.descrips) > 14:
+            self.__const('q', len(self.descrips))
+        for d in self.descrips:
+            if isinstance(d, type):
+                self.__slot(d)
+            else:
+                self.__encoded(make_loamtype(d))
+        self.__open.pop()
+        self.__header('ingests', (0x50 | min(len(self.ingests), 15)) << 56)
+        if len(self.ingests) > 14:
+            self.__const('q', len(self.ingests))
+        for i, (k, cls) in enumerate(self.ingests):
+            self.__header('cons%d' % i, 0x62 << 56)
+            self.__encoded(k)
+            self.__slot(cls)
+            self.__open.pop()
+        self.__open.pop()
+        self.__flush()
+        if len(self.__slots) == 0 and len(self.__pieces) == 1:
+            self.__single = self.__pieces[0]
+        else:
+            self.__single = None
+
+    def __add(self, fmt, kind, data):
+        size = struct.calcsize('=' + fmt)
+        for g in self.__open:
+            self.__fixed[g] = self.__fixed.get(g, 0) + size
+        self.__run.append((fmt, kind, data))
+
+    def __const(self, fmt, value):
+        self.__add(fmt, CONST, value)
+
+    def __header(self, group, high):
+        ## opens a group, which the caller closes; the header counts towards
+        ## the group's own length
+        self.__fixed[group] = 0
+        self.__open.append(group)
+        self.__add('Q', HEADER, (group, high))
+
+    def __encoded(self, obj):
+        data = obj.to_slaw_v2()
+        self.__const('%ds' % len(data), data)
+
+    def __slot(self, cls):
+        index = len(self.__slots)
+        desc = None
+        if isinstance(cls, type) and issubclass(cls, obnumber):
+            try:
+                desc = loam.numtype.describe(cls)
+            except KeyError:
+                desc = None
+        if desc is None:
+            ## variable size: ends the current run
+            self.__flush()
+            self.__slots.append((cls, tuple(self.__open)))
+            self.__pieces.append(index)
+            return
+        self.__slots.append((cls, None))
+        if desc.v2_struct is None:
+            ## wee numbers keep their value in the low bits of the header
+            pad = 4 - desc.bytesize
+            high = desc.v2_header >> 32
+            if desc.v2_wee_offset == 0:
+                self.__add(desc.format, VALUE, (index, desc))
+                if pad:
+                    self.__add('%dx' % pad, CONST, None)
+                self.__const('I', high)
+            else:
+                self.__const('I', high)
+                if pad:
+                    self.__add('%dx' % pad, CONST, None)
+                self.__add(desc.format, VALUE, (index, desc))
+        else:
+            self.__const('Q', desc.v2_header)
+            self.__add(desc.format, VALUE, (index, desc))
+            pad = desc.v2_size - 8 - desc.bytesize
+            if pad:
+                self.__add('%dx' % pad, CONST, None)
+
+    def __flush(self):
+        if len(self.__run) == 0:
+            return
+        fields = self.__run
+        self.__run = list()
+        s = struct.Struct('=' + ''.join(f[0] for f in fields))
+        ## args: where each field's items go in the packed tuple
+        template = list()
+        fill = list()
+        for (fmt, kind, data) in fields:
+            if fmt.endswith('x'):
+                continue
+            if kind == CONST:
+                template.append(data)
+            elif kind == HEADER:
+                fill.append((len(template), HEADER, data))
+                template.append(0)
+            else:
+                (index, desc) = data
+                fill.append((len(template), VALUE, data))
+                template.extend([0] * desc.count)
+        self.__pieces.append((s, template, fill))
+
+    ## -------- ##
+    ## encoding ##
+    ## -------- ##
+
+    def values(self, protein):
+        """
+        Returns the list of slot values (varying descrips, then ingest
+        values) if protein fits this schema, otherwise None.
+        """
+        descrips = protein.descrips()
+        ingests = protein.ingests()
+        if descrips is None or ingests is None or len(protein.rude_data()) > 0:
+            return None
+        if len(descrips) != len(self.descrips) or len(ingests) != len(self.ingests):
+            return None
+        values = list()
+        for (d, x) in zip(self.descrips, descrips):
+            if isinstance(d, type):
+                if not fits(x, d):
+                    return None
+                values.append(x)
+            elif x != d:
+                return None
+        ## the keys have to come in the schema's order too, or the compiled
+        ## encoding wouldn't match the protein's own
+        for ((k, cls), key) in zip(self.ingests, ingests.iterkeys()):
+            if key != k:
+                return None
+            x = ingests[key]
+            if not fits(x, cls):
+                return None
+            values.append(x)
+        return values
+
+    def __header_value(self, group, high, sizes):
+        octlen = (self.__fixed[group] + sizes.get(group, 0)) // 8
+        if high is None:
+            return (1 << 60) | ((octlen & 0xfffffffffffff0) << 4) | (octlen & 0xf)
+        return high | octlen
+
+    def __args(self, template, fill, values, sizes):
+        args = list(template)
+        for (i, kind, data) in fill:
+            if kind == HEADER:
+                args[i] = self.__header_value(data[0], data[1], sizes)
+            else:
+                (index, desc) = data
+                args[i:i+desc.count] = desc.values(values[index])
+        return args
+
+    def encode_values(self, values):
+        """
+        Encodes a protein of this shape from its slot values (as returned
+        by values()) as version 2 slaw.
+        """
+        if self.__single is not None:
+            (s, template, fill) = self.__single
+            return s.pack(*self.__args(template, fill, values, {}))
+        sizes = dict()
+        for i in self.__pieces:
+            if isinstance(i, int):
+                size = slaw_v2_size(values[i])
+                for g in self.__slots[i][1]:
+                    sizes[g] = sizes.get(g, 0) + size
+        buf = bytearray(self.__fixed['protein'] + sizes.get('protein', 0))
+        pos = 0
+        for piece in self.__pieces:
+            if isinstance(piece, int):
+                pos = encode_into(values[piece], buf, pos)
+            else:
+                (s, template, fill) = piece
+                s.pack_into(buf, pos, *self.__args(template, fill, values, sizes))
+                pos += s.size
+        return bytes(buf)
+
+    def encode(self, protein):
+        """
+        Returns protein encoded as version 2 slaw: through the compiled
+        encoder if it fits this schema, or its own to_slaw() otherwise.
+        """
+        if isinstance(protein, ProteinRecord) and protein._schema is self:
+            return self.encode_values(protein._values)
+        values = self.values(protein)
+        if values is None:
+            return protein.to_slaw(2)
+        return self.encode_values(values)
+
+    ## -------- ##
+    ## decoding ##
+    ## -------- ##
+
+    def __match(self, buf, offset):
+        ## returns the slot values, or None if buf doesn't hold this shape
+        values = [None] * len(self.__slots)
+        headers = list()
+        sizes = dict()
+        pos = offset
+        for piece in self.__pieces:
+            if isinstance(piece, int):
+                (x, end) = plasma.slaw.v2.decode_slaw2(buf, pos)
+                if not fits(x, self.__slots[piece][0]):
+                    return None
+                for g in self.__slots[piece][1]:
+                    sizes[g] = sizes.get(g, 0) + (end - pos)
+                values[piece] = x
+                pos = end
+                continue
+            (s, template, fill) = piece
+            if pos + s.size > len(buf):
+                return None
+            items = s.unpack_from(buf, pos)
+            pos += s.size
+            j = 0
+            for (i, kind, data) in fill:
+                if items[j:i] != tuple(template[j:i]):
+                    return None
+                if kind == HEADER:
+                    headers.append((items[i], data))
+                    j = i + 1
+                else:
+                    (index, desc) = data
+                    values[index] = desc.make(items[i:i+desc.count])
+                    j = i + desc.count
+            if items[j:] != tuple(template[j:]):
+                return None
+        for (value, (group, high)) in headers:
+            if value != self.__header_value(group, high, sizes):
+                return None
+        return values
+
+    def decode(self, data, offset=0):
+        """
+        Decodes the version 2 protein at offset in data.  Returns a
+        ProteinRecord if it has this schema's shape, or whatever
+        plasma.slaw.decode_slaw2() makes of it otherwise.
+        """
+        try:
+            values = self.__match(data, offset)
+        except (struct.error, LoamException):
+            values = None
+        if values is None:
+            return plasma.slaw.v2.decode_slaw2(data, offset)[0]
+        return ProteinRecord(self, tuple(values))
+
+def register_schema(name, descrips, ingests):
+    """
+    Compiles a ProteinSchema, registers it under name, and returns it.
+    """
+    schema = ProteinSchema(name, descrips, ingests)
+    SCHEMAS[name] = schema
+    return schema
+
+def get_schema(name):
+    """
+    Returns the schema registered under name.
+    """
+    return SCHEMAS[name]
+
+import loam.numtype
+import plasma.slaw.v2
@@ -1,6 +1,29 @@
-import sys, math, logging, random, traceback
+"""
+The deposit and notification locks of a pool.  Each lock backend is a
+class with the interface of SemaphoreSet (deposit_lock(),
+notification_unlock(), has_deposit_lock() and so on, plus key(), close()
+and destroy()):
+
+* SemaphoreSet: a SysV semaphore set, whose key is kept in the pool's
+  configuration (the 'sysv' backend, and what libPlasma uses)
+* FileLockSet: fcntl byte-range locks on the pool's mmap file (the
+  'fcntl' backend), which need no system-wide semaphores and are
+  released by the kernel when their holder dies
+
+ThreadLockedSet stacks a threading.Lock, shared by the pool's handles in
+this process, in front of either, so threads queue up in the process
+instead of all going to the kernel.  TimedLockSet goes in front of any of
+them and keeps histograms of how long the locks were waited for and held
+(see LockStats).
+
+Every lock method takes wait=False, to return False instead of blocking
+when the lock is held elsewhere.
+"""
+import os, sys, math, time, logging, random, traceback, threading, struct, fcntl, errno
+from array import array
 from plasma.exceptions import *
 from plasma.sem_ops.const import *
+from plasma.sem_ops.exceptions import LockingException
 import plasma.sem_ops.c
 
 POOL_SEM_SET_COUNT = 2
@@ -43,6 +66,13 @@ class SemaphoreSet(object):
     def id(self):
         return self.__id
 
+    def backend(self):
+        return 'sysv'
+
+    def close(self):
+        ## the semaphores outlive the handle; nothing to let go of
+        return None
+
     def has_deposit_lock(self):
         return self.__deposit_lock
 
@@ -153,12 +183,15 @@ class SemaphoreSet(object):
             return 'notification'
         return 'unknown'
 
-    def __lock(self, idx):
+    def __lock(self, idx, wait=True):
+        ## returns False if wait is False and the lock is held elsewhere
         lock_op = {
             'sem_op': -1,
             'sem_num': idx,
             'sem_flg': SEM_UNDO
         }
+        if not wait:
+            lock_op['sem_flg'] |= IPC_NOWAIT
         try:
             count = self.__getval(idx)
         except SemInvalidException:
@@ -166,6 +199,8 @@ class SemaphoreSet(object):
             self.__recreate_maliciously_deleted_semaphore()
         try:
             ret = self.__semop([lock_op,])
+        except SemWaitException:
+            return False
         #except (SemInvalidException, SemDoesNotExistException), e:
         except (SemInvalidException, SemDoesNotExistException) as e:
             logging.exception("%s lock semop failed with %s, which probably means somebody deleted a pool you were still using" % (self.__idx_name(idx), type(e).__name__))
@@ -181,6 +216,7 @@ class SemaphoreSet(object):
             raise
         if count != 0:
             raise LockingException("%s locked, but count shows %d (should be 0)" % (self.__idx_name(idx), count))
+        return True
 
     def __unlock(self, idx):
         unlock_op = {
@@ -215,13 +251,15 @@ class SemaphoreSet(object):
     def has_deposit_lock(self):
         return self.__deposit_lock
 
-    def deposit_lock(self):
+    def deposit_lock(self, wait=True):
         """
         Locks (decrements) the deposit semaphore.  If the lock
         is already held, nothing will happen here.  If the
         notification lock is already held, this will raise an
         exception, as that locking order could lead to deadlock.
         Returns True on success, or raises an exception on error.
+        Without wait, returns False if somebody else holds the
+        lock.
         """
         if self.__deposit_lock:
             ## we already hold the deposit lock
@@ -233,7 +271,8 @@ class SemaphoreSet(object):
             ## always do the deposit before the notify
             raise LockingException("You may not acquire the deposit lock while holding the notification lock.  This could result in a deadlock situation.")
         logging.debug('acquiring deposit lock')
-        self.__lock(POOL_SEM_DEPOSIT_LOCK_IDX)
+        if not self.__lock(POOL_SEM_DEPOSIT_LOCK_IDX, wait):
+            return False
         self.__deposit_lock = True
         return True
 
@@ -256,18 +295,21 @@ class SemaphoreSet(object):
     def has_notification_lock(self):
         return self.__notification_lock
 
-    def notification_lock(self):
+    def notification_lock(self, wait=True):
         """
         Locks (decrements) the notification semaphore.  If the
         lock is already held, nothing will happen here.  Returns
         True on success, or raises an exception on error.
+        Without wait, returns False if somebody else holds the
+        lock.
         """
         if self.__notification_lock:
             ## we already hold the notification lock
             logging.error('already holding notification lock')
             return True
         logging.debug('acquiring notification lock')
-        self.__lock(POOL_SEM_NOTIFICATION_LOCK_IDX)
+        if not self.__lock(POOL_SEM_NOTIFICATION_LOCK_IDX, wait):
+            return False
         self.__notification_lock = True
         return True
 
@@ -287,3 +329,355 @@ class SemaphoreSet(object):
         self.__notification_lock = False
         return True
 
+## byte offset in the pool file of each lock
+FILE_LOCK_DEPOSIT_BYTE = 0
+FILE_LOCK_NOTIFICATION_BYTE = 1
+## struct flock; l_pid is 0, as open file description locks require
+FLOCK = struct.Struct('hhqqi')
+
+class FileLockSet(object):
+    """
+    The deposit and notification locks as fcntl write locks on single bytes
+    (at the start of the header) of the pool's mmap file.  The locks are
+    advisory, so the bytes themselves are read and written as usual.
+
+    Where the system has open file description locks (F_OFD_SETLKW, linux
+    3.15 and later), each handle's locks are its own, like a semaphore's.
+    Otherwise they fall back to process-wide POSIX locks, and the handles
+    in one process tell each other apart with a ThreadLockedSet.  (POSIX
+    locks are also dropped when the process closes any descriptor of the
+    file, so open file description locks are much to be preferred.)
+    """
+
+    def __init__(self, path):
+        self.__deposit_lock = False
+        self.__notification_lock = False
+        self.__path = path
+        self.__fd = os.open(path, os.O_RDWR)
+        self.created = False
+
+    def key(self):
+        ## no semaphore set: the pool records a key of 0
+        return 0
+
+    def backend(self):
+        return 'fcntl'
+
+    def process_wide(self):
+        """
+        True if the locks are held by the process (so handles in the same
+        process don't exclude each other), rather than the handle.
+        """
+        return getattr(fcntl, 'F_OFD_SETLKW', None) is None
+
+    def close(self):
+        if self.__fd is not None:
+            os.close(self.__fd)
+            self.__fd = None
+
+    def destroy(self):
+        """
+        Nothing to remove from the system; just closes the file.
+        """
+        self.close()
+
+    def __fcntl(self, lock_type, offset, wait=True):
+        ## returns False if wait is False and the lock is held elsewhere.
+        ## (python retries the call itself when it's interrupted)
+        try:
+            if getattr(fcntl, 'F_OFD_SETLKW', None) is None:
+                if lock_type == fcntl.F_UNLCK:
+                    fcntl.lockf(self.__fd, fcntl.LOCK_UN, 1, offset)
+                elif wait:
+                    fcntl.lockf(self.__fd, fcntl.LOCK_EX, 1, offset)
+                else:
+                    fcntl.lockf(self.__fd, fcntl.LOCK_EX|fcntl.LOCK_NB, 1, offset)
+            else:
+                if wait:
+                    cmd = fcntl.F_OFD_SETLKW
+                else:
+                    cmd = fcntl.F_OFD_SETLK
+                fcntl.fcntl(self.__fd, cmd, FLOCK.pack(lock_type, os.SEEK_SET, offset, 1, 0))
+        except (IOError, OSError) as e:
+            if not wait and e.errno in (errno.EAGAIN, errno.EACCES):
+                return False
+            raise PoolSemaphoresBadthException('', e.errno, 'fcntl', self.__path, offset)
+        return True
+
+    def has_deposit_lock(self):
+        return self.__deposit_lock
+
+    def deposit_lock(self, wait=True):
+        """
+        Locks the deposit byte, with the same rules as
+        SemaphoreSet.deposit_lock().
+        """
+        if self.__deposit_lock:
+            logging.error('already holding deposit lock')
+            return True
+        if self.__notification_lock:
+            raise LockingException("You may not acquire the deposit lock while holding the notification lock.  This could result in a deadlock situation.")
+        if not self.__fcntl(fcntl.F_WRLCK, FILE_LOCK_DEPOSIT_BYTE, wait):
+            return False
+        self.__deposit_lock = True
+        return True
+
+    def deposit_unlock(self):
+        if not self.__deposit_lock:
+            logging.error("attempting to release the deposit lock, but you don't already hold it")
+            traceback.print_stack()
+            return False
+        self.__fcntl(fcntl.F_UNLCK, FILE_LOCK_DEPOSIT_BYTE)
+        self.__deposit_lock = False
+        return True
+
+    def has_notification_lock(self):
+        return self.__notification_lock
+
+    def notification_lock(self, wait=True):
+        if self.__notification_lock:
+            logging.error('already holding notification lock')
+            return True
+        if not self.__fcntl(fcntl.F_WRLCK, FILE_LOCK_NOTIFICATION_BYTE, wait):
+            return False
+        self.__notification_lock = True
+        return True
+
+    def notification_unlock(self):
+        if not self.__notification_lock:
+            logging.error("attempting to release the notification lock, but you don't already hold it")
+            traceback.print_stack()
+            return False
+        self.__fcntl(fcntl.F_UNLCK, FILE_LOCK_NOTIFICATION_BYTE)
+        self.__notification_lock = False
+        return True
+
+## (deposit, notification) threading locks for each pool file in use in
+## this process, by (st_dev, st_ino)
+THREAD_LOCKS = dict()
+THREAD_LOCKS_LOCK = threading.Lock()
+
+def thread_locks(key):
+    with THREAD_LOCKS_LOCK:
+        if key not in THREAD_LOCKS:
+            THREAD_LOCKS[key] = (threading.Lock(), threading.Lock())
+        return THREAD_LOCKS[key]
+
+class ThreadLockedSet(object):
+    """
+    Puts a threading.Lock in front of each of a lock set's locks, shared
+    by every handle in this process on the pool file identified by key.
+    A thread takes it before the process lock and lets it go after, so
+    while one thread holds (or waits for) the process lock, the others in
+    the process wait on the threading lock without making system calls.
+    """
+
+    def __init__(self, inner, key):
+        self.__inner = inner
+        (self.__deposit, self.__notification) = thread_locks(key)
+
+    def inner(self):
+        return self.__inner
+
+    @property
+    def created(self):
+        return self.__inner.created
+
+    def key(self):
+        return self.__inner.key()
+
+    def backend(self):
+        return self.__inner.backend()
+
+    def close(self):
+        return self.__inner.close()
+
+    def destroy(self):
+        return self.__inner.destroy()
+
+    def has_deposit_lock(self):
+        return self.__inner.has_deposit_lock()
+
+    def has_notification_lock(self):
+        return self.__inner.has_notification_lock()
+
+    def __lock(self, thread_lock, held, lock, wait):
+        if held():
+            return lock(wait)
+        if not thread_lock.acquire(wait):
+            return False
+        try:
+            locked = lock(wait)
+        except:
+            thread_lock.release()
+            raise
+        if not locked:
+            thread_lock.release()
+        return locked
+
+    def __unlock(self, thread_lock, held, unlock):
+        if not held():
+            return unlock()
+        try:
+            return unlock()
+        finally:
+            thread_lock.release()
+
+    def deposit_lock(self, wait=True):
+        if self.__inner.has_notification_lock() and not self.__inner.has_deposit_lock():
+            ## (before we queue for a lock we may not take)
+            return self.__inner.deposit_lock(wait)
+        return self.__lock(self.__deposit, self.__inner.has_deposit_lock, self.__inner.deposit_lock, wait)
+
+    def deposit_unlock(self):
+        return self.__unlock(self.__deposit, self.__inner.has_deposit_lock, self.__inner.deposit_unlock)
+
+    def notification_lock(self, wait=True):
+        return self.__lock(self.__notification, self.__inner.has_notification_lock, self.__inner.notification_lock, wait)
+
+    def notification_unlock(self):
+        return self.__unlock(self.__notification, self.__inner.has_notification_lock, self.__inner.notification_unlock)
+
+## lock times are counted in power of two buckets of microseconds: bucket
+## 0 is under a microsecond, bucket n from 2**(n-1) up to 2**n, and the last
+## one everything longer
+LOCK_STATS_BUCKETS = 24
+clock = getattr(time, 'perf_counter', time.time)
+
+def time_bucket(seconds):
+    return min(int(seconds * 1000000).bit_length(), LOCK_STATS_BUCKETS - 1)
+
+class LockTimes(object):
+    """
+    How one of a pool's locks has been acquired: histograms of the time
+    spent waiting for it and holding it, and how often it was free
+    (uncontended) or had to be waited for (contended).
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.wait = array('L', [0] * LOCK_STATS_BUCKETS)
+        self.hold = array('L', [0] * LOCK_STATS_BUCKETS)
+        self.contended = 0
+        self.uncontended = 0
+
+    def acquired(self, seconds, contended):
+        self.wait[time_bucket(seconds)] += 1
+        if contended:
+            self.contended += 1
+        else:
+            self.uncontended += 1
+
+    def released(self, seconds):
+        self.hold[time_bucket(seconds)] += 1
+
+class LockStats(object):
+    """
+    LockTimes for a pool's deposit and notification locks.  Only changed
+    by the holder of the lock in question, so needs no locking of its own.
+    """
+
+    def __init__(self):
+        self.deposit = LockTimes()
+        self.notification = LockTimes()
+
+    def reset(self):
+        self.deposit.reset()
+        self.notification.reset()
+
+## LockStats shared by the handles in this process on each pool file, by
+## (st_dev, st_ino)
+LOCK_STATS = dict()
+
+def lock_stats(key):
+    with THREAD_LOCKS_LOCK:
+        if key not in LOCK_STATS:
+            LOCK_STATS[key] = LockStats()
+        return LOCK_STATS[key]
+
+def forget_lock_stats(key):
+    with THREAD_LOCKS_LOCK:
+        LOCK_STATS.pop(key, None)
+
+class TimedLockSet(object):
+    """
+    Times the acquiring and holding of a lock set's locks into a
+    LockStats.  Each acquire first tries the lock without waiting, which
+    is how it tells contended acquires from uncontended ones (and costs
+    an extra call when the lock is contended).  Lock sets without it
+    don't pay for any of this.
+    """
+
+    def __init__(self, inner, stats):
+        self.__inner = inner
+        self.__stats = stats
+        self.__deposit_since = None
+        self.__notification_since = None
+
+    def inner(self):
+        return self.__inner
+
+    def stats(self):
+        return self.__stats
+
+    @property
+    def created(self):
+        return self.__inner.created
+
+    def key(self):
+        return self.__inner.key()
+
+    def backend(self):
+        return self.__inner.backend()
+
+    def close(self):
+        return self.__inner.close()
+
+    def destroy(self):
+        return self.__inner.destroy()
+
+    def has_deposit_lock(self):
+        return self.__inner.has_deposit_lock()
+
+    def has_notification_lock(self):
+        return self.__inner.has_notification_lock()
+
+    def __acquire(self, times, lock, wait):
+        ## returns the time the lock was acquired, or None
+        start = clock()
+        contended = not lock(False)
+        if contended:
+            if not wait or not lock(True):
+                return None
+        now = clock()
+        times.acquired(now - start, contended)
+        return now
+
+    def deposit_lock(self, wait=True):
+        if self.__inner.has_deposit_lock() or self.__inner.has_notification_lock():
+            ## nothing to acquire (or an error to raise)
+            return self.__inner.deposit_lock(wait)
+        self.__deposit_since = self.__acquire(self.__stats.deposit, self.__inner.deposit_lock, wait)
+        return self.__deposit_since is not None
+
+    def deposit_unlock(self):
+        if self.__inner.has_deposit_lock() and self.__deposit_since is not None:
+            self.__stats.deposit.released(clock() - self.__deposit_since)
+            self.__deposit_since = None
+        return self.__inner.deposit_unlock()
+
+    def notification_lock(self, wait=True):
+        if self.__inner.has_notification_lock():
+            return self.__inner.notification_lock(wait)
+        self.__notification_since = self.__acquire(self.__stats.notification, self.__inner.notification_lock, wait)
+        return self.__notification_since is not None
+
+    def notification_unlock(self):
+        if self.__inner.has_notification_lock() and self.__notification_since is not None:
+            self.__stats.notification.released(clock() - self.__notification_since)
+            self.__notification_since = None
+        return self.__inner.notification_unlock()
+
+LOCK_BACKENDS = ('sysv', 'fcntl')
@@ -55,14 +55,14 @@ def semget(key, nsems, semflg):
 def semctl(semid, semnum, cmd, args=None):
     if args is not None:
         xargs = dict()
-        if args.has_key('val'):
+        if 'val' in args:
             xargs['val'] = ctypes.c_int(args['val'])
-        if args.has_key('buf'):
+        if 'buf' in args:
             if type(args['buf']['sem_perm']) == dict:
-                args['buf']['sem_perm'] = _ipc_perm_new(**pargs)
+                args['buf']['sem_perm'] = _ipc_perm_new(**args['buf']['sem_perm'])
             buf = args['buf']
             xargs['buf'] = semid_ds(**buf)
-        if args.has_key('array'):
+        if 'array' in args:
             arr = tuple(ctypes.c_ushort(x) for x in args['array'])
             c_arr = (ctypes.c_ushort * len(arr))(*arr)
             xargs['array'] = ctypes.pointer(c_arr)
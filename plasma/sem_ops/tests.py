@@ -0,0 +1,128 @@
+import unittest, os, tempfile, threading, time
+from plasma.sem_ops import *
+from plasma.sem_ops.exceptions import LockingException
+
+class FileLockSetTestCase(unittest.TestCase):
+
+    def setUp(self):
+        (fd, self.path) = tempfile.mkstemp()
+        os.write(fd, b'\0' * 64)
+        os.close(fd)
+        self.sets = list()
+
+    def tearDown(self):
+        for locks in self.sets:
+            locks.close()
+        os.unlink(self.path)
+
+    def makeSet(self, stacked=False):
+        locks = FileLockSet(self.path)
+        self.sets.append(locks)
+        if stacked or locks.process_wide():
+            return ThreadLockedSet(locks, self.path)
+        return locks
+
+    def contend(self, first, second):
+        first.deposit_lock()
+        got = threading.Event()
+        def take():
+            second.deposit_lock()
+            got.set()
+            second.deposit_unlock()
+        t = threading.Thread(target=take)
+        t.start()
+        self.assertFalse(got.wait(0.05))
+        first.deposit_unlock()
+        self.assertTrue(got.wait(5))
+        t.join()
+
+    def testExclusion(self):
+        self.contend(self.makeSet(), self.makeSet())
+
+    def testStacked(self):
+        self.contend(self.makeSet(True), self.makeSet(True))
+        ## the notification lock is separate
+        (a, b) = (self.makeSet(True), self.makeSet(True))
+        a.deposit_lock()
+        b.notification_lock()
+        self.assertTrue(a.has_deposit_lock() and b.has_notification_lock())
+        b.notification_unlock()
+        a.deposit_unlock()
+
+    def testOrder(self):
+        for locks in (self.makeSet(), self.makeSet(True)):
+            locks.notification_lock()
+            self.assertRaises(LockingException, locks.deposit_lock)
+            locks.notification_unlock()
+            self.assertTrue(locks.deposit_lock())
+            self.assertTrue(locks.notification_lock())
+            locks.notification_unlock()
+            locks.deposit_unlock()
+            self.assertFalse(locks.has_deposit_lock())
+
+class SemaphoreSetTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.sem = SemaphoreSet()
+
+    def tearDown(self):
+        self.sem.destroy()
+
+    def testExclusion(self):
+        other = SemaphoreSet(self.sem.key())
+        self.assertEqual(other.id(), self.sem.id())
+        self.assertTrue(self.sem.deposit_lock())
+        self.assertFalse(other.deposit_lock(False))
+        self.sem.deposit_unlock()
+        self.assertTrue(other.deposit_lock(False))
+        other.deposit_unlock()
+        self.assertFalse(self.sem.has_deposit_lock())
+
+class LockStatsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        (fd, self.path) = tempfile.mkstemp()
+        os.close(fd)
+        self.stats = LockStats()
+        self.first = TimedLockSet(FileLockSet(self.path), self.stats)
+        self.second = TimedLockSet(FileLockSet(self.path), self.stats)
+
+    def tearDown(self):
+        self.first.close()
+        self.second.close()
+        os.unlink(self.path)
+
+    def testBuckets(self):
+        self.assertEqual(time_bucket(0.0000005), 0)
+        self.assertEqual(time_bucket(0.000001), 1)
+        self.assertEqual(time_bucket(0.000003), 2)
+        self.assertEqual(time_bucket(1000), LOCK_STATS_BUCKETS - 1)
+
+    def testTimes(self):
+        if self.first.inner().process_wide():
+            return
+        self.first.deposit_lock()
+        self.assertFalse(self.second.deposit_lock(False))
+        t = threading.Thread(target=self.second.deposit_lock)
+        t.start()
+        time.sleep(0.01)
+        self.first.deposit_unlock()
+        t.join()
+        self.second.deposit_unlock()
+        self.first.notification_lock()
+        self.first.notification_unlock()
+        deposit = self.stats.deposit
+        self.assertEqual((deposit.uncontended, deposit.contended), (1, 1))
+        self.assertEqual(sum(deposit.wait), 2)
+        self.assertEqual(sum(deposit.hold), 2)
+        ## the contended acquire waited for about 10ms
+        self.assertEqual(sum(deposit.wait[time_bucket(0.004):]), 1)
+        self.assertEqual(self.stats.notification.uncontended, 1)
+        self.stats.reset()
+        self.assertEqual((sum(deposit.wait), deposit.contended), (0, 0))
+
+def main():
+    unittest.main()
+
+if '__main__' == __name__:
+    main()
@@ -1,13 +1,14 @@
 #import struct, cStringIO, re
 import struct, re
-from io import StringIO
+from io import StringIO, BytesIO
 
 try:
     import yaml
 except:
     yaml = None
 from plasma.slaw.v1 import parse_slaw1, skip_slaw1
-from plasma.slaw.v2 import parse_slaw2, skip_slaw2
+from plasma.slaw.v2 import parse_slaw2, skip_slaw2, decode_slaw2, slaw2_size, parse_descrips2, decode_descrips2
+from plasma.slaw.stream import SlawStreamDecoder
 from loam import *
 from plasma.protein import Protein
 from plasma.const import *
@@ -83,6 +84,18 @@ def skip_slaw(version, fh, backward=False):
         return skip_slaw2(fh, backward)
     raise SlawWrongVersionException('Slaw version %d not supported' % version)
 
+def parse_descrips(version, fh, backward=False):
+    """
+    Reads the next protein from the file object fh, like parse_slaw(), but
+    returns only its descrips (None if it has none).  For version 2 slaw,
+    the ingests and rude data are skipped rather than decoded.
+    """
+    if version == 2:
+        return parse_descrips2(fh, backward)
+    if version == 1:
+        return parse_slaw1(fh, backward).descrips()
+    raise SlawWrongVersionException('Slaw version %d not supported' % version)
+
 def parse_yaml_slaw(fh):
     tag = fh.readline()
     data = yaml.load(fh)
@@ -96,8 +109,37 @@ def parse_slaw_data(version, data, backward=False):
     fix endianness issues.
     """
     #return parse_slaw(version, cStringIO.StringIO(data), backward)
-    result = parse_slaw(version, StringIO.StringIO(data), backward)
-    return result
+    #result = parse_slaw(version, StringIO.StringIO(data), backward)
+    return decode_slaw(version, data, 0, backward)[0]
+
+def decode_slaw(version, data, offset=0, backward=False):
+    """
+    Decodes the slaw-encoded data structure starting at offset in data,
+    which may be any object supporting the buffer protocol (bytes, mmap,
+    memoryview).  Returns a tuple of the decoded object and the offset just
+    past the end of the slaw.  version is the slaw version in which the data
+    was encoded, and backward is used internally to fix endianness issues.
+    """
+    if version == 2:
+        return decode_slaw2(data, offset, backward)
+    if version == 1:
+        fh = BytesIO(data)
+        fh.seek(offset)
+        result = parse_slaw1(fh, backward)
+        return (result, fh.tell())
+    raise SlawWrongVersionException('Slaw version %d not supported' % version)
+
+def decode_descrips(version, data, offset=0, backward=False):
+    """
+    Decodes just the descrips of the protein starting at offset in data
+    (see decode_slaw()), which is all that's needed to test it against a
+    search.  Returns a tuple of the descrips (None if the protein has none)
+    and the offset just past the end of the protein.
+    """
+    if version == 2:
+        return decode_descrips2(data, offset, backward)
+    (protein, end) = decode_slaw(version, data, offset, backward)
+    return (protein.descrips(), end)
 
 def degrade_json(obj):
     if type(obj) == list:
@@ -0,0 +1,427 @@
+"""
+Lazy views over version 2 encoded oblists and obmaps.
+
+decode_slaw2() hands these out for large lists and maps.  They keep the
+encoded bytes, build an offset table of their entries (from the slaw
+headers only) the first time they're touched, and decode individual
+entries when they're asked for.  Anything that modifies a view turns it
+into an ordinary oblist / obmap first.
+"""
+from array import array
+import copy
+from loam.obstruct import oblist, obmap
+from plasma.exceptions import *
+
+def own_buffer(buf, start, end):
+    ## don't hang on to mmaps or memoryviews, they may be reused underneath
+    ## us (or be prevented from closing), unless they come from a zero-copy
+    ## read
+    if isinstance(buf, bytes) or plasma.slaw.v2.zero_copy(buf):
+        return (buf, 0)
+    return (bytes(buf[start:end]), start)
+
+class lazy_oblist(oblist):
+    """
+    An oblist decoded from slaw on demand.
+    """
+
+    def __init__(self, buf, start, end, count, first, backward=False):
+        """
+        start and end delimit the encoded list in buf, first is the offset
+        of its first element, and count the number of elements.
+        """
+        (buf, base) = own_buffer(buf, start, end)
+        self.__buf = buf
+        self.__start = start - base
+        self.__end = end - base
+        self.__first = first - base
+        self.__count = count
+        self.__backward = backward
+        self.__offsets = None
+        self.__items = dict()
+        self.__lazy = True
+        list.__init__(self)
+
+    def __table(self):
+        if self.__offsets is None:
+            offsets = array('q')
+            pos = self.__first
+            for i in range(self.__count):
+                offsets.append(pos)
+                pos += plasma.slaw.v2.slaw2_size(self.__buf, pos, self.__backward)
+            if pos > self.__end:
+                raise SlawCorruptSlawException("oblist elements overrun the list")
+            self.__offsets = offsets
+        return self.__offsets
+
+    def __item(self, index):
+        if index < 0:
+            index += self.__count
+        if index < 0 or index >= self.__count:
+            raise IndexError("list index out of range")
+        if index not in self.__items:
+            offset = self.__table()[index]
+            self.__items[index] = plasma.slaw.v2.decode_slaw2(self.__buf, offset, self.__backward)[0]
+        return self.__items[index]
+
+    def __materialize(self):
+        if self.__lazy:
+            values = list(self.__item(i) for i in range(self.__count))
+            self.__lazy = False
+            self.__buf = None
+            self.__offsets = None
+            self.__items = dict()
+            list.extend(self, values)
+
+    def is_lazy(self):
+        """
+        True until the list has been modified.
+        """
+        return self.__lazy
+
+    def __len__(self):
+        if self.__lazy:
+            return self.__count
+        return list.__len__(self)
+
+    def __getitem__(self, index):
+        if self.__lazy:
+            if isinstance(index, slice):
+                return oblist(self.__item(i) for i in range(*index.indices(self.__count)))
+            return self.__item(index)
+        return list.__getitem__(self, index)
+
+    def __iter__(self):
+        if self.__lazy:
+            return (self.__item(i) for i in range(self.__count))
+        return list.__iter__(self)
+
+    def __reversed__(self):
+        if self.__lazy:
+            return (self.__item(i) for i in range(self.__count - 1, -1, -1))
+        return list.__reversed__(self)
+
+    def __contains__(self, value):
+        for x in self:
+            if x == value:
+                return True
+        return False
+
+    def __eq__(self, other):
+        if self.__lazy:
+            if not isinstance(other, list) or len(self) != len(other):
+                return False
+            for a, b in zip(self, other):
+                if not a == b:
+                    return False
+            return True
+        if isinstance(other, lazy_oblist) and other.is_lazy():
+            return other == self
+        return list.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        self.__materialize()
+        return list.__repr__(self)
+
+    def index(self, value, *args):
+        if self.__lazy:
+            (start, stop) = (tuple(args) + (None, None))[:2]
+            for i in range(*slice(start, stop).indices(self.__count)):
+                if self.__item(i) == value:
+                    return i
+            raise ValueError("%s is not in list" % repr(value))
+        return list.index(self, value, *args)
+
+    def count(self, value):
+        return sum(1 for x in self if x == value)
+
+    def __setitem__(self, index, value):
+        self.__materialize()
+        return oblist.__setitem__(self, index, value)
+
+    def __delitem__(self, index):
+        self.__materialize()
+        return list.__delitem__(self, index)
+
+    def __add__(self, other):
+        self.__materialize()
+        return oblist.__add__(self, other)
+
+    def __iadd__(self, other):
+        self.__materialize()
+        return oblist.__iadd__(self, other)
+
+    def __imul__(self, other):
+        self.__materialize()
+        return oblist.__imul__(self, other)
+
+    def __mul__(self, other):
+        self.__materialize()
+        return oblist.__mul__(self, other)
+
+    def __rmul__(self, other):
+        self.__materialize()
+        return oblist.__rmul__(self, other)
+
+    def append(self, val):
+        self.__materialize()
+        return oblist.append(self, val)
+
+    def extend(self, vals):
+        self.__materialize()
+        return oblist.extend(self, vals)
+
+    def insert(self, index, val):
+        self.__materialize()
+        return oblist.insert(self, index, val)
+
+    def pop(self, *args):
+        self.__materialize()
+        return list.pop(self, *args)
+
+    def remove(self, value):
+        self.__materialize()
+        return list.remove(self, value)
+
+    def reverse(self):
+        self.__materialize()
+        return list.reverse(self)
+
+    def sort(self, *args, **kwargs):
+        self.__materialize()
+        return list.sort(self, *args, **kwargs)
+
+    def clear(self):
+        if self.__lazy:
+            self.__lazy = False
+            self.__buf = None
+            self.__offsets = None
+            self.__items = dict()
+        return list.clear(self)
+
+    ## copies (and pickles) are ordinary oblists; list's own versions only
+    ## see the (empty, while lazy) list storage
+    def copy(self):
+        return oblist(self)
+
+    __copy__ = copy
+
+    def __deepcopy__(self, memo):
+        result = oblist()
+        memo[id(self)] = result
+        list.extend(result, (copy.deepcopy(x, memo) for x in self))
+        return result
+
+    def __reduce_ex__(self, protocol):
+        return (oblist, (list(self),))
+
+    def to_slaw_v2(self):
+        if self.__lazy and len(self.__items) == 0:
+            return bytes(self.__buf[self.__start:self.__end])
+        return oblist.to_slaw_v2(self)
+
+    def slaw_v2_size(self):
+        if self.__lazy and len(self.__items) == 0:
+            return self.__end - self.__start
+        return oblist.slaw_v2_size(self)
+
+    def encode_into(self, buf, offset=0):
+        if self.__lazy and len(self.__items) == 0:
+            end = offset + self.__end - self.__start
+            buf[offset:end] = self.__buf[self.__start:self.__end]
+            return end
+        return oblist.encode_into(self, buf, offset)
+
+class lazy_obmap(obmap):
+    """
+    An obmap decoded from slaw on demand.  Keys are decoded (all at once)
+    on first touch, values one at a time as they are looked up.
+    """
+
+    def __init__(self, buf, start, end, count, first, backward=False):
+        """
+        start and end delimit the encoded map in buf, first is the offset
+        of its first entry, and count the number of entries.
+        """
+        (buf, base) = own_buffer(buf, start, end)
+        self.__buf = buf
+        self.__start = start - base
+        self.__end = end - base
+        self.__first = first - base
+        self.__count = count
+        self.__backward = backward
+        self.__keys = None
+        self.__offsets = None
+        self.__values = dict()
+        self.__lazy = True
+        obmap.__init__(self)
+
+    def __table(self):
+        if self.__keys is None:
+            keys = dict()
+            offsets = array('q')
+            pos = self.__first
+            for i in range(self.__count):
+                (slaw_type, header, kpos, backward) = plasma.slaw.v2.decode_header2(self.__buf, pos, self.__backward)
+                if slaw_type != 'obcons':
+                    raise SlawCorruptSlawException("obmap entry is a %s, not an obcons" % slaw_type)
+                (key, vpos) = plasma.slaw.v2.decode_slaw2(self.__buf, kpos, self.__backward)
+                if key in keys:
+                    ## later entries win, but keep the first one's position
+                    offsets[keys[key]] = vpos
+                else:
+                    keys[key] = len(offsets)
+                    offsets.append(vpos)
+                pos += 8 * (header & 0xffffffffffffff)
+            if pos > self.__end:
+                raise SlawCorruptSlawException("obmap entries overrun the map")
+            self.__keys = keys
+            self.__offsets = offsets
+        return self.__keys
+
+    def __value(self, key):
+        if key not in self.__values:
+            index = self.__table()[key]
+            offset = self.__offsets[index]
+            self.__values[key] = plasma.slaw.v2.decode_slaw2(self.__buf, offset, self.__backward)[0]
+        return self.__values[key]
+
+    def __materialize(self):
+        if self.__lazy:
+            items = list((k, self.__value(k)) for k in self.iterkeys())
+            self.__lazy = False
+            self.__buf = None
+            self.__keys = None
+            self.__offsets = None
+            self.__values = dict()
+            for k, v in items:
+                obmap.__setitem__(self, k, v)
+
+    def is_lazy(self):
+        """
+        True until the map has been modified.
+        """
+        return self.__lazy
+
+    def __len__(self):
+        if self.__lazy:
+            return len(self.__table())
+        return dict.__len__(self)
+
+    def __getitem__(self, key):
+        if self.__lazy:
+            return self.__value(key)
+        return dict.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        if self.__lazy:
+            return key in self.__table()
+        return dict.__contains__(self, key)
+
+    def has_key(self, key):
+        return key in self
+
+    def __iter__(self):
+        return self.iterkeys()
+
+    def iterkeys(self, *args):
+        if self.__lazy:
+            keys = self.__table()
+            return iter(sorted(keys.keys(), key=lambda x: keys[x]))
+        return obmap.iterkeys(self, *args)
+
+    def __eq__(self, other):
+        if self.__lazy:
+            if not isinstance(other, dict) or len(self) != len(other):
+                return False
+            for k in self.iterkeys():
+                if k not in other or not self.__value(k) == other[k]:
+                    return False
+            return True
+        if isinstance(other, lazy_obmap) and other.is_lazy():
+            return other == self
+        return dict.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        self.__materialize()
+        return dict.__repr__(self)
+
+    def __setitem__(self, key, value):
+        self.__materialize()
+        return obmap.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        self.__materialize()
+        return obmap.__delitem__(self, key)
+
+    def update(self, other, **more):
+        self.__materialize()
+        return obmap.update(self, other, **more)
+
+    def pop(self, *args):
+        self.__materialize()
+        return dict.pop(self, *args)
+
+    def popitem(self):
+        self.__materialize()
+        return dict.popitem(self)
+
+    def setdefault(self, *args):
+        self.__materialize()
+        return dict.setdefault(self, *args)
+
+    def clear(self):
+        if self.__lazy:
+            self.__lazy = False
+            self.__buf = None
+            self.__keys = None
+            self.__offsets = None
+            self.__values = dict()
+        return dict.clear(self)
+
+    ## as for lazy_oblist, copies are ordinary obmaps
+    def copy(self):
+        return obmap((k, self[k]) for k in self.iterkeys())
+
+    __copy__ = copy
+
+    def __deepcopy__(self, memo):
+        result = obmap()
+        memo[id(self)] = result
+        for k in self.iterkeys():
+            result[copy.deepcopy(k, memo)] = copy.deepcopy(self[k], memo)
+        return result
+
+    def __reduce_ex__(self, protocol):
+        return (obmap, (list((k, self[k]) for k in self.iterkeys()),))
+
+    def to_slaw_v2(self):
+        if self.__lazy and len(self.__values) == 0:
+            return bytes(self.__buf[self.__start:self.__end])
+        return obmap.to_slaw_v2(self)
+
+    def slaw_v2_size(self):
+        if self.__lazy and len(self.__values) == 0:
+            return self.__end - self.__start
+        return obmap.slaw_v2_size(self)
+
+    def encode_into(self, buf, offset=0):
+        if self.__lazy and len(self.__values) == 0:
+            end = offset + self.__end - self.__start
+            buf[offset:end] = self.__buf[self.__start:self.__end]
+            return end
+        return obmap.encode_into(self, buf, offset)
+
+import plasma.slaw.v2
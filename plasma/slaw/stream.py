@@ -0,0 +1,125 @@
+"""
+Incremental framing of a stream of version 2 slawx, as read off a socket.
+"""
+from plasma.exceptions import *
+from plasma.slaw.v2 import decode_slaw2, slaw2_size
+
+class SlawStreamDecoder(object):
+    """
+    Push-style decoder for a byte stream of version 2 slawx (in practice,
+    the proteins of the pool TCP protocol).
+
+    Data goes into a single reusable bytearray, either handed over with
+    feed() or read straight from a socket with recv_into().  Each slaw is
+    framed from the length in its 8 byte header, so nothing is decoded
+    until all of its bytes are in, and a partial slaw is never parsed.
+    """
+
+    def __init__(self, size=65536, backward=False):
+        self.__buf = bytearray(size)
+        self.__start = 0
+        self.__end = 0
+        self.__backward = backward
+
+    def pending(self):
+        """
+        Number of bytes buffered and not yet decoded.
+        """
+        return self.__end - self.__start
+
+    def __size(self):
+        ## total length of the next slaw, or None until its header is in
+        if self.__end - self.__start < 8:
+            return None
+        return slaw2_size(self.__buf, self.__start, self.__backward)
+
+    def ready(self):
+        """
+        True if a complete slaw is buffered, so next() won't return None.
+        """
+        size = self.__size()
+        return size is not None and self.__end - self.__start >= size
+
+    def __reserve(self, n):
+        ## make room for n more bytes after the buffered data
+        if self.__start == self.__end:
+            self.__start = self.__end = 0
+        if len(self.__buf) - self.__end >= n:
+            return
+        if self.__start > 0:
+            used = self.__end - self.__start
+            self.__buf[0:used] = self.__buf[self.__start:self.__end]
+            self.__start = 0
+            self.__end = used
+        short = n - (len(self.__buf) - self.__end)
+        if short > 0:
+            self.__buf.extend(bytearray(max(short, len(self.__buf))))
+
+    def feed(self, data):
+        """
+        Appends data to the stream, and returns a list of the slawx that
+        are now complete (possibly empty).
+        """
+        n = len(data)
+        self.__reserve(n)
+        self.__buf[self.__end:self.__end+n] = data
+        self.__end += n
+        return self.drain()
+
+    def recv_into(self, sock):
+        """
+        Reads whatever sock has available (blocking if it has nothing)
+        directly into the buffer with a single recv_into() call.  When the
+        next slaw's header is already in, room is made for all of it, so a
+        large slaw comes in with as few reads as the socket allows.
+        Returns the number of bytes read, which is 0 at end of stream.
+        """
+        need = 8 - self.pending()
+        size = self.__size()
+        if size is not None:
+            need = size - self.pending()
+        self.__reserve(max(need, 4096))
+        view = memoryview(self.__buf)
+        try:
+            n = sock.recv_into(view[self.__end:])
+        finally:
+            view.release()
+        self.__end += n
+        return n
+
+    def next(self):
+        """
+        Decodes and returns the next complete slaw, or None if the whole of
+        it hasn't arrived yet.
+        """
+        size = self.__size()
+        if size is None or self.__end - self.__start < size:
+            return None
+        (obj, end) = decode_slaw2(self.__buf, self.__start, self.__backward)
+        if end != self.__start + size:
+            raise SlawCorruptSlawException("slaw length does not match its header")
+        self.__start = end
+        return obj
+
+    def drain(self):
+        """
+        Decodes and returns a list of all the complete slawx buffered.
+        """
+        objs = list()
+        x = self.next()
+        while x is not None:
+            objs.append(x)
+            x = self.next()
+        return objs
+
+    def read_slaw(self, sock):
+        """
+        Returns the next slaw from the stream, reading from sock as needed.
+        Raises ObDisconnectedException if the stream ends first.
+        """
+        x = self.next()
+        while x is None:
+            if self.recv_into(sock) == 0:
+                raise ObDisconnectedException("connection closed")
+            x = self.next()
+        return x
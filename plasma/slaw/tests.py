@@ -1,7 +1,12 @@
-import unittest, os
+import unittest, os, struct, copy, pickle
 import plasma.slaw
+import loam.util
+import loam.numtype
 from loam import *
-from plasma.protein import Protein
+from plasma.protein import Protein, LazyProtein, descrips_match
+from plasma.slaw.lazy import lazy_oblist, lazy_obmap
+from plasma.schema import register_schema, get_schema, ProteinRecord
+from plasma.exceptions import SlawCorruptSlawException, SlawCorruptProteinException, ObDisconnectedException
 
 TEST_DATA = './t/data/slaw'
 
@@ -414,6 +419,55 @@ class Slaw2ParseNumericArrayTestCase(unittest.TestCase):
     def testParseM5Float64Array(self):
         pass
 
+@unittest.skipIf(loam.numtype.numpy is None, "numpy not available")
+class Slaw2NumpyArrayTestCase(unittest.TestCase):
+
+    def testDecodeUnt8Array(self):
+        fn = os.path.join(TEST_DATA, 'v2/unt8_array.slaw')
+        x = plasma.slaw.read_slaw_file(fn)
+        self.assertEqual(list(x.as_ndarray()), [250, 150, 50])
+        self.assertEqual(len(x), 3)
+        self.assertEqual(type(x[-1]), unt8)
+        self.assertEqual(x[-1], 50)
+        self.assertEqual(x.to_slaw(2), open(fn, 'rb').read()[8:])
+
+    def testVectorArray(self):
+        numpy = loam.numtype.numpy
+        values = numpy.arange(30, dtype='float32').reshape(-1, 3)
+        x = numeric_array(values, v3float32)
+        self.assertEqual(len(x), 10)
+        (y, end) = plasma.slaw.decode_slaw2(x.to_slaw(2))
+        self.assertEqual(y.as_ndarray().shape, (10, 3))
+        self.assertEqual(y[4].x, 12)
+        self.assertEqual(y[4].z, 14)
+        self.assertTrue((y.as_ndarray() == values).all())
+
+    def testListMutation(self):
+        numpy = loam.numtype.numpy
+        x = numeric_array(numpy.arange(4, dtype='int16'), int16)
+        x.append(7)
+        self.assertEqual(len(x), 5)
+        self.assertEqual(list(x), [0, 1, 2, 3, 7])
+        (y, end) = plasma.slaw.decode_slaw2(x.to_slaw(2))
+        self.assertEqual(y, x)
+
+    def testListCopies(self):
+        fn = os.path.join(TEST_DATA, 'v2/unt8_array.slaw')
+        values = [250, 150, 50]
+        y = plasma.slaw.read_slaw_file(fn).copy()
+        self.assertEqual(type(y), numeric_array)
+        self.assertEqual(list(y), values)
+        self.assertEqual(type(y[0]), unt8)
+        self.assertEqual(list(copy.copy(plasma.slaw.read_slaw_file(fn))), values)
+        self.assertEqual(list(copy.deepcopy(plasma.slaw.read_slaw_file(fn))), values)
+        self.assertEqual(list(pickle.loads(pickle.dumps(plasma.slaw.read_slaw_file(fn)))), values)
+        self.assertEqual(plasma.slaw.read_slaw_file(fn) * 2, values * 2)
+        self.assertEqual(2 * plasma.slaw.read_slaw_file(fn), values * 2)
+        x = plasma.slaw.read_slaw_file(fn)
+        x.clear()
+        self.assertEqual(len(x), 0)
+        self.assertEqual(list(x), [])
+
 class Slaw2ParseStringTestCase(unittest.TestCase):
 
     def testParseWeeString(self):
@@ -484,6 +538,385 @@ class Slaw2ParseStructTestCase(unittest.TestCase):
         self.assertEqual(type(x['third']), oblist)
         self.assertEqual(len(x['third']), 2)
 
+class Slaw2DecodeBufferTestCase(unittest.TestCase):
+
+    FILES = ('obnil', 'obbool_true', 'obbool_false', 'unt8', 'int16', 'int32',
+             'unt64', 'float32', 'float64', 'weestring', 'fullstring', 'cons',
+             'oblist', 'unt8_array')
+
+    def testDecodeMatchesParse(self):
+        for name in self.FILES:
+            fn = os.path.join(TEST_DATA, 'v2/%s.slaw' % name)
+            x = plasma.slaw.read_slaw_file(fn)
+            data = open(fn, 'rb').read()[8:]
+            (y, end) = plasma.slaw.decode_slaw2(data)
+            self.assertEqual(type(y), type(x))
+            if type(x) != obnil:
+                self.assertEqual(y, x)
+            self.assertEqual(end, len(data))
+            self.assertEqual(plasma.slaw.slaw2_size(data), len(data))
+
+    def testDecodeOffset(self):
+        fn = os.path.join(TEST_DATA, 'v2/fullstring.slaw')
+        data = open(fn, 'rb').read()
+        (x, end) = plasma.slaw.decode_slaw2(memoryview(data), 8)
+        self.assertEqual(x, plasma.slaw.read_slaw_file(fn))
+        self.assertEqual(end, len(data))
+        (y, end) = plasma.slaw.decode_slaw(2, data, 8)
+        self.assertEqual(y, x)
+        self.assertEqual(plasma.slaw.parse_slaw_data(2, data[8:]), x)
+
+    def testDecodeWee(self):
+        ## wee numbers and strings come straight out of the header bytes,
+        ## in either byte order
+        backward = struct.Struct(loam.util.get_prefix(True) + 'Q')
+        for x in (int8(-5), unt8(200), int16(-300), unt16(60000), int32(-7),
+                  unt32(4000000000), float32(1.5), obstring('abc'), obstring('')):
+            data = x.to_slaw_v2()
+            (y, end) = plasma.slaw.decode_slaw2(data)
+            self.assertEqual((type(y), y, end), (type(x), x, 8))
+            if not isinstance(x, obstring):
+                swapped = data[::-1]
+                (header,) = backward.unpack(swapped)
+                self.assertEqual(plasma.slaw.v2.decode_obnumber(header, swapped, 8, True), (x, 8))
+
+    def testWeeRoundTrip(self):
+        ## encoders and the decoder agree on where a wee number sits in
+        ## its header, for both byte orders
+        for x in (int8(-5), unt8(200), int16(-300), unt16(60000), int32(-7),
+                  unt32(4000000000), float32(1.5)):
+            desc = loam.numtype.describe(type(x))
+            data = x.to_slaw_v2()
+            buf = bytearray(8)
+            self.assertEqual(desc.encode_v2_into(x, buf), 8)
+            self.assertEqual(bytes(buf), data)
+            ## the value is the header's low bits
+            (header,) = struct.unpack('Q', data)
+            value = desc.structs['<'].pack(*desc.values(x))
+            self.assertEqual(header & ((1 << (8 * desc.bytesize)) - 1), struct.unpack('<Q', value.ljust(8, b'\0'))[0])
+            for backward in (False, True):
+                prefix = loam.util.get_prefix(backward)
+                buf = bytearray(8)
+                struct.pack_into(prefix + 'Q', buf, 0, desc.v2_header)
+                at = loam.numtype.wee_offset(desc.bytesize, prefix == '>' or (prefix == '' and loam.util.AM_I_BIG_ENDIAN))
+                desc.structs[prefix].pack_into(buf, at, *desc.values(x))
+                (header,) = struct.unpack(prefix + 'Q', buf)
+                self.assertEqual(plasma.slaw.v2.decode_obnumber(header, buf, 8, backward), (x, 8))
+
+    def testDecodeTruncated(self):
+        fn = os.path.join(TEST_DATA, 'v2/fullstring.slaw')
+        data = open(fn, 'rb').read()[8:]
+        self.assertRaises(SlawCorruptSlawException, plasma.slaw.decode_slaw2, data[:-8])
+        self.assertRaises(SlawCorruptSlawException, plasma.slaw.decode_slaw2, data[:4])
+
+class Slaw2LazyProteinTestCase(unittest.TestCase):
+
+    def makeProtein(self):
+        return Protein(['foo', 'bar'], { 'n': int64(5), 'words': 'some words here' }, b'rude data here')
+
+    def testLazyDecode(self):
+        data = self.makeProtein().to_slaw(2)
+        (x, end) = plasma.slaw.decode_slaw2(data)
+        self.assertEqual(type(x), LazyProtein)
+        self.assertEqual(end, len(data))
+        self.assertTrue(x.to_slaw(2) is data)
+        self.assertTrue(x.matches('bar'))
+        self.assertEqual(x.ingests()['n'], 5)
+        self.assertEqual(x.ingests()['words'], 'some words here')
+        self.assertEqual(x.rude_data(), b'rude data here')
+        self.assertEqual(x.to_slaw(2), data)
+
+    def testLazyModify(self):
+        data = self.makeProtein().to_slaw(2)
+        (x, end) = plasma.slaw.decode_slaw2(data)
+        x.add_descrips('baz')
+        self.assertFalse(x.is_lazy())
+        self.assertEqual(list(x.descrips()), ['foo', 'bar', 'baz'])
+        self.assertEqual(x.ingests()['n'], 5)
+        (y, end) = plasma.slaw.decode_slaw2(x.to_slaw(2))
+        self.assertEqual(list(y.descrips()), ['foo', 'bar', 'baz'])
+        self.assertEqual(y.rude_data(), b'rude data here')
+
+    def testEncodeInto(self):
+        p = self.makeProtein()
+        data = p.to_slaw(2)
+        self.assertEqual(p.slaw_v2_size(), len(data))
+        buf = bytearray(len(data) + 8)
+        self.assertEqual(p.encode_into(memoryview(buf), 8), len(buf))
+        self.assertEqual(bytes(buf[8:]), data)
+        (x, end) = plasma.slaw.decode_slaw2(data)
+        buf = bytearray(len(data))
+        self.assertEqual(x.encode_into(buf), len(data))
+        self.assertTrue(x.is_lazy())
+        self.assertEqual(bytes(buf), data)
+
+    def testLazyEmpty(self):
+        data = Protein(None, None, b'ab').to_slaw(2)
+        (x, end) = plasma.slaw.decode_slaw2(data)
+        self.assertIsNone(x.descrips())
+        self.assertIsNone(x.ingests())
+        self.assertEqual(x.rude_data(), b'ab')
+
+class Slaw2LazyStructTestCase(unittest.TestCase):
+
+    def makeList(self):
+        return oblist([int32(i) for i in range(40)] + ['some longer string'])
+
+    def makeMap(self):
+        m = obmap(dict(('k%d' % i, float64(i)) for i in range(40)))
+        m['nested'] = obmap({ 'a': int64(1) })
+        return m
+
+    def testLazyList(self):
+        orig = self.makeList()
+        data = orig.to_slaw(2)
+        (x, end) = plasma.slaw.decode_slaw2(data)
+        self.assertEqual(type(x), lazy_oblist)
+        self.assertEqual(end, len(data))
+        self.assertEqual(len(x), 41)
+        self.assertEqual(x[5], 5)
+        self.assertEqual(x[-1], 'some longer string')
+        self.assertEqual(list(x[2:5]), [2, 3, 4])
+        self.assertEqual(x.index(int32(7)), 7)
+        self.assertEqual(x, orig)
+        self.assertTrue(x.is_lazy())
+        self.assertEqual(x.to_slaw(2), data)
+        self.assertRaises(IndexError, lambda: x[41])
+
+    def testLazyMap(self):
+        orig = self.makeMap()
+        data = orig.to_slaw(2)
+        (x, end) = plasma.slaw.decode_slaw2(memoryview(data))
+        self.assertEqual(type(x), lazy_obmap)
+        self.assertEqual(end, len(data))
+        self.assertEqual(len(x), 41)
+        self.assertEqual(x['k7'], 7.0)
+        self.assertEqual(x['nested']['a'], 1)
+        self.assertTrue('k39' in x)
+        self.assertFalse('k40' in x)
+        self.assertIsNone(x.get('k40'))
+        self.assertRaises(KeyError, lambda: x['k40'])
+        self.assertEqual(list(x.keys()), list(orig.keys()))
+        self.assertEqual(x, orig)
+        self.assertTrue(x.is_lazy())
+
+    def testLazyModify(self):
+        (x, end) = plasma.slaw.decode_slaw2(self.makeMap().to_slaw(2))
+        x['extra'] = 'here'
+        self.assertFalse(x.is_lazy())
+        self.assertEqual(list(x.keys())[-1], 'extra')
+        (y, end) = plasma.slaw.decode_slaw2(x.to_slaw(2))
+        self.assertEqual(len(y), 42)
+        self.assertEqual(y['extra'], 'here')
+        self.assertEqual(y['k3'], 3.0)
+        (x, end) = plasma.slaw.decode_slaw2(self.makeList().to_slaw(2))
+        x.append(int32(99))
+        self.assertFalse(x.is_lazy())
+        self.assertEqual(len(x), 42)
+        self.assertEqual(x[-1], 99)
+
+    def testLazyCopies(self):
+        for orig in (self.makeList(), self.makeMap()):
+            data = orig.to_slaw(2)
+            for f in (lambda x: x.copy(), copy.copy, copy.deepcopy):
+                (x, end) = plasma.slaw.decode_slaw2(data)
+                y = f(x)
+                self.assertEqual(type(y), type(orig))
+                self.assertEqual(len(y), 41)
+                self.assertEqual(y, orig)
+                self.assertEqual(y.to_slaw(2), data)
+            (x, end) = plasma.slaw.decode_slaw2(data)
+            x.clear()
+            self.assertEqual(len(x), 0)
+            self.assertEqual(list(x), [])
+            self.assertEqual(len(plasma.slaw.decode_slaw2(x.to_slaw(2))[0]), 0)
+
+    def testLazyListPickle(self):
+        orig = self.makeList()
+        (x, end) = plasma.slaw.decode_slaw2(orig.to_slaw(2))
+        y = pickle.loads(pickle.dumps(x))
+        self.assertEqual(type(y), oblist)
+        self.assertEqual(y, orig)
+
+    def testLazyProteinDeepCopy(self):
+        descrips = list('d%d' % i for i in range(40))
+        (p, end) = plasma.slaw.decode_slaw2(Protein(descrips, self.makeMap()).to_slaw(2))
+        self.assertEqual(type(p.descrips()), lazy_oblist)
+        self.assertEqual(type(p.ingests()), lazy_obmap)
+        q = copy.deepcopy(p)
+        self.assertEqual(len(q.descrips()), 40)
+        self.assertEqual(q.descrips(), descrips)
+        self.assertEqual(len(q.ingests()), 41)
+        self.assertEqual(q.ingests()['k12'], 12.0)
+
+    def testSmallStaysEager(self):
+        (x, end) = plasma.slaw.decode_slaw2(oblist([int32(1), int32(2)]).to_slaw(2))
+        self.assertEqual(type(x), oblist)
+
+    def testLazyIngests(self):
+        p = Protein(['foo'], self.makeMap())
+        data = p.to_slaw(2)
+        (x, end) = plasma.slaw.decode_slaw2(data)
+        self.assertEqual(type(x.ingests()), lazy_obmap)
+        self.assertEqual(x.ingests()['k12'], 12.0)
+        self.assertEqual(x.to_slaw(2), data)
+
+class Slaw2StreamDecoderTestCase(unittest.TestCase):
+
+    def makeData(self):
+        ps = list(Protein(['op', str(i)], { 'n': int64(i), 'pad': 'x' * (i * 3000) }) for i in range(4))
+        return b''.join(p.to_slaw(2) for p in ps)
+
+    def testFeed(self):
+        data = self.makeData()
+        d = plasma.slaw.SlawStreamDecoder(size=64)
+        out = list()
+        for i in range(0, len(data), 13):
+            out.extend(d.feed(data[i:i+13]))
+        self.assertEqual(list(x.ingests()['n'] for x in out), [0, 1, 2, 3])
+        self.assertEqual(d.pending(), 0)
+        self.assertFalse(d.ready())
+
+    def testPartial(self):
+        data = self.makeData()
+        d = plasma.slaw.SlawStreamDecoder()
+        self.assertEqual(d.feed(data[:5]), [])
+        self.assertIsNone(d.next())
+        self.assertEqual(len(d.feed(data[5:-1])), 3)
+        self.assertTrue(d.pending() > 0)
+        self.assertFalse(d.ready())
+        self.assertEqual(len(d.feed(data[-1:])), 1)
+
+    def testSocket(self):
+        import socket
+        data = self.makeData()
+        (a, b) = socket.socketpair()
+        a.sendall(data)
+        a.close()
+        d = plasma.slaw.SlawStreamDecoder(size=256)
+        out = list(d.read_slaw(b) for i in range(4))
+        self.assertEqual(list(x.ingests()['n'] for x in out), [0, 1, 2, 3])
+        self.assertRaises(ObDisconnectedException, d.read_slaw, b)
+        b.close()
+
+class Slaw2SchemaTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.schema = register_schema('test-benchmark', ['benchmark', obstring], [('n', int64), ('vect', v3float32), ('words', oblist)])
+
+    def makeProtein(self, vect=None):
+        if vect is None:
+            vect = v3float32(1, 2, 3)
+        return Protein(oblist(['benchmark', '1234']), obmap({ 'n': int64(7), 'vect': vect, 'words': oblist(['some', 'longer words']) }))
+
+    def testEncode(self):
+        p = self.makeProtein()
+        self.assertEqual(self.schema.encode(p), p.to_slaw(2))
+        self.assertTrue(get_schema('test-benchmark') is self.schema)
+
+    def testDecode(self):
+        data = self.makeProtein().to_slaw(2)
+        r = self.schema.decode(data)
+        self.assertEqual(type(r), ProteinRecord)
+        self.assertEqual(r['n'], 7)
+        self.assertEqual(type(r.vect), v3float32)
+        self.assertEqual(list(r.words), ['some', 'longer words'])
+        self.assertEqual(list(r.descrips()), ['benchmark', '1234'])
+        self.assertEqual(self.schema.encode(r), data)
+        self.assertEqual(r.to_protein().to_slaw(2), data)
+
+    def testCopyRecord(self):
+        r = self.schema.decode(self.makeProtein().to_slaw(2))
+        s = copy.copy(r)
+        self.assertEqual(s['n'], 7)
+        self.assertTrue(s.schema() is self.schema)
+        self.assertEqual(copy.deepcopy(r).words, r.words)
+        self.assertRaises(AttributeError, getattr, r, '_missing')
+        self.assertRaises(AttributeError, getattr, r, 'missing')
+
+    def testFallback(self):
+        p = self.makeProtein(v4float32(1, 2, 3, 4))
+        data = p.to_slaw(2)
+        self.assertEqual(self.schema.encode(p), data)
+        self.assertEqual(type(self.schema.decode(data)), LazyProtein)
+        p = Protein(oblist(['benchmark', '1234']), obmap({ 'n': unt64(7), 'vect': v3float32(1, 2, 3), 'words': oblist() }))
+        self.assertEqual(self.schema.encode(p), p.to_slaw(2))
+
+    def testReorderedKeys(self):
+        ## the same keys in another order don't fit, so the protein keeps
+        ## its own key order
+        p = Protein(oblist(['benchmark', '1234']), obmap([('words', oblist(['some'])), ('n', int64(7)), ('vect', v3float32(1, 2, 3))]))
+        self.assertIsNone(self.schema.values(p))
+        data = p.to_slaw(2)
+        self.assertEqual(self.schema.encode(p), data)
+        self.assertEqual(type(self.schema.decode(data)), LazyProtein)
+
+    def testFixedShape(self):
+        schema = register_schema('test-fixed', ['a', 'b'], [('x', float64), ('y', int32), ('c', unt8c)])
+        p = Protein(oblist(['a', 'b']), obmap({ 'x': float64(1.5), 'y': int32(-3), 'c': unt8c(1, 2) }))
+        data = p.to_slaw(2)
+        self.assertEqual(schema.encode(p), data)
+        r = schema.decode(data)
+        self.assertEqual(r['y'], -3)
+        self.assertEqual(r['c'], unt8c(1, 2))
+
+class Slaw2DescripsTestCase(unittest.TestCase):
+
+    def makeData(self):
+        ps = [Protein(['a', 'b', 'c'], { 'pad': 'x' * 5000 }, b'rude data'),
+              Protein(ingests={ 'n': int64(1) }),
+              Protein(['b', 'd'])]
+        return (ps, b''.join(p.to_slaw(2) for p in ps))
+
+    def testDecodeDescrips(self):
+        (ps, data) = self.makeData()
+        pos = 0
+        found = list()
+        for p in ps:
+            (descrips, pos) = plasma.slaw.decode_descrips(2, data, pos)
+            found.append(descrips)
+        self.assertEqual(pos, len(data))
+        self.assertEqual(found, [['a', 'b', 'c'], None, ['b', 'd']])
+        self.assertTrue(descrips_match(found[0], ['a', 'c']))
+        self.assertFalse(descrips_match(found[2], 'c'))
+        self.assertFalse(descrips_match(found[1], 'c'))
+        self.assertRaises(SlawCorruptProteinException, plasma.slaw.decode_descrips, 2, oblist(['a']).to_slaw(2))
+
+    def testParseDescrips(self):
+        import io
+        (ps, data) = self.makeData()
+        fh = io.BytesIO(data)
+        self.assertEqual(plasma.slaw.parse_descrips(2, fh), ['a', 'b', 'c'])
+        self.assertEqual(fh.tell(), len(ps[0].to_slaw(2)))
+        self.assertIsNone(plasma.slaw.parse_descrips(2, fh))
+        self.assertEqual(plasma.slaw.parse_descrips(2, fh), ['b', 'd'])
+        self.assertEqual(fh.tell(), len(data))
+
+class Slaw2ZeroCopyTestCase(unittest.TestCase):
+
+    def testZeroCopy(self):
+        p = Protein(['a', 'b'], { 'n': int64(2) }, b'rude data')
+        data = bytearray(p.to_slaw(2))
+        view = memoryview(data).toreadonly()
+        (q, end) = plasma.slaw.decode_slaw2(view, 0)
+        self.assertEqual(end, len(data))
+        self.assertIsInstance(q.rude_data(), memoryview)
+        self.assertEqual(bytes(q.rude_data()), b'rude data')
+        self.assertEqual(q.to_slaw(2), p.to_slaw(2))
+        self.assertTrue(q.is_valid())
+        data[-16:-7] = b'RUDE DATA'
+        self.assertEqual(bytes(q.rude_data()), b'RUDE DATA')
+        valid = [True]
+        (q, end) = plasma.slaw.decode_slaw2(view, 0)
+        q.set_valid(lambda: valid[0])
+        valid[0] = False
+        self.assertFalse(q.is_valid())
+
+    def testCopy(self):
+        p = Protein(['a'], None, b'rude data')
+        (q, end) = plasma.slaw.decode_slaw2(memoryview(bytearray(p.to_slaw(2))), 0)
+        self.assertIsInstance(q.rude_data(), bytes)
+
 class Slaw2ParseProteinTestCase(unittest.TestCase):
 
     def testParseProtein(self):
@@ -1,6 +1,6 @@
 #import struct, cStringIO
 import struct
-from io import StringIO
+from io import BytesIO
 from loam.util import get_prefix
 from loam.exceptions import *
 from loam.obsimple import obnil, obbool
@@ -8,6 +8,7 @@ from loam.obnum import *
 from loam.obvect import *
 from loam.obmv import *
 from loam.numarr import numeric_array
+from loam.numtype import V1_TYPES
 from loam.obstr import obstring
 from loam.obstruct import obcons, oblist, obmap
 from plasma.protein import Protein
@@ -92,55 +93,43 @@ def skip_obbool(header, fh, backward=False):
 
 def parse_obnumber(header, fh, backward=False):
     prefix = get_prefix(backward)
-    f = (header >> 26) & 1
-    c = (header >> 25) & 1
-    u = (header >> 24) & 1
-    s = (header >> 22) & 3
-    v = (header >> 19) & 7
     b = (header & 0xff) + 1
     if (header >> 18) & 1:
         if (header >> 17) & 1:
             try:
-                n = struct.unpack('%sQ' % prefix, fh.read(8))
+                (n,) = struct.unpack('%sQ' % prefix, fh.read(8))
             except struct.error:
                 raise SlawCorruptSlawException("unexpected end-of-file")
         else:
             try:
-                n = struct.unpack('%sI' % prefix, fh.read(4))
+                (n,) = struct.unpack('%sI' % prefix, fh.read(4))
             except struct.error:
                 raise SlawCorruptSlawException("unexpected end-of-file")
     else:
         n = (header >> 8) & 0x3ff
-    stypes = [32, 8, 64, 16]
-    vtypes = ['', 'v2', 'v3', 'v4', 'mv2', 'mv3', 'mv4', 'mv5']
-    cls = vtypes[v]
-    if u:
-        cls += 'unt'
-    elif f:
-        cls += 'float'
-    else:
-        cls = 'int'
-    cls += '%d' % stypes[s]
-    if c:
-        cls += 'c'
-    klass = globals()[cls]
+    try:
+        desc = V1_TYPES[(header >> 19) & 0xff]
+    except KeyError:
+        raise SlawCorruptSlawException("header 0x%08x does not represent a valid numeric type" % header)
     if n == 0:
         ## singleton
         data = fh.read(b)
         if b % 4:
             fh.read(4 - (b % 4))
         try:
-            return klass.decode(data, prefix)
+            return desc.decode(data, prefix)
         except struct.error:
             raise SlawCorruptSlawException("unexpected end-of-file")
     else:
         ## array(n-1)
         n -= 1
         data = fh.read(b*n)
+        if len(data) != b*n:
+            raise SlawCorruptSlawException("unexpected end-of-file")
         if (b*n) % 4:
             fh.read(4 - ((b*n) % 4))
         try:
-            return numeric_array(list(klass.decode(data[i:i+b], prefix) for i in range(0, len(data), b)), klass)
+            return numeric_array.from_buffer(data, desc.klass, prefix)
         except struct.error:
             raise SlawCorruptSlawException("unexpected end-of-file")
 
@@ -359,7 +348,7 @@ def parse_protein(header, fh, backward=False):
     #print 'prefix = %s; w=%s;n=%s;d=%s;i=%s;r=%s;q=%s;p=%s;f=%s' % (prefix, w, n, d, i, r, q, p, f)
     pdata = fh.read((q - qr)*4)
     #xfh = cStringIO.StringIO(pdata)
-    xfh = StringIO.StringIO(pdata)
+    xfh = BytesIO(pdata)
     if d:
         descrips = parse_slaw1(xfh, backward)
     else:
@@ -371,7 +360,7 @@ def parse_protein(header, fh, backward=False):
     if r:
         rude_data = xfh.read()
     else:
-        rude_data = ''
+        rude_data = b''
     return Protein(descrips, ingests, rude_data)
 
 def skip_protein(header, fh, backward=False):
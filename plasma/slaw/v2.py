@@ -6,16 +6,19 @@ from loam.obnum import *
 from loam.obvect import *
 from loam.obmv import *
 from loam.numarr import numeric_array
+from loam.numtype import V2_TYPES, wee_offset
 from loam.obstr import obstring
 from loam.obstruct import obcons, oblist, obmap
-from plasma.protein import Protein
+from plasma.protein import Protein, LazyProtein
+from plasma.slaw.lazy import lazy_oblist, lazy_obmap
 from plasma.const import *
 from plasma.exceptions import *
 
 def str2hex(data, prefix=''):
-    if isinstance(data, (int, long)):
+    #if isinstance(data, (int, long)):
+    if isinstance(data, int):
         data = struct.pack('%sQ' % prefix, data)
-    return ' '.join('%02x' % ord(x) for x in data)
+    return ' '.join('%02x' % x for x in bytearray(data))
 
 def parse_header2(fh, backward=False):
     prefix = get_prefix(backward)
@@ -95,28 +98,20 @@ def parse_obbool(header, fh, backward=False):
 def skip_obbool(header, fh, backward=False):
     return fh.tell()
 
+def number_type(header):
+    """
+    Returns the loam.numtype descriptor for the numeric (or numeric array)
+    slaw described by header.
+    """
+    try:
+        return V2_TYPES[(header >> 46) & 0xffff]
+    except KeyError:
+        raise SlawCorruptSlawException("header oct %s does not represent a valid numeric type" % str2hex(header))
+
 def parse_obnumber(header, fh, backward=False):
     prefix = get_prefix(backward)
-    count = header & 0x3fffffffffff
-    config = header >> 46
     b = (header >> 46) & 0xff
-    v = (header >> 54) & 7
-    c = (header >> 57) & 1
-    s = (header >> 58) & 3
-    u = (header >> 60) & 1
-    f = (header >> 61) & 1
-    vtypes = ['', 'v2', 'v3', 'v4', 'mv2', 'mv3', 'mv4', 'mv5']
-    cls = vtypes[v]
-    if u:
-        cls += 'unt'
-    elif f:
-        cls += 'float'
-    else:
-        cls += 'int'
-    cls += '%s' % (2**(s+3))
-    if c:
-        cls += 'c'
-    klass = globals()[cls]
+    desc = number_type(header)
     if b == 3:
         data = struct.pack('%sI' % prefix, header & 0xffffffff)
     elif b == 2:
@@ -132,7 +127,7 @@ def parse_obnumber(header, fh, backward=False):
         data = fh.read(b+1)
         if (b+1) % 8 != 0:
             fh.read(8 - ((b+1) % 8))
-    return klass.decode(data, prefix)
+    return desc.decode(data, prefix)
 
 def skip_obnumber(header, fh, backward=False):
     b = (header >> 46) & 0xff
@@ -146,34 +141,19 @@ def skip_obnumber(header, fh, backward=False):
 def parse_numeric_array(header, fh, backward=False):
     prefix = get_prefix(backward)
     count = header & 0x3fffffffffff
-    config = header >> 46
     b = ((header >> 46) & 0xff) + 1
-    v = (header >> 54) & 7
-    c = (header >> 57) & 1
-    s = (header >> 58) & 3
-    u = (header >> 60) & 1
-    f = (header >> 61) & 1
-    vtypes = ['', 'v2', 'v3', 'v4', 'mv2', 'mv3', 'mv4', 'mv5']
-    kls = vtypes[v]
-    if u:
-        kls += 'unt'
-    elif f:
-        kls += 'float'
-    else:
-        kls += 'int'
-    kls += '%d' % (2**(s+3))
-    if c:
-        kls += 'c'
-    klass = globals()[kls]
+    desc = number_type(header)
     #print 'numarr(%s, b=%d, v=%d, c=%d, s=%d, u=%d, f=%d, B=%d)' % (kls, b, v, c, s, u, f, count)
     data = fh.read(b*count)
     if (b*count) % 8:
         fh.read(8 - ((b*count) % 8))
-    return numeric_array(list(klass.decode(data[i:i+b], prefix) for i in range(0, len(data), b)), klass)
+    if len(data) != b*count:
+        raise SlawCorruptSlawException("unexpected end-of-file")
+    return numeric_array.from_buffer(data, desc.klass, prefix)
 
 def skip_numeric_array(header, fh, backward=False):
     count = header & 0x3fffffffffff
-    b = (header >> 46) & 0xff + 1
+    b = ((header >> 46) & 0xff) + 1
     n = b * count
     if n % 8 != 0:
         n += (8 - (n % 8))
@@ -306,6 +286,29 @@ def skip_protein(header, fh, backward=False):
     fh.seek(n, 1)
     return fh.tell()
 
+def parse_descrips2(fh, backward=False):
+    """
+    Reads the next version 2 slaw, which must be a protein, from the file
+    object fh, but decodes only its descrips (returning None if it has
+    none).  The ingests and rude data are skipped over, leaving fh just
+    past the end of the protein.
+    """
+    start = fh.tell()
+    (slaw_type, header, fh, backward) = parse_header2(fh, backward)
+    if slaw_type != 'protein':
+        raise SlawCorruptProteinException("slaw is a %s, not a protein" % slaw_type)
+    try:
+        (h2,) = struct.unpack('q', fh.read(8))
+    except struct.error:
+        raise SlawCorruptSlawException("unexpected end-of-file")
+    descrips = None
+    if (h2 >> 62) & 1:
+        descrips = parse_slaw2(fh, backward)
+    ## back to just past the header, then skip as usual
+    fh.seek(start + 8)
+    skip_protein(header, fh, backward)
+    return descrips
+
 v2parsers = {
     'protein': parse_protein,
     'obnil': parse_obnil,
@@ -329,3 +332,226 @@ v2skippers = {
     'obnumber': skip_obnumber,
     'numeric_array': skip_numeric_array,
 }
+
+## ------------------------------------------------- ##
+## buffer decoding (bytes / mmap / memoryview input) ##
+## ------------------------------------------------- ##
+
+## lists and maps with at least this many entries are decoded as lazy views
+LAZY_MIN_ENTRIES = 32
+
+QUAD = dict((p, struct.Struct('%sQ' % p)) for p in ('', '<', '>'))
+SQUAD = dict((p, struct.Struct('%sq' % p)) for p in ('', '<', '>'))
+## whether headers read with each prefix are big endian, which puts a wee
+## number's bytes at the end of its header rather than the start
+WEE_BIG = { '': AM_I_BIG_ENDIAN, '<': False, '>': True }
+
+def zero_copy(buf):
+    ## read-only memoryviews come from zero-copy pool reads (see
+    ## MMapPool.set_zero_copy()); what's decoded from them may keep
+    ## referring to them instead of copying out
+    return isinstance(buf, memoryview) and buf.readonly
+
+def decode_header2(buf, pos, backward=False):
+    prefix = get_prefix(backward)
+    try:
+        (header,) = QUAD[prefix].unpack_from(buf, pos)
+    except struct.error:
+        raise SlawCorruptSlawException("unexpected end-of-file")
+    stype = header >> 60
+    if stype == 0:
+        if header & 0x10:
+            ## backward protein
+            backward = backward ^ True
+            (header,) = QUAD[get_prefix(backward)].unpack_from(buf, pos)
+            return ('protein', header, pos + 8, backward)
+        raise SlawCorruptProteinException("header oct %s does not represent a protein" % str2hex(header, prefix))
+    if stype == 1:
+        if header & 0xf0 != 0:
+            raise SlawCorruptProteinException("header oct %s does not represent a protein" % str2hex(header, prefix))
+        return ('protein', header, pos + 8, backward)
+    if stype == 2:
+        if header & 2:
+            return ('obnil', header, pos + 8, backward)
+        return ('obbool', header, pos + 8, backward)
+    if stype == 3 or stype == 7:
+        return ('obstring', header, pos + 8, backward)
+    if stype == 4:
+        return ('oblist', header, pos + 8, backward)
+    if stype == 5:
+        return ('obmap', header, pos + 8, backward)
+    if stype == 6:
+        return ('obcons', header, pos + 8, backward)
+    if stype & 12 == 8:
+        return ('obnumber', header, pos + 8, backward)
+    return ('numeric_array', header, pos + 8, backward)
+
+def decode_slaw2(buf, offset=0, backward=False):
+    """
+    Decode the version 2 slaw starting at offset in buf, which may be
+    anything supporting the buffer protocol (bytes, mmap, memoryview),
+    without copying it through a file object.  Returns a tuple of the
+    decoded object and the offset just past the end of the slaw.
+    """
+    (slaw_type, header, pos, backward) = decode_header2(buf, offset, backward)
+    return v2decoders[slaw_type](header, buf, pos, backward)
+
+def slaw2_size(buf, offset=0, backward=False):
+    """
+    Returns the total length in bytes of the version 2 slaw starting at
+    offset in buf.  Only the 8 byte header is looked at.
+    """
+    (slaw_type, header, pos, backward) = decode_header2(buf, offset, backward)
+    if slaw_type == 'protein':
+        return 8 * (((header >> 4) & 0xffffffffffffff) | (header & 0xf))
+    if slaw_type in ('obnil', 'obbool'):
+        return 8
+    if slaw_type == 'obstring' and (header >> 60) == 3:
+        return 8
+    if slaw_type == 'obnumber':
+        b = (header >> 46) & 0xff
+        if b <= 3:
+            return 8
+        return 8 + 8 * ((b + 8) // 8)
+    if slaw_type == 'numeric_array':
+        n = (((header >> 46) & 0xff) + 1) * (header & 0x3fffffffffff)
+        return 8 + 8 * ((n + 7) // 8)
+    return 8 * (header & 0xffffffffffffff)
+
+def decode_obnil(header, buf, pos, backward=False):
+    return (obnil(), pos)
+
+def decode_obbool(header, buf, pos, backward=False):
+    return (obbool(header & 1), pos)
+
+def decode_obnumber(header, buf, pos, backward=False):
+    b = (header >> 46) & 0xff
+    if b <= 3:
+        ## wee number, lives in the low bytes of the header
+        desc = number_type(header)
+        prefix = get_prefix(backward)
+        at = pos - 8 + wee_offset(desc.bytesize, WEE_BIG[prefix])
+        return (desc.make(desc.structs[prefix].unpack_from(buf, at)), pos)
+    n = b + 1
+    data = buf[pos:pos+n]
+    if len(data) != n:
+        raise SlawCorruptSlawException("unexpected end-of-file")
+    return (number_type(header).decode(data, get_prefix(backward)), pos + 8 * ((n + 7) // 8))
+
+def decode_numeric_array(header, buf, pos, backward=False):
+    prefix = get_prefix(backward)
+    count = header & 0x3fffffffffff
+    b = ((header >> 46) & 0xff) + 1
+    desc = number_type(header)
+    n = b * count
+    data = buf[pos:pos+n]
+    if len(data) != n:
+        raise SlawCorruptSlawException("unexpected end-of-file")
+    return (numeric_array.from_buffer(data, desc.klass, prefix, not zero_copy(buf)), pos + 8 * ((n + 7) // 8))
+
+def decode_obstring(header, buf, pos, backward=False):
+    if (header >> 60) == 3:
+        ## wee string, lives in the header
+        if backward:
+            return (parse_obstring(header, None, backward), pos)
+        n = ((header >> 56) & 7) - 1
+        if AM_I_BIG_ENDIAN:
+            data = buf[pos-n:pos-1]
+        else:
+            data = buf[pos-8:pos-8+n]
+        return (obstring(str(data, 'utf8')), pos)
+    ## full string
+    padding = (header >> 56) & 7
+    octlen = header & 0xffffffffffffff
+    n = (8 * (octlen-1)) - (padding + 1)
+    data = buf[pos:pos+n]
+    if len(data) != n:
+        raise SlawCorruptSlawException("unexpected end-of-file")
+    return (obstring(str(data, 'utf8')), pos + 8 * (octlen-1))
+
+def decode_obcons(header, buf, pos, backward=False):
+    (left, pos) = decode_slaw2(buf, pos, backward)
+    (right, pos) = decode_slaw2(buf, pos, backward)
+    return (obcons((left, right)), pos)
+
+def decode_count(header, buf, pos, backward=False):
+    n = (header >> 56) & 15
+    if n >= 15:
+        try:
+            (n,) = SQUAD[get_prefix(backward)].unpack_from(buf, pos)
+        except struct.error:
+            raise SlawCorruptSlawException("unexpected end-of-file")
+        pos += 8
+    return (n, pos)
+
+def decode_oblist(header, buf, pos, backward=False):
+    start = pos - 8
+    (n, pos) = decode_count(header, buf, pos, backward)
+    if n >= LAZY_MIN_ENTRIES:
+        end = start + 8 * (header & 0xffffffffffffff)
+        if end > len(buf):
+            raise SlawCorruptSlawException("unexpected end-of-file")
+        return (lazy_oblist(buf, start, end, n, pos, backward), end)
+    value = list()
+    for i in range(n):
+        (x, pos) = decode_slaw2(buf, pos, backward)
+        value.append(x)
+    return (oblist(value), pos)
+
+def decode_obmap(header, buf, pos, backward=False):
+    start = pos - 8
+    (n, pos) = decode_count(header, buf, pos, backward)
+    if n >= LAZY_MIN_ENTRIES:
+        end = start + 8 * (header & 0xffffffffffffff)
+        if end > len(buf):
+            raise SlawCorruptSlawException("unexpected end-of-file")
+        return (lazy_obmap(buf, start, end, n, pos, backward), end)
+    value = obmap()
+    for i in range(n):
+        (x, pos) = decode_slaw2(buf, pos, backward)
+        value[x.left] = x.right
+    return (value, pos)
+
+def decode_protein(header, buf, pos, backward=False):
+    ## proteins decoded from a buffer are lazy: copy out just the protein's
+    ## bytes, and leave decoding its parts until they're asked for
+    start = pos - 8
+    end = start + 8 * (((header >> 4) & 0xffffffffffffff) | (header & 0xf))
+    if end > len(buf):
+        raise SlawCorruptSlawException("unexpected end-of-file")
+    if zero_copy(buf):
+        return (LazyProtein(buf[start:end], backward), end)
+    return (LazyProtein(bytes(buf[start:end]), backward), end)
+
+def decode_descrips2(buf, offset=0, backward=False):
+    """
+    Decodes just the descrips of the version 2 protein starting at offset
+    in buf, without looking at its ingests or rude data (or copying the
+    protein out of buf).  Returns a tuple of the descrips (None if the
+    protein has none) and the offset just past the end of the protein.
+    """
+    (slaw_type, header, pos, backward) = decode_header2(buf, offset, backward)
+    if slaw_type != 'protein':
+        raise SlawCorruptProteinException("slaw is a %s, not a protein" % slaw_type)
+    end = offset + 8 * (((header >> 4) & 0xffffffffffffff) | (header & 0xf))
+    if end > len(buf):
+        raise SlawCorruptSlawException("unexpected end-of-file")
+    (h2,) = SQUAD[''].unpack_from(buf, pos)
+    if (h2 >> 62) & 1 == 0:
+        return (None, end)
+    (descrips, pos) = decode_slaw2(buf, pos + 8, backward)
+    if pos > end:
+        raise SlawCorruptSlawException("descrips overrun the protein")
+    return (descrips, end)
+
+v2decoders = {
+    'protein': decode_protein,
+    'obnil': decode_obnil,
+    'obbool': decode_obbool,
+    'obstring': decode_obstring,
+    'oblist': decode_oblist,
+    'obmap': decode_obmap,
+    'obcons': decode_obcons,
+    'obnumber': decode_obnumber,
+    'numeric_array': decode_numeric_array,
+}
@@ -1,6 +1,8 @@
 import unittest, os
 from plasma.slaw.tests import *
 from plasma.hose.tests import *
+from plasma.pool.tests import *
+from plasma.sem_ops.tests import *
 
 def main():
     unittest.main()
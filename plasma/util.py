@@ -1,7 +1,7 @@
 import re
 
 def sizestr_to_bytes(val):
-    if isinstance(val, (str, unicode)):
+    if isinstance(val, str):
         m = re.match('^([0-9]+)([kMGT]?)$', val)
         if m:   
             size = int(m.group(1))
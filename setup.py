@@ -161,7 +161,8 @@ setup(
                         'scripts/pypeek',
                         'scripts/pypogo',
                         'scripts/pypoke',
-                        'scripts/pyplasma-benchmark'],
+                        'scripts/pyplasma-benchmark',
+                        'scripts/pyplasma-lock-benchmark'],
     long_description = read('README'),
     classifiers      = ['Development Status :: 2 - Pre-Alpha',
                         'Environment :: Console',